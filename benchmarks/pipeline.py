@@ -0,0 +1,268 @@
+"""
+Replays avr/apriltags/raw payloads and synthetic camera frames through the
+processing pipeline and reports per-message latency percentiles, throughput
+and allocations.
+
+Run from the repository root:
+
+```bash
+python -m benchmarks.pipeline
+# replay a recorded stream, one payload per line, e.g. from
+# mosquitto_sub -t avr/apriltags/raw > stream.jsonl
+python -m benchmarks.pipeline --payloads stream.jsonl
+# compare against the stored baseline, exits with 1 on a regression
+python -m benchmarks.pipeline --baseline benchmarks/baseline.json
+# update the stored baseline
+python -m benchmarks.pipeline --save-baseline benchmarks/baseline.json
+```
+
+The baseline is only meaningful on the machine it was recorded on.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Iterable, Optional, Sequence
+
+import cv2
+import numpy as np
+import paho.mqtt.client as paho_mqtt
+
+from src.python import config
+from src.python.apriltag_processor import AprilTagModule
+
+# cpu_apriltag_library is written to be run as a script from its directory
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "src", "python")
+)
+from cpu_apriltag_library import AprilTagWrapper  # noqa: E402
+
+CAMERA_PARAMS = (584.3866, 583.3444, 661.2944, 320.7182)
+TAG_SIZE = 0.174
+
+
+def synthetic_payloads(count: int, tags: int, seed: int = 0) -> list[bytes]:
+    """
+    Raw payloads of `tags` detections each, with random positions and
+    headings in front of the camera. Every payload has a tag from TAG_TRUTH
+    so the vehicle position is computed too.
+    """
+    rng = np.random.default_rng(seed)
+    known = list(config.TAG_TRUTH.keys())
+    unknown = [i for i in range(config.MAX_TAG_ID + 1) if i not in config.TAG_TRUTH]
+
+    payloads = []
+    for _ in range(count):
+        apriltags = []
+        tag_ids = [rng.choice(known), *rng.choice(unknown, tags - 1, replace=False)]
+        for tag_id in tag_ids:
+            yaw = rng.uniform(-np.pi, np.pi)
+            c, s = np.cos(yaw), np.sin(yaw)
+            x, y = rng.uniform(-1, 1, size=2)
+            apriltags.append(
+                {
+                    "tag_id": int(tag_id),
+                    "x": float(x),
+                    "y": float(y),
+                    "z": float(rng.uniform(0.5, 4)),
+                    "rotation": [[c, -s, 0.0], [s, c, 0.0], [0.0, 0.0, 1.0]],
+                }
+            )
+        payloads.append(json.dumps({"apriltags": apriltags}).encode())
+    return payloads
+
+
+def load_payloads(path: str) -> list[bytes]:
+    with open(path, "rb") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def synthetic_frames(
+    count: int, tags: int, res: tuple[int, int] = (1280, 720), seed: int = 0
+) -> list[np.ndarray]:
+    """
+    Grayscale frames with `tags` rendered tag36h11 tags of different sizes
+    drifting across a noisy background.
+    """
+    rng = np.random.default_rng(seed)
+    dictionary = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_APRILTAG_36h11)
+    width, height = res
+
+    sizes = rng.integers(40, 160, size=tags)
+    markers = [
+        # 8x8 cells, the outer one being the white border
+        cv2.aruco.generateImageMarker(dictionary, i, int(size) * 10 // 8)
+        for i, size in enumerate(sizes)
+    ]
+    positions = rng.uniform(0, 1, size=(tags, 2)) * [width - 200, height - 200]
+    velocities = rng.uniform(-3, 3, size=(tags, 2))
+    background = rng.normal(128, 8, size=(height, width)).clip(0, 255)
+
+    frames = []
+    for i in range(count):
+        frame = background.astype(np.uint8)
+        for marker, position, velocity in zip(markers, positions, velocities):
+            x, y = (position + velocity * i).clip(0, [width - 200, height - 200])
+            frame[int(y) : int(y) + len(marker), int(x) : int(x) + len(marker)] = marker
+        frames.append(frame)
+    return frames
+
+
+def measure(
+    function: Callable[[Any], Any], inputs: Sequence[Any], warmup: int = 10
+) -> dict[str, float]:
+    """
+    Calls `function` on every input and returns latency percentiles in
+    microseconds, calls per second, and the median peak of newly allocated
+    memory per call in KiB.
+    """
+    for item in inputs[:warmup]:
+        function(item)
+
+    latencies = np.empty(len(inputs))
+    start = time.perf_counter()
+    for i, item in enumerate(inputs):
+        call_start = time.perf_counter()
+        function(item)
+        latencies[i] = time.perf_counter() - call_start
+    total = time.perf_counter() - start
+
+    # tracing slows everything down, so allocations get their own pass
+    allocations = np.empty(len(inputs))
+    tracemalloc.start()
+    for i, item in enumerate(inputs):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        function(item)
+        allocations[i] = tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1e6
+    return {
+        "p50_us": p50,
+        "p90_us": p90,
+        "p99_us": p99,
+        "throughput_per_s": len(inputs) / total,
+        "peak_alloc_kib": float(np.median(allocations)) / 1024,
+    }
+
+
+def message_benchmarks(
+    payloads: Sequence[bytes],
+) -> Iterable[tuple[str, Callable[[Any], Any], Sequence[Any]]]:
+    module = AprilTagModule()
+    # serialize the outgoing messages, but don't publish them
+    module._publish = lambda *args, **kwargs: None  # type: ignore
+
+    def on_message(payload: bytes) -> None:
+        msg = paho_mqtt.MQTTMessage(topic=b"avr/apriltags/raw")
+        msg.payload = payload
+        module.on_message(None, None, msg)  # type: ignore
+
+    def pydantic(payload: bytes) -> None:
+        config.FAST_RAW_DECODER = False
+        config.FAST_ENCODER = False
+        on_message(payload)
+
+    def fast(payload: bytes) -> None:
+        config.FAST_RAW_DECODER = True
+        config.FAST_ENCODER = False
+        on_message(payload)
+
+    def fast_encoder(payload: bytes) -> None:
+        config.FAST_RAW_DECODER = True
+        config.FAST_ENCODER = True
+        on_message(payload)
+
+    yield "on_message[pydantic]", pydantic, payloads
+    yield "on_message[fast]", fast, payloads
+    yield "on_message[fast_encoder]", fast_encoder, payloads
+
+
+def frame_benchmarks(
+    frames: Sequence[np.ndarray],
+) -> Iterable[tuple[str, Callable[[Any], Any], Sequence[Any]]]:
+    variants: dict[str, dict[str, Any]] = {
+        "default": {},
+        "roi": {"roi_tracking": True},
+        "adaptive": {"adaptive_decimate": True, "refine": True},
+    }
+    for name, options in variants.items():
+        wrapper = AprilTagWrapper(CAMERA_PARAMS, TAG_SIZE, **options)
+        yield f"process_image[{name}]", wrapper.process_image, frames
+
+
+def compare(
+    results: dict[str, dict[str, float]],
+    baseline: dict[str, dict[str, float]],
+    tolerance: float,
+) -> list[str]:
+    """
+    Benchmarks whose median latency got worse than the baseline by more than
+    `tolerance` (as a fraction).
+    """
+    return [
+        name
+        for name, result in results.items()
+        if name in baseline
+        and result["p50_us"] > baseline[name]["p50_us"] * (1 + tolerance)
+    ]
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--payloads", help="recorded stream, one payload per line")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--tags", type=int, default=6)
+    parser.add_argument("--frames", type=int, default=60)
+    parser.add_argument("--frame-tags", type=int, default=4)
+    parser.add_argument("--skip-frames", action="store_true")
+    parser.add_argument("--baseline", help="baseline JSON file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--save-baseline", help="write the results to this file")
+    args = parser.parse_args(argv)
+
+    if args.payloads:
+        payloads = load_payloads(args.payloads)
+    else:
+        payloads = synthetic_payloads(args.messages, args.tags)
+
+    benchmarks = list(message_benchmarks(payloads))
+    if not args.skip_frames:
+        frames = synthetic_frames(args.frames, args.frame_tags)
+        benchmarks += list(frame_benchmarks(frames))
+
+    results = {}
+    print(
+        f"{'benchmark':<28} {'p50 (us)':>10} {'p90 (us)':>10} {'p99 (us)':>10}"
+        f" {'per s':>9} {'alloc (KiB)':>12}"
+    )
+    for name, function, inputs in benchmarks:
+        result = results[name] = measure(function, inputs)
+        print(
+            f"{name:<28} {result['p50_us']:>10.1f} {result['p90_us']:>10.1f}"
+            f" {result['p99_us']:>10.1f} {result['throughput_per_s']:>9.1f}"
+            f" {result['peak_alloc_kib']:>12.1f}"
+        )
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=4)
+            f.write("\n")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for name in regressions:
+            print(f"Regression: {name} is more than {args.tolerance:.0%} slower")
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
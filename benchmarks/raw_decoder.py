@@ -0,0 +1,78 @@
+"""
+Compares decoding avr/apriltags/raw payloads through the pydantic payload
+models against `RawTagDecoder`.
+
+Run from the repository root:
+
+```bash
+python -m benchmarks.raw_decoder
+```
+"""
+
+import argparse
+import json
+import timeit
+
+from bell.avr.mqtt.serializer import deserialize_payload
+
+from src.python.apriltag_processor import AprilTagModule
+from src.python.raw_decoder import RawTagDecoder
+
+
+def raw_payload(n: int) -> bytes:
+    return json.dumps(
+        {
+            "apriltags": [
+                {
+                    "tag_id": i,
+                    "x": 0.1 * i,
+                    "y": -0.2 * i,
+                    "z": 1.5,
+                    "rotation": [
+                        [0.98, -0.17, 0.0],
+                        [0.17, 0.98, 0.0],
+                        [0.0, 0.0, 1.0],
+                    ],
+                }
+                for i in range(n)
+            ]
+        }
+    ).encode()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tags", type=int, nargs="+", default=[1, 6, 32])
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    # only used for stack_tags, which doesn't need an MQTT connection
+    module = AprilTagModule()
+    decoder = RawTagDecoder()
+
+    def pydantic_path(payload: bytes) -> tuple:
+        raw = deserialize_payload("avr/apriltags/raw", payload)
+        return module.stack_tags(raw.apriltags)
+
+    def fast_path(payload: bytes) -> tuple:
+        tags = decoder.decode(payload)
+        return tags["tag_id"], tags["xyz"], tags["rotation"]
+
+    print(f"{'tags':>6} {'pydantic (us)':>14} {'fast (us)':>10} {'speedup':>8}")
+    for n in args.tags:
+        payload = raw_payload(n)
+        results = []
+        for path in (pydantic_path, fast_path):
+            best = min(
+                timeit.repeat(lambda: path(payload), number=args.number, repeat=5)
+            )
+            results.append(best / args.number * 1e6)
+
+        print(
+            f"{n:>6} {results[0]:>14.1f} {results[1]:>10.1f}"
+            f" {results[0] / results[1]:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 #include <string.h>  // for basename(3) that doesn't modify its argument
 #include <unistd.h>  // for getopt
 
+#include <cstdlib>
+#include <cstring>
 #include <nlohmann/json.hpp>
 #include <sstream>
 
@@ -33,15 +35,61 @@ json jsonify_tag(nvAprilTagsID_t detection) {
   return j;
 }
 
+// Packed little-endian wire format for the raw detections, published on
+// PACKED_TAG_TOPIC. A header followed by `count` fixed-size tag records.
+// Must be kept in sync with raw_decoder.py.
+#pragma pack(push, 1)
+struct PackedHeader {
+  uint32_t sequence;  // incremented for every captured frame
+  uint32_t count;     // number of tag records that follow
+  double timestamp;   // frame capture time, seconds since the epoch
+};
+
+struct PackedTag {
+  uint32_t tag_id;
+  float translation[3];
+  float orientation[9];  // column-major, as returned by nvAprilTagsDetect
+};
+#pragma pack(pop)
+
+std::string pack_tags(const std::vector<nvAprilTagsID_t> &tags,
+                      uint32_t num_detections, uint32_t sequence,
+                      double timestamp) {
+  const PackedHeader header = {sequence, num_detections, timestamp};
+
+  std::string payload(sizeof(header) + num_detections * sizeof(PackedTag),
+                      '\0');
+  std::memcpy(&payload[0], &header, sizeof(header));
+
+  for (uint32_t i = 0; i < num_detections; i++) {
+    PackedTag tag;
+    tag.tag_id = tags[i].id;
+    std::memcpy(tag.translation, tags[i].translation, sizeof(tag.translation));
+    std::memcpy(tag.orientation, tags[i].orientation, sizeof(tag.orientation));
+    std::memcpy(&payload[sizeof(header) + i * sizeof(PackedTag)], &tag,
+                sizeof(tag));
+  }
+
+  return payload;
+}
+
 int main() {
   // ############################################# SETUP MQTT
   // ####################################################################################
   const std::string SERVER_ADDRESS{"tcp://mqtt:18830"};
   const std::string CLIENT_ID{"nvapriltags"};
   const std::string TAG_TOPIC{"avr/apriltags/raw"};
+  const std::string PACKED_TAG_TOPIC{"avr/apriltags/raw/packed"};
   const std::string FPS_TOPIC{"avr/apriltags/status"};
 
   const int QOS = 0;
+
+  // "json" (default), "packed" or "both"
+  const char *raw_format_env = std::getenv("APRILTAG_RAW_FORMAT");
+  const std::string raw_format{raw_format_env ? raw_format_env : "json"};
+  const bool publish_json = raw_format != "packed";
+  const bool publish_packed = raw_format == "packed" || raw_format == "both";
+
   mqtt::client client(SERVER_ADDRESS, CLIENT_ID);
 
   mqtt::connect_options connOpts;
@@ -83,11 +131,16 @@ int main() {
                     0.174,             // tag edge length
                     6);                // max number of tags
 
+  uint32_t sequence = 0;
+
   // ################################################################### MAIN
   // LOOP
   // ##########################################################################################
   while (capture.isOpened()) {
     auto start = std::chrono::system_clock::now();
+    const double timestamp =
+        std::chrono::duration<double>(start.time_since_epoch()).count();
+    sequence++;
 
     // capture a frame
     bool result = capture.read(frame);
@@ -101,29 +154,42 @@ int main() {
       // send the frame to GPU memory and run the detections
       uint32_t num_detections = process_frame(img_rgba8, impl_);
 
-      std::string payload = "{\"apriltags\":[";
+      std::string payload;
+      if (num_detections > 0 && publish_json) {
+        payload = "{\"apriltags\":[";
 
-      // handle the detections
-      for (int i = 0; i < num_detections; i++) {
-        const nvAprilTagsID_t &detection = impl_->tags[i];
+        // handle the detections
+        for (int i = 0; i < num_detections; i++) {
+          const nvAprilTagsID_t &detection = impl_->tags[i];
 
-        json j = jsonify_tag(detection);
+          json j = jsonify_tag(detection);
 
-        payload.append(j.dump());
-        if (i < num_detections - 1) {
-          payload.append(",");
+          payload.append(j.dump());
+          if (i < num_detections - 1) {
+            payload.append(",");
+          }
         }
+
+        payload.append("]}");
       }
 
-      payload.append("]}");
+      std::string packed;
+      if (num_detections > 0 && publish_packed) {
+        packed = pack_tags(impl_->tags, num_detections, sequence, timestamp);
+      }
 
+      // the framerate covers capturing, detecting and encoding, not publishing
       auto end = std::chrono::system_clock::now();
 
-      if (num_detections > 0) {
+      if (!payload.empty()) {
         const char *const_payload = payload.c_str();
         client.publish(TAG_TOPIC, const_payload, strlen(const_payload));
       }
 
+      if (!packed.empty()) {
+        client.publish(PACKED_TAG_TOPIC, packed.data(), packed.size());
+      }
+
       int fps = int(
           1000 /
           (std::chrono::duration_cast<std::chrono::milliseconds>(end - start)
@@ -1,11 +1,15 @@
+import asyncio
+import json
 import math
 import os
 import subprocess
+import threading
+import time
 import warnings
-from typing import Optional
+from typing import Any, NamedTuple, Optional, Sequence
 
 import numpy as np
-import transforms3d as t3d
+import paho.mqtt.client as paho_mqtt
 from bell.avr.mqtt.module import MQTTModule
 from bell.avr.mqtt.payloads import (
     AVRAprilTagsRaw,
@@ -16,89 +20,389 @@ from bell.avr.mqtt.payloads import (
     AVRAprilTagsVisibleApriltagsAbsolutePosition,
     AVRAprilTagsVisibleApriltagsRelativePosition,
 )
-from nptyping import Float, NDArray, Shape
+from bell.avr.mqtt.serializer import deserialize_payload
+from loguru import logger
+from nptyping import Bool, Float, Int, NDArray
+from pydantic import BaseModel
 
 try:
     import config
+    from cameras import CameraMerger, raw_topic
+    from latest_value import LatestValue
+    from metrics import StageMetrics, serve_prometheus
+    from pose_filter import AlphaBetaFilter
+    from pose_fusion import fuse_median, fuse_weighted, tag_weights
+    from pose_gate import PoseGate
+    from raw_decoder import RawTagDecoder, decode_packed, packed_rotation
+    from rigid_transform import RigidTransform, yaw_rotations
+    from tag_map import TagMap
+    from transform_store import TransformStore
+    from visible_publisher import VisibleThrottle
 except ImportError:
     from . import config
+    from .cameras import CameraMerger, raw_topic
+    from .latest_value import LatestValue
+    from .metrics import StageMetrics, serve_prometheus
+    from .pose_filter import AlphaBetaFilter
+    from .pose_fusion import fuse_median, fuse_weighted, tag_weights
+    from .pose_gate import PoseGate
+    from .raw_decoder import RawTagDecoder, decode_packed, packed_rotation
+    from .rigid_transform import RigidTransform, yaw_rotations
+    from .tag_map import TagMap
+    from .transform_store import TransformStore
+    from .visible_publisher import VisibleThrottle
 
 warnings.simplefilter("ignore", np.RankWarning)
 
 THIS_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# same tolerance transforms3d uses to detect gimbal lock in mat2euler
+_EPS4 = np.finfo(float).eps * 4.0
+
+
+class TagBatch(NamedTuple):
+    """
+    Results of `AprilTagModule.handle_tags`, with one row per detection.
+    """
+
+    tag_id: NDArray[Any, Int]
+    horizontal_distance: NDArray[Any, Float]
+    vertical_distance: NDArray[Any, Float]
+    angle: NDArray[Any, Float]
+    pos_world: NDArray[Any, Float]
+    has_world: NDArray[Any, Bool]
+    pos_rel: NDArray[Any, Float]
+    heading: NDArray[Any, Float]
+
+
+def yaw_from_rotations(R: NDArray[Any, Float]) -> NDArray[Any, Float]:
+    """
+    Vectorized equivalent of `transforms3d.euler.mat2euler(R)[2]` for a stack of
+    rotation matrices.
+    """
+    cy = np.sqrt(R[:, 0, 0] * R[:, 0, 0] + R[:, 1, 0] * R[:, 1, 0])
+    return np.where(cy > _EPS4, np.arctan2(R[:, 1, 0], R[:, 0, 0]), 0.0)
+
 
 class AprilTagModule(MQTTModule):
     def __init__(self):
         super().__init__()
 
-        # dict to hold transformation matrixes
-        self.tm: dict[str, NDArray[Shape["4, 4, 4, 4"], Float]] = {}
         # setup transformation matrixes
         self.setup_transforms()
 
-        self.topic_callbacks = {"avr/apriltags/raw": self.on_apriltag_message}
+        # raw topics of every camera, to the camera id and whether they are
+        # packed. Both formats are handled, only one is subscribed to
+        self.raw_topics: dict[str, tuple[int, bool]] = {}
+        for camera_id in self.H_aeroBody_cams:
+            for packed in (False, True):
+                self.raw_topics[raw_topic(camera_id, packed)] = (camera_id, packed)
+
+        if config.RAW_FORMAT == "json":
+            self.topic_callbacks = {
+                raw_topic(camera_id): self.on_apriltag_message
+                for camera_id in self.H_aeroBody_cams
+            }
+        else:
+            # not a topic the MQTT library knows about, the payload is
+            # intercepted in on_message before it would be deserialized
+            self.topic_callbacks = {
+                raw_topic(camera_id, packed=True): self.on_apriltag_packed_message  # type: ignore
+                for camera_id in self.H_aeroBody_cams
+            }
+
+        self.raw_decoder = RawTagDecoder()
+
+        # per-stage timings of the message handling
+        self.metrics = StageMetrics(config.METRICS_INTERVAL)
+
+        # smoothing of the relative position and heading of every tag (by
+        # H_tag_cam slot) and of the vehicle position and heading, used when
+        # config.POSE_FILTER is set
+        self.tag_filter = AlphaBetaFilter(
+            len(self.H_tag_cam.id_of_slot),
+            4,
+            config.POSE_FILTER_ALPHA,
+            config.POSE_FILTER_BETA,
+            angular=[3],
+        )
+        self.vehicle_filter = AlphaBetaFilter(
+            1, 4, config.POSE_FILTER_ALPHA, config.POSE_FILTER_BETA, angular=[3]
+        )
+        # tag id of the last vehicle position, for predictions
+        self.vehicle_tag_id = 0
+        self.filter_lock = threading.Lock()
+
+        # in the "async" processing mode, the newest raw message of every
+        # camera waiting to be processed, with the time it was received
+        self.camera_pending: dict[int, LatestValue[tuple[str, bytes, float]]] = {
+            camera_id: LatestValue() for camera_id in self.H_aeroBody_cams
+        }
+
+        # latest detections of every camera, merged into one set when there
+        # is more than one
+        self.camera_merger = CameraMerger(config.CAMERA_MERGE_WINDOW)
+
+        self.visible_throttle = VisibleThrottle()
+
+        # consistency check of the tags with truth data against the last
+        # vehicle position, used when config.POSE_GATE is set
+        self.pose_gate = PoseGate(
+            config.POSE_GATE_TOLERANCE,
+            config.POSE_GATE_MAX_SPEED,
+            config.POSE_GATE_MAX_RANGE,
+            config.POSE_GATE_TIMEOUT,
+            config.POSE_GATE_MAX_REJECTIONS,
+        )
+
+    def on_message(
+        self, client: paho_mqtt.Client, userdata: Any, msg: paho_mqtt.MQTTMessage
+    ) -> None:
+        if msg.topic in self.raw_topics:
+            if config.PROCESSING_MODE == "async":
+                # hand over to process_forever, replacing any older frame of
+                # the same camera that it hasn't got to yet
+                camera_id, _ = self.raw_topics[msg.topic]
+                self.camera_pending[camera_id].put(
+                    (msg.topic, msg.payload, time.perf_counter())
+                )
+            else:
+                self.on_raw_message(msg.topic, msg.payload)
+            return
+
+        super().on_message(client, userdata, msg)
+
+    def on_raw_message(self, topic: str, payload: bytes) -> None:
+        camera_id, packed = self.raw_topics[topic]
+        if packed:
+            self.on_apriltag_packed_message(payload, camera_id)
+            return
+
+        with self.metrics.time("decode"):
+            if config.FAST_RAW_DECODER:
+                # decode raw detections straight into arrays, without
+                # building the pydantic payload
+                tags = self.raw_decoder.decode(payload)
+                arrays = (tags["tag_id"], tags["xyz"], tags["rotation"])
+            else:
+                raw = deserialize_payload("avr/apriltags/raw", payload)
+                arrays = self.stack_tags(raw.apriltags)  # type: ignore
+
+        self.process_tags(*arrays, camera_id=camera_id)
+
+    async def process_next(self, camera_id: int = 0) -> None:
+        """
+        Waits for the newest raw message of a camera and processes it.
+        """
+        topic, payload, received = await self.camera_pending[camera_id].get()
+        self.metrics.observe("queue_wait", time.perf_counter() - received)
+
+        try:
+            self.on_raw_message(topic, payload)
+        except Exception:
+            logger.exception(f"Error processing {topic}")
+
+    async def process_forever(self) -> None:
+        """
+        Processing loop of the "async" mode. MQTT runs on its own thread and
+        only ever leaves the latest raw message here, so a slow frame makes
+        the next ones get dropped rather than queue up behind it.
+        """
+        loop = asyncio.get_running_loop()
+        for pending in self.camera_pending.values():
+            pending.attach(loop)
+
+        async def process_camera(camera_id: int) -> None:
+            while True:
+                await self.process_next(camera_id)
+
+        await asyncio.gather(*map(process_camera, self.camera_pending))
 
     def setup_transforms(self) -> None:
-        cam_rpy = config.CAM_ATTITUDE
-
-        # rotation matrix
-        rmat = t3d.euler.euler2mat(
-            cam_rpy[0],
-            cam_rpy[1],
-            cam_rpy[2],
-            axes="rxyz",
-        )
+        cameras = config.CAMERAS
+        if cameras is None:
+            cameras = {0: {"pos": config.CAM_POS, "attitude": config.CAM_ATTITUDE}}
+        if 0 not in cameras:
+            raise ValueError("CAMERAS must include camera 0")
+
+        # by camera id
+        self.H_aeroBody_cams = {
+            camera_id: RigidTransform.from_euler(
+                camera["pos"], camera["attitude"]
+            ).inv()
+            for camera_id, camera in cameras.items()
+        }
+        self.H_aeroBody_cam = self.H_aeroBody_cams[0]
+
+        if config.TAG_MAP_PATH is not None:
+            self.tag_map = TagMap.load(config.TAG_MAP_PATH, config.TAG_MAP_CACHE)
+            logger.info(f"Loaded {len(self.tag_map)} tags from {config.TAG_MAP_PATH}")
+        else:
+            self.tag_map = TagMap.from_truth(config.TAG_TRUTH)
 
-        H_cam_aeroBody = t3d.affines.compose(
-            np.asarray(config.CAM_POS), rmat, np.asarray((1, 1, 1))
+        # last seen H_tag_cam of every tag. Tags with truth data own the first
+        # slots, in tag map order
+        self.H_tag_cam = TransformStore(
+            self.tag_map.tag_ids.tolist(), config.UNKNOWN_TAG_SLOTS, config.MAX_TAG_ID
         )
-        H_aeroBody_cam = np.linalg.inv(H_cam_aeroBody)
 
-        self.tm["H_aeroBody_cam"] = H_aeroBody_cam
+        # precompute the constant ends of the
+        # H_tag_aeroRef @ H_cam_tag @ H_aeroBody_cam chain for every known tag,
+        # indexed by the same slots as H_tag_cam
+        self.H_tag_aeroRef = self.tag_map.transforms()
 
-        for tag, tag_data in config.TAG_TRUTH.items():
-            name = f"tag_{tag}"
-            rmat = t3d.euler.euler2mat(
-                tag_data["rpy"][0], tag_data["rpy"][1], tag_data["rpy"][2], axes="rxyz"
+    def on_apriltag_message(self, payload: AVRAprilTagsRaw) -> None:
+        self.process_tags(*self.stack_tags(payload.apriltags))
+
+    def on_apriltag_packed_message(self, payload: bytes, camera_id: int = 0) -> None:
+        with self.metrics.time("decode"):
+            header, tags = decode_packed(payload)
+            xyz = tags["xyz"].astype(np.float64)
+            rotation = packed_rotation(tags).astype(np.float64)
+
+        # the packed format carries the capture time of the frame
+        if header["timestamp"] > 0:
+            self.metrics.observe("transport", time.time() - header["timestamp"])
+
+        self.process_tags(tags["tag_id"], xyz, rotation, camera_id)
+
+    def process_tags(
+        self,
+        tag_ids: NDArray[Any, Int],
+        xyz: NDArray[Any, Float],
+        rotation: NDArray[Any, Float],
+        camera_id: int = 0,
+    ) -> None:
+        """
+        Computes and publishes the visible tags and vehicle position
+        for one frame of raw detections of a camera. With several cameras,
+        the visible tags cover the latest frame of each, while the vehicle
+        position only comes from this frame, so it is never published again
+        from another camera's old detections.
+        """
+        start = time.perf_counter()
+        batch = self.handle_tags(tag_ids, xyz, rotation, camera_id)
+        if config.POSE_GATE:
+            batch = self.gate_tags(batch)
+
+        apriltag_position = self.vehicle_position(batch, xyz, rotation)
+
+        # detections from this frame, rather than the latest frames of the
+        # other cameras merged in. Only they are new measurements for the
+        # tag filter
+        fresh = np.ones(len(tag_ids), dtype=bool)
+        camera_ids = None
+        if len(self.H_aeroBody_cams) > 1:
+            camera_ids, merged = self.camera_merger.update(
+                camera_id, (*batch, xyz, rotation), time.monotonic()
+            )
+            batch = TagBatch(*merged[:-2])
+            fresh = camera_ids == camera_id
+
+        if config.POSE_GATE and apriltag_position is not None:
+            self.pose_gate.accept(
+                np.array(
+                    [apriltag_position.x, apriltag_position.y, apriltag_position.z]
+                ),
+                time.monotonic(),
             )
-            tag_tf = t3d.affines.compose(
-                np.asarray(tag_data["xyz"]), rmat, np.asarray((1, 1, 1))
+        if config.POSE_FILTER:
+            batch, apriltag_position = self.filter_poses(
+                batch, apriltag_position, fresh
             )
+        transformed = time.perf_counter()
 
-            H_to_from = f"H_{name}_aeroRef"
-            self.tm[H_to_from] = tag_tf
+        publish_visible = self.visible_throttle.allow(
+            batch,
+            time.monotonic(),
+            config.VISIBLE_MAX_RATE,
+            config.VISIBLE_DELTAS_ONLY,
+        )
 
-            H_to_from = f"H_{name}_cam"
-            self.tm[H_to_from] = np.eye(4)
+        visible = self.visible_payload(batch) if publish_visible else None
+        visible_cameras = (
+            self.visible_cameras_payload(visible, camera_ids)
+            if visible is not None and camera_ids is not None
+            else None
+        )
+        serialized = time.perf_counter()
+
+        # the payloads are built fresh for each frame and never changed
+        # afterwards, so the fast encoder skips the deep copy `send_message`
+        # makes of them for `message_cache`
+        send = self.send_uncopied if config.FAST_ENCODER else self.send_message
+        if visible is not None:
+            send("avr/apriltags/visible", visible)
+        if visible_cameras is not None:
+            send("avr/apriltags/visible/cameras", visible_cameras)  # type: ignore
+        if apriltag_position is not None:
+            send("avr/apriltags/vehicle_position", apriltag_position)
+        published = time.perf_counter()
+
+        self.metrics.observe("transform", transformed - start)
+        self.metrics.observe("serialize", serialized - transformed)
+        self.metrics.observe("publish", published - serialized)
+
+        if self.metrics.due():
+            self.send_message(
+                "avr/apriltags/metrics",  # type: ignore
+                self.metrics.summary(),
+            )
 
-    def on_apriltag_message(self, payload: AVRAprilTagsRaw) -> None:
-        tag_list: list[AVRAprilTagsVisibleApriltags] = []
+    def send_uncopied(self, topic: str, payload: Any) -> None:
+        """
+        `send_message`, but keeping `payload` itself in `message_cache`
+        rather than a deep copy of it.
+        """
+        if isinstance(payload, BaseModel):
+            self._publish(topic, payload.model_dump_json())
+        else:
+            self._publish(topic, json.dumps(payload))
+        self.message_cache[topic] = payload  # type: ignore
 
-        min_dist = 1000000
-        closest_tag_index = None
+    def gate_tags(self, batch: TagBatch) -> TagBatch:
+        """
+        Drops the world position of tags that fail the pose gate, so they are
+        still reported as visible but don't count towards the vehicle
+        position.
+        """
+        rows = np.flatnonzero(batch.has_world)
+        if not len(rows):
+            return batch
 
-        for index, tag in enumerate(payload.apriltags):
-            (
-                id_,
-                horizontal_distance,
-                vertical_distance,
-                angle,
-                pos_world,
-                pos_rel,
-                heading,
-            ) = self.handle_tag(tag)
+        map_rows = self.tag_map.rows(batch.tag_id[rows])
+        passed = self.pose_gate.check(
+            self.tag_map.xyz[map_rows], batch.pos_world[rows], time.monotonic()
+        )
+        if passed.all():
+            return batch
+
+        logger.debug(f"Pose gate rejected tags {batch.tag_id[rows[~passed]].tolist()}")
+        has_world = batch.has_world.copy()
+        has_world[rows[~passed]] = False
+        return batch._replace(has_world=has_world)
+
+    def visible_payload(self, batch: TagBatch) -> AVRAprilTagsVisible:
+        # convert to python scalars once, rather than per-field
+        ids = batch.tag_id.tolist()
+        horizontal_distances = batch.horizontal_distance.tolist()
+        vertical_distances = batch.vertical_distance.tolist()
+        angles = batch.angle.tolist()
+        headings = batch.heading.tolist()
+        pos_rels = batch.pos_rel.tolist()
+        pos_worlds = batch.pos_world.tolist()
+        has_worlds = batch.has_world.tolist()
 
-            # weird special case (this shouldn't really happen though?)
-            if id_ is None:
-                continue
+        tag_list: list[AVRAprilTagsVisibleApriltags] = []
 
+        for index in range(len(ids)):
+            pos_rel = pos_rels[index]
             tag = AVRAprilTagsVisibleApriltags(
-                tag_id=id_,
-                horizontal_distance=horizontal_distance,
-                vertical_distance=vertical_distance,
-                angle=angle,
-                hdg=heading,
+                tag_id=ids[index],
+                horizontal_distance=horizontal_distances[index],
+                vertical_distance=vertical_distances[index],
+                angle=angles[index],
+                hdg=headings[index],
                 relative_position=AVRAprilTagsVisibleApriltagsRelativePosition(
                     x=pos_rel[0],
                     y=pos_rel[1],
@@ -108,38 +412,178 @@ class AprilTagModule(MQTTModule):
             )
 
             # add some more info if we had the truth data for the tag
-            if pos_world is not None and pos_world.any():
+            if has_worlds[index]:
+                pos_world = pos_worlds[index]
                 tag.absolute_position = AVRAprilTagsVisibleApriltagsAbsolutePosition(
                     x=pos_world[0],
                     y=pos_world[1],
                     z=pos_world[2],
                 )
-                if horizontal_distance < min_dist:
-                    min_dist = horizontal_distance
-                    closest_tag_index = index
 
             tag_list.append(tag)
 
-        self.send_message(
-            "avr/apriltags/visible", AVRAprilTagsVisible(apriltags=tag_list)
-        )
+        return AVRAprilTagsVisible(apriltags=tag_list)
 
-        if closest_tag_index is not None:
-            closest_tag = tag_list[closest_tag_index]
-            pos_world = closest_tag.absolute_position
+    def visible_cameras_payload(
+        self, visible: AVRAprilTagsVisible, camera_ids: NDArray[Any, Int]
+    ) -> dict[str, Any]:
+        """
+        The visible payload with the id of the camera that saw each tag added
+        to it, which the avr/apriltags/visible schema has no room for.
+        """
+        # through JSON, so non-finite values become null as in the model's
+        payload = json.loads(visible.model_dump_json())
+        for tag, camera_id in zip(payload["apriltags"], camera_ids.tolist()):
+            tag["camera_id"] = camera_id
+        return payload
+
+    def filter_poses(
+        self,
+        batch: TagBatch,
+        position: Optional[AVRAprilTagsVehiclePosition],
+        fresh: Optional[NDArray[Any, Bool]] = None,
+    ) -> tuple[TagBatch, Optional[AVRAprilTagsVehiclePosition]]:
+        """
+        Smooths the relative position and heading of every tag in the batch,
+        and the vehicle position, with their alpha-beta filters.
 
-            # this shouldn't happen
-            assert pos_world is not None
+        Only the `fresh` detections (all of them by default) update the tag
+        filter. The others were already used when their frame came in, and
+        get the filter's current estimate instead.
+        """
+        if fresh is None:
+            fresh = np.ones(len(batch.tag_id), dtype=bool)
+
+        now = time.monotonic()
+        with self.filter_lock:
+            slots = self.H_tag_cam.slots(batch.tag_id)
+            stored = slots >= 0
+            update = stored & fresh
+            cached = stored & ~fresh
+            if stored.any():
+                pos_rel = batch.pos_rel.copy()
+                heading = batch.heading.copy()
+                filtered = np.empty((len(slots), 4))
+                if update.any():
+                    filtered[update] = self.tag_filter.update(
+                        slots[update],
+                        np.column_stack((pos_rel[update], heading[update])),
+                        now,
+                        keys=batch.tag_id[update],
+                    )
+                if cached.any():
+                    filtered[cached] = self.tag_filter.predict(slots[cached], now)
+                pos_rel[stored] = filtered[stored, :3]
+                heading[stored] = filtered[stored, 3]
+                # keep tags the pose gate rejected without a world position
+                gated = batch.has_world
+                batch = self.tag_batch(batch.tag_id, pos_rel, heading)
+                batch = batch._replace(has_world=batch.has_world & gated)
+
+            if position is not None:
+                x, y, z, hdg = self.vehicle_filter.update(
+                    np.zeros(1, dtype=np.int64),
+                    np.array([[position.x, position.y, position.z, position.hdg]]),
+                    now,
+                )[0].tolist()
+                self.vehicle_tag_id = position.tag_id
+                position = AVRAprilTagsVehiclePosition(
+                    tag_id=position.tag_id, x=x, y=y, z=z, hdg=hdg
+                )
 
-            apriltag_position = AVRAprilTagsVehiclePosition(
-                tag_id=closest_tag.tag_id,
-                x=pos_world.x,
-                y=pos_world.y,
-                z=pos_world.z,
-                hdg=closest_tag.hdg,
-            )
+        return batch, position
 
-            self.send_message("avr/apriltags/vehicle_position", apriltag_position)
+    def predicted_position(self) -> Optional[AVRAprilTagsVehiclePosition]:
+        """
+        Vehicle position extrapolated to now by the vehicle filter, or None
+        if it was updated less than a prediction period ago (the measurement
+        is still fresh) or more than config.POSE_PREDICTION_TIMEOUT ago.
+        """
+        now = time.monotonic()
+        row = np.zeros(1, dtype=np.int64)
+        with self.filter_lock:
+            age = float(self.vehicle_filter.age(row, now)[0])
+            if (
+                not 1 / config.POSE_PREDICTION_RATE
+                <= age
+                <= (config.POSE_PREDICTION_TIMEOUT)
+            ):
+                return None
+            x, y, z, hdg = self.vehicle_filter.predict(row, now)[0].tolist()
+
+        return AVRAprilTagsVehiclePosition(
+            tag_id=self.vehicle_tag_id, x=x, y=y, z=z, hdg=hdg
+        )
+
+    def prediction_loop(self) -> None:
+        """
+        Publishes predicted vehicle positions between detections, so the
+        position stream keeps config.POSE_PREDICTION_RATE even when the
+        camera is slower or a frame has no tags.
+        """
+        while True:
+            time.sleep(1 / config.POSE_PREDICTION_RATE)
+            position = self.predicted_position()
+            if position is not None:
+                self.send_message("avr/apriltags/vehicle_position", position)
+
+    def vehicle_position(
+        self,
+        batch: TagBatch,
+        xyz: NDArray[Any, Float],
+        rotation: NDArray[Any, Float],
+    ) -> Optional[AVRAprilTagsVehiclePosition]:
+        """
+        Estimates the vehicle position from every tag with truth data in the
+        frame, according to `config.VEHICLE_POSITION_MODE`.
+        """
+        if not batch.has_world.any():
+            return None
+
+        mode = config.VEHICLE_POSITION_MODE
+
+        if mode == "closest":
+            # argmin returns the first minimum, same as a strict less-than scan
+            distances = np.where(batch.has_world, batch.horizontal_distance, np.inf)
+            index = int(np.argmin(distances))
+            pos = batch.pos_world[index]
+            heading = float(batch.heading[index])
+
+        elif mode in ("weighted", "median"):
+            rows = np.flatnonzero(batch.has_world)
+            weights = tag_weights(xyz[rows], rotation[rows])
+            fuse = fuse_weighted if mode == "weighted" else fuse_median
+            pos, heading = fuse(batch.pos_world[rows], batch.heading[rows], weights)
+            # report the tag that contributed the most
+            index = int(rows[np.argmax(weights)])
+
+        else:
+            raise ValueError(f"Unknown vehicle position mode: {mode}")
+
+        return AVRAprilTagsVehiclePosition(
+            tag_id=int(batch.tag_id[index]),
+            x=float(pos[0]),
+            y=float(pos[1]),
+            z=float(pos[2]),
+            hdg=heading,
+        )
+
+    def stack_tags(
+        self, tags: Sequence[AVRAprilTagsRawApriltags]
+    ) -> tuple[
+        NDArray[Any, Int],
+        NDArray[Any, Float],
+        NDArray[Any, Float],
+    ]:
+        """
+        Stacks raw tag detections into arrays of ids, translations (meters)
+        and rotation matrices, for `handle_tags`.
+        """
+        n = len(tags)
+        tag_ids = np.fromiter((tag.tag_id for tag in tags), dtype=np.int64, count=n)
+        xyz = np.array([(tag.x, tag.y, tag.z) for tag in tags], dtype=np.float64)
+        rotation = np.array([tag.rotation for tag in tags], dtype=np.float64)
+        return tag_ids, xyz.reshape(n, 3), rotation.reshape(n, 3, 3)
 
     def angle_to_tag(self, pos: tuple[float, float, float]) -> float:
         deg = math.degrees(
@@ -157,11 +601,13 @@ class AprilTagModule(MQTTModule):
         """
         returns the angle with respect to "north" in the "world frame"
         """
-        if tag_id not in config.TAG_TRUTH.keys():
+        row = int(self.tag_map.rows(np.asarray([tag_id]))[0])
+        if row < 0:
             return
 
-        del_x = config.TAG_TRUTH[tag_id]["xyz"][0] - pos[0]
-        del_y = config.TAG_TRUTH[tag_id]["xyz"][1] - pos[1]
+        tag_x, tag_y, _ = self.tag_map.xyz[row].tolist()
+        del_x = tag_x - pos[0]
+        del_y = tag_y - pos[1]
         deg = math.degrees(
             math.atan2(del_y, del_x)
         )  # TODO - i think plus pi/2 bc this is respect to +x
@@ -171,110 +617,91 @@ class AprilTagModule(MQTTModule):
 
         return deg
 
-    def H_inv(self, H: NDArray[Shape["4, 4"], Float]) -> NDArray[Shape["4, 4"], Float]:
-        """
-        A method to efficiently compute the inverse of a homogeneous transformation
-        matrix. Reference: https://web.archive.org/web/20190707102920/http://vr.cs.uiuc.edu/node81.html
-        """
-
-        T, R, Z, S = t3d.affines.decompose44(H)
-
-        R_t = np.transpose(R)
-        H_rot = t3d.affines.compose(
-            np.asarray((0, 0, 0)),
-            R_t,
-            np.asarray((1, 1, 1)),
-        )
-        H_tran = t3d.affines.compose(
-            np.asarray((-1 * T[0], -1 * T[1], -1 * T[2])),
-            np.eye(3),
-            np.asarray((1, 1, 1)),
-        )
-
-        return H_rot.dot(H_tran)
-
-    def handle_tag(
-        self, tag: AVRAprilTagsRawApriltags
-    ) -> tuple[
-        int,
-        float,
-        float,
-        float,
-        Optional[np.ndarray],
-        tuple[float, float, float],
-        float,
-    ]:
+    def handle_tags(
+        self,
+        tag_ids: NDArray[Any, Int],
+        xyz: NDArray[Any, Float],
+        rotation: NDArray[Any, Float],
+        camera_id: int = 0,
+    ) -> TagBatch:
         """
-        Calculates the distance, position, and heading of the drone in NED frame
-        based on the tag detections.
+        Calculates the distance, position, and heading of the drone in NED
+        frame for every detection in a frame of a camera at once.
         """
+        # only the yaw of the detection is used. Its
+        # cosine and sine come straight from the rotation matrix rather than
+        # through atan2/cos/sin
+        cy = np.hypot(rotation[:, 0, 0], rotation[:, 1, 0])
+        valid = cy > _EPS4
+        cy = np.where(valid, cy, 1.0)
+        cos_yaw = np.where(valid, rotation[:, 0, 0] / cy, 1.0)
+        sin_yaw = np.where(valid, rotation[:, 1, 0] / cy, 0.0)
 
-        tag_id = tag.tag_id
+        H_tag_cam = RigidTransform(yaw_rotations(cos_yaw, sin_yaw), xyz * 100)
 
-        tag_rot = np.asarray(tag.rotation)
-        rpy = t3d.euler.mat2euler(tag_rot)
-        R = t3d.euler.euler2mat(0, 0, rpy[2], axes="rxyz")
-        H_tag_cam = t3d.affines.compose(
-            np.asarray((tag.x * 100, tag.y * 100, tag.z * 100)),
-            R,
-            np.asarray((1, 1, 1)),
-        )
-        T, R, Z, S = t3d.affines.decompose44(H_tag_cam)
-
-        name = f"tag_{tag_id}"
-        H_to_from = f"H_{name}_cam"
-        self.tm[H_to_from] = H_tag_cam
-
-        # H_cam_tag = np.linalg.inv(H_tag_cam)
-        H_cam_tag = self.H_inv(H_tag_cam)
+        self.H_tag_cam.update(tag_ids, H_tag_cam)
 
-        H_aerobody_tag = H_cam_tag.dot(self.tm["H_aeroBody_cam"])
+        H_aerobody_tag = H_tag_cam.inv() @ self.H_aeroBody_cams[camera_id]
 
-        T2, R2, Z2, S2 = t3d.affines.decompose44(H_aerobody_tag)
-        rpy = t3d.euler.mat2euler(R2)
-        pos_rel = T2
+        heading = yaw_from_rotations(H_aerobody_tag.R)
+        heading = np.rad2deg(np.where(heading < 0, heading + 2 * math.pi, heading))
 
-        horizontal_distance: float = np.linalg.norm((pos_rel[0], pos_rel[1]))  # type: ignore
-        vertical_distance = abs(pos_rel[2])
+        return self.tag_batch(tag_ids, H_aerobody_tag.t, heading)
 
-        heading = rpy[2]
-        if heading < 0:
-            heading += 2 * math.pi
+    def tag_batch(
+        self,
+        tag_ids: NDArray[Any, Int],
+        pos_rel: NDArray[Any, Float],
+        heading: NDArray[Any, Float],
+    ) -> TagBatch:
+        """
+        Derives the distances, angle and world position of every detection
+        from its position relative to the tag.
+        """
+        horizontal_distance = np.hypot(pos_rel[:, 0], pos_rel[:, 1])
+        vertical_distance = np.abs(pos_rel[:, 2])
 
-        heading: float = np.rad2deg(heading)
-        angle = self.angle_to_tag(tuple(pos_rel))  # type: ignore
+        angle = np.degrees(np.arctan2(pos_rel[:, 1], pos_rel[:, 0]))
+        angle = np.where(angle < 0.0, angle + 360.0, angle)
 
         # if we have a location definition for the visible tag
-        if tag_id in config.TAG_TRUTH.keys():
-            H_cam_aeroRef = self.tm[f"H_{name}_aeroRef"].dot(H_cam_tag)
-            H_aeroBody_aeroRef = H_cam_aeroRef.dot(self.tm["H_aeroBody_cam"])
-
-            pos_world, R, Z, S = t3d.affines.decompose44(H_aeroBody_aeroRef)
-
-            return (
-                tag_id,
-                horizontal_distance,
-                vertical_distance,
-                angle,
-                pos_world,
-                tuple(pos_rel),  # type: ignore
-                heading,
-            )
-        else:
-            return (
-                tag_id,
-                horizontal_distance,
-                vertical_distance,
-                angle,
-                None,
-                tuple(pos_rel),  # type: ignore
-                heading,
-            )
+        slots = self.H_tag_cam.slots(tag_ids)
+        has_truth = self.H_tag_cam.is_known(slots)
+
+        pos_world = np.zeros_like(pos_rel)
+        if has_truth.any():
+            H_tag_aeroRef = self.H_tag_aeroRef[slots[has_truth]]
+            pos_world[has_truth] = H_tag_aeroRef.apply(pos_rel[has_truth])
+
+        return TagBatch(
+            tag_id=tag_ids,
+            horizontal_distance=horizontal_distance,
+            vertical_distance=vertical_distance,
+            angle=angle,
+            pos_world=pos_world,
+            # a world position of exactly zero is treated as missing
+            has_world=has_truth & pos_world.any(axis=1),
+            pos_rel=pos_rel,
+            heading=heading,
+        )
 
     def run(self) -> None:
         avrapriltags = os.path.join(THIS_DIR, "..", "c", "build", "avrapriltags")
-        subprocess.Popen(avrapriltags)
-        super().run()
+        subprocess.Popen(
+            avrapriltags, env={**os.environ, "APRILTAG_RAW_FORMAT": config.RAW_FORMAT}
+        )
+        if config.METRICS_PORT is not None:
+            serve_prometheus(self.metrics, config.METRICS_PORT, "avr_apriltags")
+        if config.POSE_FILTER and config.POSE_PREDICTION_RATE > 0:
+            threading.Thread(target=self.prediction_loop, daemon=True).start()
+
+        if config.PROCESSING_MODE == "async":
+            # the MQTT network loop runs in the background, so publishes only
+            # queue messages for it rather than writing to the socket
+            self.run_non_blocking()
+            asyncio.run(self.process_forever())
+        else:
+            super().run()
 
 
 if __name__ == "__main__":
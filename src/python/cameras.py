@@ -0,0 +1,57 @@
+from typing import Any, Sequence
+
+import numpy as np
+from nptyping import Int, NDArray
+
+
+def raw_topic(camera_id: int, packed: bool = False) -> str:
+    """
+    Topic the raw detections of a camera are published on. Camera 0 uses the
+    topics of a single camera setup, the others add their id to them.
+    """
+    topic = "avr/apriltags/raw/packed" if packed else "avr/apriltags/raw"
+    return topic if camera_id == 0 else f"{topic}/{camera_id}"
+
+
+class CameraMerger:
+    """
+    Keeps the latest detections of every camera, so each new frame can be
+    merged with the most recent frames of the other cameras into one set of
+    detections.
+
+    Detections are given as a sequence of arrays with one row per detection,
+    all of the same length. Frames older than `window` seconds are left out
+    of the merge, so a camera that stopped seeing tags (or stopped
+    publishing) doesn't keep contributing its last ones.
+    """
+
+    def __init__(self, window: float):
+        self.window = window
+        self._frames: dict[int, tuple[float, list[NDArray[Any, Any]]]] = {}
+
+    def update(
+        self, camera_id: int, arrays: Sequence[NDArray[Any, Any]], now: float
+    ) -> tuple[NDArray[Any, Int], list[NDArray[Any, Any]]]:
+        """
+        Stores a frame of a camera and returns the camera id of every merged
+        detection along with the merged arrays, in camera id order.
+        """
+        # the arrays may be buffers reused by the decoder
+        self._frames[camera_id] = (now, [np.array(array) for array in arrays])
+
+        fresh = [
+            (frame_camera, frame)
+            for frame_camera, (time, frame) in sorted(self._frames.items())
+            if now - time <= self.window
+        ]
+        camera_ids = np.concatenate(
+            [
+                np.full(len(frame[0]), frame_camera, dtype=np.int64)
+                for frame_camera, frame in fresh
+            ]
+        )
+        merged = [
+            np.concatenate([frame[index] for _, frame in fresh])
+            for index in range(len(arrays))
+        ]
+        return camera_ids, merged
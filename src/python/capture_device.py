@@ -5,15 +5,35 @@ import cv2.typing
 from bell.avr.utils.decorators import run_forever
 from loguru import logger
 
+try:
+    from frame_recording import FrameReplay
+except ImportError:
+    from .frame_recording import FrameReplay
+
 
 class CaptureDevice:
     def __init__(
         self,
-        protocol: Literal["v4l2", "argus"],
+        protocol: Literal["v4l2", "argus", "file"],
         video_device: str,
         res: tuple[int, int],
         framerate: Optional[int] = None,
+        realtime: bool = True,
+        gray: bool = False,
     ):  # sourcery skip: introduce-default-else
+        self.res = res
+        # with gray, the pipeline hands over single channel frames, which
+        # read_gray reads into the same buffer every time
+        self.gray = gray and protocol != "file"
+        self._buffer: Optional[cv2.typing.MatLike] = None
+
+        if protocol == "file":
+            # video_device is the path of a recording, played back at its
+            # recorded speed (or framerate), or as fast as possible if not
+            # realtime
+            self.cv = FrameReplay(video_device, realtime, framerate)
+            return
+
         video_format = "BGR"
         if protocol == "v4l2":
             video_format = "BGRx"
@@ -28,7 +48,23 @@ class CaptureDevice:
                 f"videorate ! video/x-raw,format={video_format},framerate={framerate}/1"
             )
 
-        if protocol == "v4l2":
+        if gray:
+            # nvvidconv converts and scales to GRAY8 (the Y plane of the
+            # decoded NV12) on the hardware, so there is no videoconvert or
+            # color conversion on the CPU
+            gray_string = (
+                f"nvvidconv ! video/x-raw,format=GRAY8,width={res[0]},height={res[1]}"
+            )
+            if framerate is not None:
+                gray_string += f" ! videorate ! video/x-raw,framerate={framerate}/1"
+
+        if protocol == "v4l2" and gray:
+            connection_string = f"v4l2src device={video_device} io-mode=2 ! image/jpeg,width=1280,height=720,framerate=60/1 ! jpegparse ! nvv4l2decoder mjpeg=1 ! {gray_string} ! appsink"
+
+        elif protocol == "argus" and gray:
+            connection_string = f"nvarguscamerasrc ! video/x-raw(memory:NVMM), width=1280, height=720,format=NV12, framerate=60/1 ! {gray_string} ! appsink"
+
+        elif protocol == "v4l2":
             # this is the inefficient way of capturing, using the software decoder running on CPU
             connection_string = f"v4l2src device={video_device} io-mode=2 ! image/jpeg,width=1280,height=720,framerate=60/1 ! jpegparse ! nvv4l2decoder mjpeg=1 ! nvvidconv ! {frame_string} ! videoconvert ! video/x-raw,width={res[0]},height={res[1]},format=BGRx ! appsink"
 
@@ -44,13 +80,33 @@ class CaptureDevice:
         self.cv = cv2.VideoCapture(connection_string)
 
     def read(self) -> tuple[bool, Optional[cv2.typing.MatLike]]:
-        return self.cv.read()
+        ret, img = self.cv.read()
+        if ret and img.ndim == 2:  # type: ignore
+            # grayscale recording
+            img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)  # type: ignore
+        return ret, self.resize(img) if ret else img
 
     def read_gray(self) -> tuple[bool, Optional[cv2.typing.MatLike]]:
+        """
+        Reads a grayscale frame. With gray, the frame is a buffer reused
+        between calls, so it is only valid until the next one.
+        """
+        if self.gray:
+            ret, img = self.cv.read(self._buffer)  # type: ignore
+            if ret:
+                self._buffer = img
+            return ret, img
+
         ret, img = self.cv.read()
-        if ret:
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        return ret, img
+        if ret and img.ndim == 3:  # type: ignore
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)  # type: ignore
+        return ret, self.resize(img) if ret else img
+
+    def resize(self, img: cv2.typing.MatLike) -> cv2.typing.MatLike:
+        # the GStreamer pipelines already scale to res, recordings may not
+        if img.shape[1] != self.res[0] or img.shape[0] != self.res[1]:
+            img = cv2.resize(img, self.res)
+        return img
 
     @run_forever(frequency=100)
     def run(self) -> None:
@@ -1,4 +1,6 @@
 import math
+import os
+from typing import Any, Literal, Optional, Union
 
 
 CAM_POS = (0, 0, 8.5)
@@ -12,7 +14,330 @@ Roll, pitch, yaw in radians
 cam x = body -y; cam y = body x, cam z = body z
 """
 
+CAMERAS: Optional[dict[int, dict[str, tuple[float, float, float]]]] = None
+"""
+Position ("pos", like CAM_POS) and attitude ("attitude", like CAM_ATTITUDE)
+of every camera by camera id, for vehicles with more than one. Camera 0
+publishes raw detections on avr/apriltags/raw(/packed), the others on
+avr/apriltags/raw(/packed)/<camera id>. Their detections are merged into one
+avr/apriltags/visible message, while the vehicle position of each frame only
+comes from the camera it is from. The same visible tags
+are also published on avr/apriltags/visible/cameras, each with the
+"camera_id" that saw it. None is a single camera 0 at CAM_POS and
+CAM_ATTITUDE.
+"""
+
+CAMERA_MERGE_WINDOW = 0.1
+"""
+Seconds a camera's detections are merged with newer frames of the others.
+"""
+
 TAG_TRUTH = {0: {"rpy": (0, 0, 0), "xyz": (0, 0, 0)}}
 """
 Truth data about where tags are positioned in the world.
 """
+
+TAG_MAP_PATH: Optional[str] = os.environ.get("APRILTAG_MAP")
+"""
+If set, truth data is loaded from this file instead of TAG_TRUTH, so maps can
+be swapped between runs. Either JSON in the same format as TAG_TRUTH (with
+the tag ids as strings) or CSV with the columns tag_id, x, y, z, roll, pitch,
+yaw.
+"""
+
+TAG_MAP_CACHE: Optional[str] = os.path.expanduser("~/.cache/avr-apriltag")
+"""
+Directory where parsed tag maps are cached and memory mapped from on the next
+start with the same map. None to always parse them.
+"""
+
+MAX_TAG_ID = 586
+"""
+Largest tag id the detector can report (the tag36h11 family has 587 codes).
+"""
+
+UNKNOWN_TAG_SLOTS = 32
+"""
+Number of tags without truth data whose last transform is remembered.
+"""
+
+VEHICLE_POSITION_MODE: Literal["closest", "weighted", "median"] = "closest"
+"""
+How avr/apriltags/vehicle_position is computed from the visible tags
+with truth data. "closest" uses the tag with the smallest horizontal distance,
+"weighted" a weighted least-squares fit over all of them and "median" a
+weighted median. Weights favour near tags seen head-on.
+"""
+
+POSE_GATE = False
+"""
+Whether to ignore tags with truth data for the vehicle position when the
+position they imply is inconsistent with the last one, for example a false
+decode of another tag's id. They are still published as visible, without an
+absolute position.
+"""
+
+POSE_GATE_TOLERANCE = 50.0
+"""
+Centimeters a tag's implied vehicle position may be off from the last one,
+on top of POSE_GATE_MAX_SPEED.
+"""
+
+POSE_GATE_MAX_SPEED = 500.0
+"""
+Fastest the vehicle is expected to move, in centimeters per second.
+"""
+
+POSE_GATE_MAX_RANGE = 1000.0
+"""
+Farthest a tag can be seen from, in centimeters. Tags farther than this from
+the last vehicle position can't be in view.
+"""
+
+POSE_GATE_TIMEOUT = 1.0
+"""
+Seconds after the last vehicle position that the gate stops checking tags,
+so it picks up the vehicle again after losing it.
+"""
+
+POSE_GATE_MAX_REJECTIONS = 5
+"""
+Frames in a row where none of the tags agree with the last vehicle position
+before the gate lets every tag through again, rather than waiting for
+POSE_GATE_TIMEOUT.
+"""
+
+FAST_RAW_DECODER = False
+"""
+Decode avr/apriltags/raw payloads directly into NumPy arrays instead of
+going through the pydantic payload models. Malformed payloads are rejected
+the same way, though values are converted more leniently, e.g. a null
+coordinate becomes NaN.
+"""
+
+RAW_FORMAT: Literal["json", "packed", "both"] = "json"
+"""
+Wire format of the raw detections published by avrapriltags. "json" uses
+avr/apriltags/raw, "packed" the fixed-size binary records on
+avr/apriltags/raw/packed, and "both" publishes both topics while this module
+reads the packed one.
+"""
+
+VISIBLE_MAX_RATE = 0.0
+"""
+Most avr/apriltags/visible messages to publish per second, frames in between
+are skipped. avr/apriltags/vehicle_position is not limited. 0 means no limit.
+"""
+
+VISIBLE_DELTAS_ONLY = False
+"""
+Whether to skip publishing avr/apriltags/visible when the tags are exactly the
+same as last published, such as every empty list after the first.
+"""
+
+FAST_ENCODER = False
+"""
+Whether to publish avr/apriltags/visible and avr/apriltags/vehicle_position
+without the deep copy of each payload `send_message` keeps in `message_cache`.
+"""
+
+PROCESSING_MODE: Literal["callback", "async"] = "callback"
+"""
+"callback" processes every raw message in the MQTT callback, in order.
+"async" processes them in an asyncio loop that always takes the newest
+message, dropping any that arrived while the previous one was processed.
+"""
+
+POSE_FILTER = False
+"""
+Whether to smooth the published tag and vehicle positions and headings with
+constant-velocity alpha-beta filters.
+"""
+
+POSE_FILTER_ALPHA = 0.5
+"""
+Fraction of the difference between a measurement and the filter's prediction
+that is applied to the position. Lower is smoother but lags more.
+"""
+
+POSE_FILTER_BETA = 0.1
+"""
+Fraction of the same difference (per second) that is applied to the velocity.
+"""
+
+POSE_PREDICTION_RATE = 0.0
+"""
+With POSE_FILTER, rate in Hz at which predicted vehicle positions are
+published while no detection came in for a period. 0 disables predictions.
+"""
+
+POSE_PREDICTION_TIMEOUT = 0.5
+"""
+Seconds after the last detection to stop publishing predicted positions.
+"""
+
+METRICS_INTERVAL = 5.0
+"""
+Seconds between per-stage timing summaries published on
+avr/apriltags/metrics (and avr/apriltags/metrics/cpu by the CPU pipeline).
+0 disables them.
+"""
+
+METRICS_PORT: Optional[int] = None
+"""
+If set, the stage timing histograms of the AprilTag module are served in the
+Prometheus text format on this port.
+"""
+
+CPU_PROTOCOL: Literal["v4l2", "argus", "file"] = "argus"
+"""
+Where the CPU (pupil-apriltags) pipeline gets its frames from. "file" replays
+the recording at CPU_VIDEO_DEVICE instead of capturing from a camera.
+"""
+
+CPU_VIDEO_DEVICE = "/dev/video0"
+"""
+Camera device of the CPU pipeline, or the recording to replay (a file written
+with CPU_RECORD_PATH or a directory of images) with the "file" protocol.
+"""
+
+CPU_REPLAY_REALTIME = True
+"""
+Whether the "file" protocol replays frames at the speed they were recorded.
+If not, they are read as fast as possible, to measure the most the pipeline
+can process; frames the workers can't keep up with are dropped.
+"""
+
+CPU_CAMERAS: Optional[dict[int, str]] = None
+"""
+Camera id -> camera device of every camera the CPU pipeline runs, each in its
+own capture and perception processes with an equal share of the cores. See
+CAMERAS for their ids. None runs camera 0 on CPU_VIDEO_DEVICE.
+"""
+
+CPU_PUBLISH_RAW = False
+"""
+Whether the CPU pipeline publishes its detections on the raw topic of its
+camera, for this module to process like the ones of avrapriltags.
+"""
+
+CPU_RECORD_PATH: Optional[str] = None
+"""
+If set, every frame the CPU pipeline captures is also appended to a raw
+recording at this path, for replaying later with the "file" protocol. With
+CPU_CAMERAS, the camera id is added to the file name.
+"""
+
+CPU_GRAY_CAPTURE = False
+"""
+Whether the CPU pipeline has GStreamer convert frames to grayscale on the
+hardware, instead of converting BGR frames on the CPU. Frames are read into
+one reused buffer.
+"""
+
+CPU_UNDISTORT: Literal["none", "frame", "corners"] = "none"
+"""
+How the CPU pipeline corrects lens distortion. "frame" undistorts whole frames
+before detecting tags, like the GPU pipeline does. "corners" detects tags on
+the raw frame and only undistorts their corners, solving the poses again from
+those, which costs microseconds per tag instead of milliseconds per frame.
+"""
+
+CPU_DISTORTION = (
+    -0.013826167055651659,
+    -0.11999744016996756,
+    0.2825695466585381,
+    -0.22616481734332383,
+)
+"""
+Fisheye (equidistant) distortion coefficients k1-k4 of the camera, from the
+same calibration as undistort.cpp. They only hold together with the camera
+matrix of that calibration, CPU_DISTORTION_CAMERA_PARAMS.
+"""
+
+CPU_CAMERA_PARAMS = (584.3866, 583.3444, 661.2944, 320.7182)
+"""
+Camera intrinsics (fx, fy, cx, cy) at 1280x720 the CPU pipeline solves tag
+poses with when CPU_UNDISTORT is "none".
+"""
+
+CPU_DISTORTION_CAMERA_PARAMS = (
+    784.0756786399139,
+    784.9009527658286,
+    677.124825443364,
+    385.33983488708003,
+)
+"""
+Camera intrinsics (fx, fy, cx, cy) at 1280x720 of the fisheye calibration
+CPU_DISTORTION comes from, the same as cam_properties.cpp for undistort.cpp.
+Undistorted frames and corners keep this camera matrix, so with CPU_UNDISTORT
+set, tag poses are solved with it too.
+"""
+
+CPU_UNDISTORT_CACHE: Optional[str] = os.path.expanduser("~/.cache/avr-apriltag")
+"""
+Directory where the undistortion maps are cached, so they are only computed
+once per camera and resolution. None to always compute them.
+"""
+
+CPU_QUALITY_FILTER = False
+"""
+Whether the CPU pipeline skips frames too blurred or too dark to decode tags
+in before detection, counting them in its metrics.
+"""
+
+CPU_QUALITY_MIN_SHARPNESS = 10.0
+"""
+Lowest variance of the Laplacian of a frame (shrunk 4 times) to detect tags
+in. Motion blur and defocus lower it. Sharp frames with tags usually score in
+the hundreds.
+"""
+
+CPU_QUALITY_MIN_EXPOSURE = 20.0
+"""
+Lowest 99th percentile brightness (0-255) of a frame to detect tags in.
+"""
+
+CPU_METRICS_PORT: Optional[int] = None
+"""
+Like METRICS_PORT, for the CPU pipeline.
+"""
+
+CPU_METRICS_MQTT = False
+"""
+Whether the CPU pipeline connects to the MQTT broker to publish its stage
+timing summaries. Otherwise they are only logged.
+"""
+
+CPU_WORKERS: Union[int, Literal["auto"]] = 2
+"""
+Number of perception processes of the CPU (pupil-apriltags) pipeline.
+"auto" starts with one and adds more while detection can't keep up with the
+camera, up to the number of cores divided by the detector threads, and stops
+them again when detection gets fast enough for fewer.
+"""
+
+CPU_DETECTOR_OPTIONS: dict[str, Any] = {
+    "families": "tag36h11",
+    "nthreads": 2,
+    "quad_decimate": 1.5,
+    "quad_sigma": 0.0,
+    "refine_edges": 1,
+    "decode_sharpening": 0.25,
+    "roi_tracking": False,
+    "keyframe_interval": 10,
+    "adaptive_decimate": False,
+    "max_quad_decimate": 4.0,
+    "min_tag_pixels": 24.0,
+    "refine": False,
+}
+"""
+Options for the pupil-apriltags detector of the CPU pipeline. With
+`roi_tracking`, only every `keyframe_interval`-th frame (or the one after a tag
+is lost) is searched in full, the others only around the tags already found.
+With `adaptive_decimate`, `quad_decimate` is only the starting point and each
+frame is decimated as much as the farthest tag allows (up to
+`max_quad_decimate`, keeping tags at least `min_tag_pixels` wide), except for
+the same keyframes, which are decimated by `quad_decimate` so farther tags are
+still found. With `refine` tags found on a decimated image are detected again at full resolution.
+"""
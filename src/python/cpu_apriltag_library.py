@@ -1,73 +1,359 @@
+import collections
+import json
+import math
 import multiprocessing
+import os
+import signal
+import sys
 import time
-from typing import Any, Literal, Optional
+from typing import Any, Literal, Optional, Sequence, Union
 
-from bell.avr.utils.decorators import run_forever, try_except
+import config
+import numpy as np
+from bell.avr.mqtt.module import MQTTModule
+from bell.avr.utils.decorators import try_except
+from cameras import raw_topic
 from capture_device import CaptureDevice
+from decimation import choose_decimate
+from frame_quality import QualityFilter
+from frame_recording import FrameRecorder
+from frame_ring import FrameRing
 from loguru import logger
+from metrics import StageMetrics, serve_prometheus
 from nptyping import NDArray, UInt8
+from pipeline import Frame, FrameResult, Stages, get_all
 from pupil_apriltags import Detection, Detector
+from roi_tracker import Region, RoiTracker, padded_regions
+from undistort import UndistortMap, solve_square_poses, undistort_points
 
 
 class AprilTagWrapper:
     def __init__(
-        self, camera_params: tuple[float, float, float, float], tag_size: float
+        self,
+        camera_params: tuple[float, float, float, float],
+        tag_size: float,
+        families: str = "tag36h11",
+        nthreads: int = 2,
+        quad_decimate: float = 1.5,
+        quad_sigma: float = 0.0,
+        refine_edges: int = 1,
+        decode_sharpening: float = 0.25,
+        roi_tracking: bool = False,
+        keyframe_interval: int = 10,
+        adaptive_decimate: bool = False,
+        max_quad_decimate: float = 4.0,
+        min_tag_pixels: float = 24.0,
+        refine: bool = False,
+        distortion: Optional[Sequence[float]] = None,
     ):
         self.camera_params = camera_params
         self.tag_size = tag_size
+        self.nthreads = nthreads
+        self.quad_decimate = quad_decimate
+
+        # with adaptive decimation, each frame is decimated as much as the
+        # farthest tag in the previous one allows, falling back to
+        # quad_decimate when no tag was seen. Like the ROI keyframes, every
+        # keyframe_interval-th frame and any frame after a tag is lost is
+        # searched at quad_decimate, so tags farther away are still found
+        self.adaptive_decimate = adaptive_decimate
+        self.max_quad_decimate = max_quad_decimate
+        self.min_tag_pixels = min_tag_pixels
+        # distance in meters of each tag in the last frame
+        self.distances: list[float] = []
+        # ids of the tags in the last frame, whether one of the frame before
+        # was missing from them, and frames in a row decimated further
+        self.tag_ids: set[int] = set()
+        self.tag_lost = False
+        self.coarse_frames = 0
+
+        # with refine, tags found on a decimated image are detected again at
+        # full resolution in a crop around them, for better corners and pose
+        self.refine = refine
+
+        # with ROI tracking, only every few frames are searched in full, the
+        # ones in between only around where the tags are predicted to be
+        self.roi_tracking = roi_tracking
+        self.keyframe_interval = keyframe_interval
+        self.tracker: Optional[RoiTracker] = None
+
+        # with fisheye distortion coefficients, tags are detected on the raw
+        # frame and only their corners are undistorted, with the poses solved
+        # again from those instead of estimated by the detector
+        self.distortion = distortion
 
         self.detector = Detector(
-            families="tag36h11",
-            nthreads=2,
-            quad_decimate=1.5,
-            quad_sigma=0.0,
-            refine_edges=1,
-            decode_sharpening=0.25,
+            families=families,
+            nthreads=nthreads,
+            quad_decimate=quad_decimate,
+            quad_sigma=quad_sigma,
+            refine_edges=refine_edges,
+            decode_sharpening=decode_sharpening,
             debug=0,
         )
 
-    def process_image(self, frame: NDArray[Any, UInt8]) -> Detection:
+    def process_image(self, frame: NDArray[Any, UInt8]) -> list[Detection]:
         """
         Takes an image as input and returns the detected apriltags in list format
         """
-        return self.detector.detect(
-            frame,
-            estimate_tag_pose=True,
-            camera_params=self.camera_params,
+        full_frame = (0, 0, frame.shape[1], frame.shape[0])
+        keyframe = True
+        if self.roi_tracking:
+            if self.tracker is None or self.tracker.height != frame.shape[0]:
+                self.tracker = RoiTracker(frame.shape[:2], self.keyframe_interval)
+            keyframe = self.tracker.needs_keyframe()
+
+        # whether adaptive decimation falls back to quad_decimate
+        base = keyframe
+        if not self.roi_tracking:
+            base = self.tag_lost or self.coarse_frames + 1 >= self.keyframe_interval
+
+        if self.adaptive_decimate:
+            self.set_quad_decimate(
+                self.quad_decimate
+                if base
+                else choose_decimate(
+                    self.distances,
+                    self.camera_params[0],
+                    self.tag_size,
+                    self.quad_decimate,
+                    self.min_tag_pixels,
+                    self.max_quad_decimate,
+                )
+            )
+
+        if keyframe:
+            detections = self.detect_regions(frame, [full_frame])
+        else:
+            assert self.tracker is not None
+            detections = self.detect_regions(frame, self.tracker.regions())
+
+        decimate = self.detector.tag_detector_ptr.contents.quad_decimate
+        if self.refine and detections and decimate > 1:
+            self.set_quad_decimate(1.0)
+            regions = padded_regions(
+                [d.corners for d in detections.values()], frame.shape[:2]
+            )
+            # tags the refine pass misses keep their coarse detection
+            detections.update(self.detect_regions(frame, regions))
+            self.set_quad_decimate(decimate)
+
+        if self.tracker is not None:
+            self.tracker.update(
+                [(tag_id, d.corners) for tag_id, d in detections.items()], keyframe
+            )
+        if self.distortion is not None and detections:
+            self.undistort_detections(list(detections.values()))
+        if self.adaptive_decimate:
+            self.coarse_frames = 0 if base else self.coarse_frames + 1
+            self.tag_lost = not base and not self.tag_ids <= detections.keys()
+            self.tag_ids = set(detections)
+        self.distances = [float(np.linalg.norm(d.pose_t)) for d in detections.values()]
+        return list(detections.values())
+
+    def undistort_detections(self, detections: list[Detection]) -> None:
+        """
+        Replaces the corners, centers and poses of detections on a distorted
+        frame with undistorted ones.
+        """
+        assert self.distortion is not None
+        corners = undistort_points(
+            np.stack([d.corners for d in detections]),
+            self.camera_params,
+            self.distortion,
+        )
+        centers = undistort_points(
+            np.stack([d.center for d in detections]),
+            self.camera_params,
+            self.distortion,
+        )
+        rotations, translations = solve_square_poses(
+            corners, self.camera_params, self.tag_size
+        )
+        for index, detection in enumerate(detections):
+            detection.corners = corners[index]
+            detection.center = centers[index]
+            detection.pose_R = rotations[index]
+            detection.pose_t = translations[index]
+
+    def set_quad_decimate(self, quad_decimate: float) -> None:
+        self.detector.tag_detector_ptr.contents.quad_decimate = quad_decimate
+
+    def detect_regions(
+        self, frame: NDArray[Any, UInt8], regions: list[Region]
+    ) -> dict[int, Detection]:
+        """
+        Detects apriltags in several crops of the frame, by tag id.
+        """
+        # merged regions don't overlap, but a tag on the edge of one can still
+        # be decoded twice. Keep the most confident detection
+        detections: dict[int, Detection] = {}
+        for region in regions:
+            for detection in self.detect_region(frame, region):
+                best = detections.get(detection.tag_id)
+                if best is None or detection.decision_margin > best.decision_margin:
+                    detections[detection.tag_id] = detection
+        return detections
+
+    def detect_region(
+        self, frame: NDArray[Any, UInt8], region: Region
+    ) -> list[Detection]:
+        """
+        Detects apriltags in a crop of the frame, with the results in
+        full frame coordinates.
+        """
+        x0, y0, x1, y1 = region
+        fx, fy, cx, cy = self.camera_params
+
+        # shifting the principal point into the crop gives poses in the
+        # camera frame directly
+        detections = self.detector.detect(
+            frame[y0:y1, x0:x1],
+            estimate_tag_pose=self.distortion is None,
+            camera_params=(fx, fy, cx - x0, cy - y0),
             tag_size=self.tag_size,
         )
 
+        if x0 or y0:
+            offset = np.array([x0, y0], dtype=np.float64)
+            shift = np.array([[1.0, 0.0, x0], [0.0, 1.0, y0], [0.0, 0.0, 1.0]])
+            for detection in detections:
+                detection.center = detection.center + offset
+                detection.corners = detection.corners + offset
+                detection.homography = shift @ detection.homography
+
+        return detections
+
+
+# most of their time the remaining "auto" perception processes may spend
+# detecting for one of them to be stopped
+SCALE_DOWN_LOAD = 0.7
+
+# seconds to wait for a stopped perception process to finish its frame, which
+# includes waiting up to a second for one
+WORKER_STOP_TIMEOUT = 2.0
+
+# seconds to wait after the first failed camera read in a row, doubling with
+# each one after up to the max
+CAPTURE_RETRY_DELAY = 0.01
+CAPTURE_RETRY_MAX_DELAY = 1.0
+
 
 class AprilTagVPS:
     def __init__(
         self,
-        protocol: Literal["v4l2", "argus"],
+        protocol: Literal["v4l2", "argus", "file"],
         video_device: str,
         res: tuple[int, int],
         camera_params: tuple[float, float, float, float],
         tag_size: float,
         framerate: Optional[int] = None,
+        record_path: Optional[str] = None,
+        replay_realtime: bool = True,
+        gray_capture: bool = False,
+        distortion: Optional[Sequence[float]] = None,
+        undistort: Literal["frame", "corners"] = "frame",
+        undistort_cache: Optional[str] = None,
+        quality_thresholds: Optional[tuple[float, float]] = None,
+        frame_slots: Optional[int] = None,
+        scheduling: Literal["fifo", "latest"] = "latest",
+        workers: Union[int, Literal["auto"]] = 2,
+        detector_options: Optional[dict[str, Any]] = None,
+        camera_id: int = 0,
+        cores: Optional[int] = None,
     ):
         # camera parameters
-        self.protocol: Literal["v4l2", "argus"] = protocol
+        self.protocol: Literal["v4l2", "argus", "file"] = protocol
         self.video_device = video_device
         self.res = res
         self.framerate = framerate
+        # which camera of the vehicle this is, for the topics it publishes on
+        self.camera_id = camera_id
+        # if set, captured frames are also recorded here for replaying
+        self.record_path = record_path
+        # whether the "file" protocol replays at the recorded speed, or as
+        # fast as frames can be read
+        self.replay_realtime = replay_realtime
+        # if set, the capture pipeline delivers grayscale frames directly
+        self.gray_capture = gray_capture
+
+        # with fisheye distortion coefficients, either whole frames are
+        # undistorted before detection, keeping the same camera matrix, or only
+        # the corners of the detected tags
+        self.undistort = None
+        if distortion is not None and undistort == "frame":
+            self.undistort = UndistortMap(
+                camera_params, distortion, res, undistort_cache
+            )
+
+        # steps run on every frame in the perception processes before
+        # detection, any of which can drop the frame by returning None
+        self.preprocess: Stages[Frame] = Stages()
+        # with (min sharpness, min exposure) thresholds, frames too blurred or
+        # dark to decode tags in are skipped
+        if quality_thresholds is not None:
+            self.preprocess.add("quality", QualityFilter(*quality_thresholds))
+        if self.undistort is not None:
+            self.preprocess.add("undistort", self.undistort.apply)
+        # steps run on every fresh result in the main process
+        self.publish: Stages[FrameResult] = Stages()
 
         # pupil april tags wrapper
-        self.atag = AprilTagWrapper(camera_params=camera_params, tag_size=tag_size)
+        self.atag = AprilTagWrapper(
+            camera_params=camera_params,
+            tag_size=tag_size,
+            distortion=distortion if undistort == "corners" else None,
+            **(detector_options or {}),
+        )
+
+        # number of perception processes, or "auto" to start with one and add
+        # more as long as the measured detection time can't keep up with the
+        # camera and there are cores left, and stop them again once it can
+        # with fewer
+        self.workers = workers
+        self.worker_procs: list[multiprocessing.Process] = []
+        # set to stop the perception process at the same index
+        self.worker_stops: list[Any] = []
+        # cores the "auto" workers may use, all of them by default. Several
+        # cameras running at once should split the cores between them
+        self.cores = cores
+        # moving average of the per-frame detection time, in seconds
+        self.detect_time = 0.0
 
-        # setup processing queue
-        self.img_queue = multiprocessing.Queue()
+        # frames are handed to the perception processes through shared memory,
+        # only results go through a queue
+        if frame_slots is None:
+            frame_slots = self.max_workers() + 3
+        self.frames = FrameRing((res[1], res[0]), frame_slots)
         self.tags_queue = multiprocessing.Queue()
 
+        # "latest" always hands perception workers the newest captured frame,
+        # dropping older ones. "fifo" processes frames in capture order
+        self.scheduling = scheduling
+
         self.tags = None
+        # capture time and sequence number of the frame self.tags came from
         self.tags_timestamp = time.time()
+        self.tags_sequence = 0
+        # seconds from frame capture to results being available
+        self.latency = 0.0
+        # results discarded because a newer frame finished first
+        self.num_stale = 0
 
         # record average framerate
         self.avg = 0.0
         # record number of images processed
         self.num_images = 0
+        self.last_result = time.time()
+        # seconds between the last 10 fresh results
+        self.result_deltas: collections.deque[float] = collections.deque(maxlen=10)
+
+        # per-stage timings, gathered from every process in the main one
+        self.metrics = StageMetrics(config.METRICS_INTERVAL)
+        if quality_thresholds is not None:
+            self.metrics.set("quality_min_sharpness", quality_thresholds[0])
+            self.metrics.set("quality_min_exposure", quality_thresholds[1])
+        self.mqtt: Optional[MQTTModule] = None
 
     def run(self) -> None:
         # sourcery skip: use-named-expression
@@ -76,101 +362,371 @@ class AprilTagVPS:
         a v4l2 camera @ 'video_device' and uses 'camera_params' along with
         'tag_size' to calculate pose.
         """
-        # we will setup 2 processing consumers for the imagery.
-        for i in range(2):
-            proc = multiprocessing.Process(
-                target=self.perception_loop_start,
-                args=[],
-                daemon=True,  # type: ignore
-            )
-            proc.start()
+        # setup the processing consumers for the imagery.
+        for _ in range(1 if self.workers == "auto" else self.workers):
+            self.start_perception_worker()
 
         # start the capturing process
-        proc = multiprocessing.Process(
+        capture_proc = multiprocessing.Process(
             target=self.capture_loop_start, args=(), daemon=True
         )
+        capture_proc.start()
+
+        if config.CPU_METRICS_PORT is not None:
+            serve_prometheus(self.metrics, config.CPU_METRICS_PORT, "avr_apriltags_cpu")
+        if config.CPU_METRICS_MQTT or config.CPU_PUBLISH_RAW:
+            self.mqtt = MQTTModule()
+            self.mqtt.run_non_blocking()
+        if config.CPU_PUBLISH_RAW:
+            self.publish.add("publish_raw", self.publish_raw)
+
+        # exit through the finally below when the module is stopped
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        try:
+            while True:
+                if self.metrics.due():
+                    self.report_metrics()
+
+                # block until the perception processes have results, waking
+                # up now and then to report metrics
+                results = get_all(self.tags_queue, timeout=0.5)
+                for result in results:
+                    self.handle_result(result)
+
+                # once a replay is over, exit after the last results are in
+                if not results and not capture_proc.is_alive():
+                    logger.info("Capture loop exited, stopping")
+                    return
+        finally:
+            # this process created the frame ring, so it has to remove the
+            # shared memory or it stays in /dev/shm
+            self.frames.close(unlink=True)
+
+    def handle_result(self, result: FrameResult) -> None:
+        """
+        Takes in the result of a perception process, unless a newer frame
+        already finished, and runs the publish stages on it.
+        """
+        self.num_images += 1
+        now = time.time()
+
+        for stage, seconds in result.timings.items():
+            self.metrics.observe(stage, seconds)
+        self.metrics.observe("result_wait", now - result.done)
+        self.metrics.count("frames")
+
+        if result.skipped is not None:
+            # no detection ran, so there is nothing else to take in
+            self.metrics.count(f"skipped_{result.skipped}")
+            return
+
+        detect_time = result.timings["detect"]
+        if self.detect_time == 0.0:
+            self.detect_time = detect_time
+        self.detect_time = 0.9 * self.detect_time + 0.1 * detect_time
+        if self.workers == "auto" and self.num_images % 30 == 0:
+            self.scale_workers()
+
+        # with several workers, results can finish out of order. Never go
+        # back in time to an older frame
+        if result.sequence <= self.tags_sequence:
+            self.num_stale += 1
+            return
+
+        self.tags_sequence = result.sequence
+        self.latency = now - result.timestamp
+        self.metrics.observe("latency", self.latency)
+        if result.tags:
+            self.tags = result.tags
+            self.tags_timestamp = result.timestamp
+        else:
+            self.tags = []
+
+        # calculate the framerate
+        self.result_deltas.append(now - self.last_result)
+        elapsed = sum(self.result_deltas)
+        if elapsed > 0:
+            self.avg = len(self.result_deltas) / elapsed
+        self.last_result = now
+
+        timings: dict[str, float] = {}
+        self.publish.run(result, timings)
+        for stage, seconds in timings.items():
+            self.metrics.observe(stage, seconds)
+
+    def report_metrics(self) -> None:
+        """
+        Logs the stage timings since the last report, and publishes them
+        if connected to MQTT.
+        """
+        summary = self.metrics.summary()
+        logger.info(
+            "Stage timings (p50/p99 ms): "
+            + ", ".join(
+                f"{stage} {stats['p50_ms']:.1f}/{stats['p99_ms']:.1f}"
+                for stage, stats in summary.items()
+                if stage in self.metrics.stages
+            )
+        )
+        skipped = {
+            counter: count
+            for counter, count in self.metrics.counters.items()
+            if counter.startswith("skipped_")
+        }
+        if skipped:
+            logger.info(
+                f"Skipped {sum(skipped.values())} of "
+                f"{self.metrics.counters['frames']} frames: {skipped}"
+            )
+        if config.CPU_METRICS_MQTT and self.mqtt is not None:
+            topic = "avr/apriltags/metrics/cpu"
+            if self.camera_id != 0:
+                topic += f"/{self.camera_id}"
+            self.mqtt.send_message(topic, summary)  # type: ignore
+
+    def publish_raw(self, result: FrameResult) -> FrameResult:
+        """
+        Publishes the detections of a frame on the raw topic of the camera,
+        in the avr/apriltags/raw format the processor module reads.
+        """
+        assert self.mqtt is not None
+        tags = [
+            {
+                "tag_id": int(tag.tag_id),
+                "x": float(tag.pose_t[0, 0]),
+                "y": float(tag.pose_t[1, 0]),
+                "z": float(tag.pose_t[2, 0]),
+                # rounding can put a rotation a hair outside the payload's bounds
+                "rotation": np.clip(tag.pose_R, -1, 1).tolist(),
+            }
+            for tag in result.tags
+        ]
+        self.mqtt._publish(raw_topic(self.camera_id), json.dumps({"apriltags": tags}))
+        return result
+
+    def max_workers(self) -> int:
+        """
+        Most perception processes that fit on the machine without
+        oversubscribing cores, given the detector's own threads.
+        """
+        if self.workers != "auto":
+            return self.workers
+
+        return max(1, (self.cores or os.cpu_count() or 1) // self.atag.nthreads)
+
+    def start_perception_worker(self) -> None:
+        stop = multiprocessing.Event()
+        proc = multiprocessing.Process(
+            target=self.perception_loop_start,
+            args=[stop],
+            daemon=True,  # type: ignore
+        )
         proc.start()
+        self.worker_procs.append(proc)
+        self.worker_stops.append(stop)
 
-        last_loop = time.time()
-        delta_buckets = [0, 0, 0, 0, 0, 0, 0, 0, 0, 0]
-        i = 0
-
-        while True:
-            # if the perception loop has completed analysis on a frame,
-            # show some stats or even render the frame
-            if self.tags_queue.empty():
-                time.sleep(0.01)
-                continue
-
-            self.num_images += 1
-            now = time.time()
-
-            # try to get a tag from the queue
-            tags = self.tags_queue.get()
-            if tags:
-                self.tags = tags
-                self.tags_timestamp = now
-            else:
-                self.tags = []
-
-            # calculate the framerate
-            tdelta = now - last_loop
-            delta_buckets[i % 10] = tdelta  # type: ignore
-            self.avg = 1 / (sum(delta_buckets) / 10)
-            last_loop = now
-            i += 1
-
-    @run_forever(period=0.01)
-    def capture_loop(self, capture: CaptureDevice, max_depth: int) -> None:
-        """
-        Captures frames from the camera and places them into the image queue
-        to be consumed downstream by "perception loop". Checks to make sure queue
-        is not being overloaded and limits queue size to "max_depth".
+    def stop_perception_worker(self) -> None:
+        """
+        Stops the last started perception process once it is done with the
+        frame it is on, terminating it if that takes longer than
+        `WORKER_STOP_TIMEOUT`.
         """
+        self.worker_stops.pop().set()
+        proc = self.worker_procs.pop()
+        proc.join(WORKER_STOP_TIMEOUT)
+        if proc.is_alive():
+            logger.warning(f"Perception worker {proc.pid} didn't stop, terminating it")
+            proc.terminate()
+            proc.join()
+
+    def scale_workers(self) -> None:
+        """
+        Adds a perception process if the measured detection time means the
+        current ones can't keep up with the camera framerate, or stops one if
+        one fewer would be busy at most `SCALE_DOWN_LOAD` of the time, so the
+        count doesn't flap around a boundary.
+        """
+        # the capture pipelines run the camera at 60 fps unless rate limited
+        framerate = self.framerate or 60
+        # perception processes kept busy all the time at the current rate
+        load = self.detect_time * framerate
+        workers = len(self.worker_procs)
+
+        if min(math.ceil(load), self.max_workers()) > workers:
+            logger.info(
+                f"Detection takes {self.detect_time * 1000:.1f} ms per frame,"
+                f" adding perception worker {workers + 1}"
+            )
+            self.start_perception_worker()
+        elif workers > 1 and load <= (workers - 1) * SCALE_DOWN_LOAD:
+            logger.info(
+                f"Detection takes {self.detect_time * 1000:.1f} ms per frame,"
+                f" stopping perception worker {workers}"
+            )
+            self.stop_perception_worker()
+
+    def capture_loop(
+        self, capture: CaptureDevice, recorder: Optional[FrameRecorder] = None
+    ) -> bool:
+        """
+        Captures a frame from the camera and places it into the shared frame
+        ring to be consumed downstream by "perception loop". If the perception
+        loop falls behind, the oldest frame waiting in the ring is dropped.
+        Reading blocks until the camera has a new frame. Returns whether
+        a frame was read.
+        """
+        start = time.perf_counter()
         ret, img = capture.read_gray()
+        capture_time = time.perf_counter() - start
+        timestamp = time.time()
 
-        # if theres room in the queue and we have a valid image
-        if (self.img_queue.qsize() < max_depth) and (ret is True):
-            # put the image in the queue
-            self.img_queue.put(img)
+        # if we have a valid image
+        if ret is True:
+            self.frames.write(img, timestamp, capture_time)  # type: ignore
+            if recorder is not None:
+                recorder.write(img, timestamp)  # type: ignore
+        return ret is True
 
     def capture_loop_start(self) -> None:
-        max_depth = 3
         capture = CaptureDevice(
-            self.protocol, self.video_device, self.res, self.framerate
+            self.protocol,
+            self.video_device,
+            self.res,
+            self.framerate,
+            realtime=self.replay_realtime,
+            gray=self.gray_capture,
         )
 
+        recorder = None
+        if self.record_path is not None:
+            recorder = FrameRecorder(self.record_path, (self.res[1], self.res[0]))
+            logger.info(f"Recording frames to {self.record_path}")
+
         logger.success("Capture loop started")
-        self.capture_loop(capture, max_depth)
+        failures = 0
+        try:
+            while True:
+                if self.capture_loop(capture, recorder):
+                    failures = 0
+                    continue
+
+                # a replay only stops reading frames once it is over
+                if self.protocol == "file":
+                    logger.info("Replay finished, stopping the capture loop")
+                    return
+
+                # don't spin on a failing camera
+                if failures == 0:
+                    logger.warning("Camera read failed, retrying")
+                time.sleep(
+                    min(CAPTURE_RETRY_DELAY * 2**failures, CAPTURE_RETRY_MAX_DELAY)
+                )
+                failures += 1
+        finally:
+            if recorder is not None:
+                recorder.close()
 
-    @run_forever(period=0)
     def perception_loop(self) -> None:
         """
-        Pulls images off the image queue, hands them to the apriltag detector,
-        and then places the results in the tags queue.
+        Pulls an image out of the frame ring, runs the preprocess stages and
+        the apriltag detector on it, and then places the result in the tags
+        queue. Waiting for a frame blocks until one is published.
         """
-        if not self.img_queue.empty():
-            img = self.img_queue.get()
-            tags = self.atag.process_image(img)
-            self.tags_queue.put(tags)
-        else:
-            time.sleep(0.01)
+        slot = self.frames.get(timeout=1.0, newest=self.scheduling == "latest")
+        if slot is None:
+            return
+
+        try:
+            sequence = self.frames.sequence(slot)
+            timestamp = self.frames.timestamp(slot)
+            timings = {
+                "capture": self.frames.capture_time(slot),
+                "queue_wait": time.time() - timestamp,
+            }
+            frame = self.preprocess.run(self.frames.frame(slot), timings)
+            if frame is None:
+                skipped = next(reversed(timings))
+                self.tags_queue.put(
+                    FrameResult(sequence, timestamp, timings, time.time(), [], skipped)
+                )
+                return
+
+            start = time.perf_counter()
+            tags = self.atag.process_image(frame)
+            timings["detect"] = time.perf_counter() - start
+        finally:
+            self.frames.release(slot)
+
+        self.tags_queue.put(
+            FrameResult(sequence, timestamp, timings, time.time(), tags)
+        )
 
     @try_except(reraise=True)
-    def perception_loop_start(self) -> None:
+    def perception_loop_start(self, stop: Any) -> None:
         logger.success("Perception loop started")
-        self.perception_loop()
+        while not stop.is_set():
+            self.perception_loop()
+        logger.info("Perception loop stopped")
 
 
-if __name__ == "__main__":
+def run_camera(camera_id: int, video_device: str, cores: Optional[int] = None) -> None:
+    record_path = config.CPU_RECORD_PATH
+    if record_path is not None and config.CPU_CAMERAS is not None:
+        root, ext = os.path.splitext(record_path)
+        record_path = f"{root}_{camera_id}{ext}"
+
+    # the distortion coefficients only apply with the camera matrix of their
+    # own calibration, which undistorted frames and corners keep
+    undistort = config.CPU_UNDISTORT != "none"
     at = AprilTagVPS(
-        protocol="argus",
-        video_device="/dev/video0",
+        protocol=config.CPU_PROTOCOL,
+        video_device=video_device,
         res=(1280, 720),
-        camera_params=(584.3866, 583.3444, 661.2944, 320.7182),
+        camera_params=(
+            config.CPU_DISTORTION_CAMERA_PARAMS
+            if undistort
+            else config.CPU_CAMERA_PARAMS
+        ),
         tag_size=0.174,  # full size tag
         # old comment had 0.057
         framerate=None,
+        record_path=record_path,
+        replay_realtime=config.CPU_REPLAY_REALTIME,
+        gray_capture=config.CPU_GRAY_CAPTURE,
+        distortion=config.CPU_DISTORTION if undistort else None,
+        undistort="corners" if config.CPU_UNDISTORT == "corners" else "frame",
+        undistort_cache=config.CPU_UNDISTORT_CACHE,
+        quality_thresholds=(
+            (config.CPU_QUALITY_MIN_SHARPNESS, config.CPU_QUALITY_MIN_EXPOSURE)
+            if config.CPU_QUALITY_FILTER
+            else None
+        ),
+        workers=config.CPU_WORKERS,
+        detector_options=config.CPU_DETECTOR_OPTIONS,
+        camera_id=camera_id,
+        cores=cores,
     )
 
     at.run()
+
+
+if __name__ == "__main__":
+    if config.CPU_CAMERAS is None:
+        run_camera(0, config.CPU_VIDEO_DEVICE)
+    else:
+        # every camera gets its own capture and perception processes, with
+        # an equal share of the cores
+        cores = max(1, (os.cpu_count() or 1) // len(config.CPU_CAMERAS))
+        procs = [
+            multiprocessing.Process(
+                target=run_camera, args=(camera_id, video_device, cores)
+            )
+            for camera_id, video_device in config.CPU_CAMERAS.items()
+        ]
+        for proc in procs:
+            proc.start()
+
+        # pass a stop on to the cameras, so each can clean up after itself
+        signal.signal(signal.SIGTERM, lambda *_: [proc.terminate() for proc in procs])
+        for proc in procs:
+            proc.join()
@@ -0,0 +1,37 @@
+from typing import Iterable, Sequence
+
+DECIMATION_LEVELS = (1.0, 1.5, 2.0, 3.0, 4.0)
+"""
+`quad_decimate` values the adaptive mode chooses between.
+"""
+
+
+def choose_decimate(
+    distances: Iterable[float],
+    focal_length: float,
+    tag_size: float,
+    default: float,
+    min_tag_pixels: float = 24.0,
+    max_decimate: float = 4.0,
+    levels: Sequence[float] = DECIMATION_LEVELS,
+) -> float:
+    """
+    Coarsest decimation at which the farthest of the last seen tags still
+    spans `min_tag_pixels` in the decimated image, so quads are still found.
+
+    A tag `tag_size` meters wide at `distance` meters is about
+    `focal_length * tag_size / distance` pixels wide at full resolution.
+    Returns `default` when no tag was seen, since then there is nothing to
+    size the search by.
+    """
+    farthest = max(distances, default=None)
+    if farthest is None or farthest <= 0:
+        return default
+
+    tag_pixels = focal_length * tag_size / farthest
+    usable = [
+        level
+        for level in levels
+        if level <= max_decimate and tag_pixels / level >= min_tag_pixels
+    ]
+    return max(usable, default=min(levels))
@@ -0,0 +1,54 @@
+from typing import Any, Optional
+
+import cv2
+import numpy as np
+from nptyping import NDArray, UInt8
+
+
+def frame_quality(frame: NDArray[Any, UInt8], decimate: int = 4) -> tuple[float, float]:
+    """
+    Sharpness and exposure scores of a grayscale frame, computed on a copy
+    shrunk `decimate` times in each direction.
+
+    Sharpness is the variance of the Laplacian, which drops when edges are
+    smeared by motion blur or defocus. Exposure is the 99th percentile of the
+    brightness, which stays high as long as anything (like the white border
+    of a tag) is well lit, however dark the rest of the frame is.
+    """
+    small = frame
+    if decimate > 1:
+        small = cv2.resize(
+            frame,
+            (frame.shape[1] // decimate, frame.shape[0] // decimate),
+            interpolation=cv2.INTER_AREA,
+        )
+
+    _, stddev = cv2.meanStdDev(cv2.Laplacian(small, cv2.CV_16S))
+    sharpness = float(stddev[0, 0]) ** 2
+
+    histogram = np.bincount(small.ravel(), minlength=256)
+    exposure = float(np.searchsorted(np.cumsum(histogram), 0.99 * small.size))
+    return sharpness, exposure
+
+
+class QualityFilter:
+    """
+    Frame stage that drops frames too blurred or too dark for tags to
+    decode, so the detector only spends time on frames that can.
+
+    The scores of the last frame are kept in `sharpness` and `exposure`.
+    """
+
+    def __init__(self, min_sharpness: float, min_exposure: float, decimate: int = 4):
+        self.min_sharpness = min_sharpness
+        self.min_exposure = min_exposure
+        self.decimate = decimate
+
+        self.sharpness = 0.0
+        self.exposure = 0.0
+
+    def __call__(self, frame: NDArray[Any, UInt8]) -> Optional[NDArray[Any, UInt8]]:
+        self.sharpness, self.exposure = frame_quality(frame, self.decimate)
+        if self.sharpness < self.min_sharpness or self.exposure < self.min_exposure:
+            return None
+        return frame
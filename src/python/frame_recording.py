@@ -0,0 +1,178 @@
+import csv
+import os
+import time
+from typing import Any, Optional
+
+import cv2
+import numpy as np
+from nptyping import NDArray, UInt8
+
+RECORDING_MAGIC = b"AVRFRAME"
+
+RECORDING_HEADER_DTYPE = np.dtype(
+    [
+        ("magic", "S8"),
+        ("height", "<u4"),
+        ("width", "<u4"),
+        ("channels", "<u4"),
+        ("reserved", "<u4"),
+    ]
+)
+"""
+Header of a raw frame recording. It is followed by one `recording_dtype`
+record per frame, until the end of the file.
+"""
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".pgm", ".tif", ".tiff")
+
+
+def recording_dtype(shape: tuple[int, ...]) -> np.dtype:
+    """
+    One frame of a raw recording: its capture timestamp in seconds since the
+    epoch, then the pixels.
+    """
+    return np.dtype([("timestamp", "<f8"), ("frame", "u1", shape)])
+
+
+def open_recording(path: str) -> NDArray[Any, Any]:
+    """
+    Memory maps a raw frame recording as an array of `recording_dtype`
+    records. A partially written last frame (from a recorder that was killed)
+    is ignored.
+    """
+    header = np.fromfile(path, dtype=RECORDING_HEADER_DTYPE, count=1)
+    if len(header) == 0 or header[0]["magic"] != RECORDING_MAGIC:
+        raise ValueError(f"{path} is not a frame recording")
+
+    height, width, channels = (
+        int(header[0][key]) for key in ("height", "width", "channels")
+    )
+    shape = (height, width) if channels == 1 else (height, width, channels)
+    dtype = recording_dtype(shape)
+
+    count = (os.path.getsize(path) - RECORDING_HEADER_DTYPE.itemsize) // dtype.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(
+        path,
+        dtype=dtype,
+        mode="r",
+        offset=RECORDING_HEADER_DTYPE.itemsize,
+        shape=(count,),
+    )
+
+
+class FrameRecorder:
+    """
+    Appends frames to a raw recording that `FrameReplay` can play back.
+
+    Each frame is a single unbuffered write of its timestamp and pixels, so
+    recording costs little more than the copy, and a recording stays readable
+    up to the last complete frame if the process is killed.
+    """
+
+    def __init__(self, path: str, shape: tuple[int, ...]):
+        self.shape = shape
+        self.dtype = recording_dtype(shape)
+        self._record = np.zeros(1, dtype=self.dtype)
+
+        header = np.zeros(1, dtype=RECORDING_HEADER_DTYPE)
+        header["magic"] = RECORDING_MAGIC
+        header["height"], header["width"] = shape[:2]
+        header["channels"] = shape[2] if len(shape) == 3 else 1
+
+        self._file = open(path, "wb", buffering=0)
+        self._file.write(header.tobytes())
+
+    def write(self, frame: NDArray[Any, UInt8], timestamp: float) -> None:
+        self._record["timestamp"] = timestamp
+        self._record["frame"] = frame
+        self._file.write(self._record.data)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class FrameReplay:
+    """
+    Plays back a recording with the same `read` interface as
+    `cv2.VideoCapture`.
+
+    `path` is either a raw recording written by `FrameRecorder` or a
+    directory of images, read in file name order. A directory can have a
+    `timestamps.csv` of `file name,timestamp` rows, otherwise its frames are
+    spaced `1 / framerate` seconds apart (30 fps if no framerate is given).
+
+    With `realtime`, frames are returned no faster than they were recorded
+    (or than `framerate`, if given). Otherwise as fast as they are read.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        realtime: bool = True,
+        framerate: Optional[int] = None,
+        loop: bool = False,
+    ):
+        self.realtime = realtime
+        self.loop = loop
+
+        self._records: Optional[NDArray[Any, Any]] = None
+        self._images: list[str] = []
+        if os.path.isdir(path):
+            self._images = sorted(
+                os.path.join(path, name)
+                for name in os.listdir(path)
+                if name.lower().endswith(IMAGE_EXTENSIONS)
+            )
+            self.timestamps = self._image_timestamps(path, framerate)
+        else:
+            self._records = open_recording(path)
+            self.timestamps = np.array(self._records["timestamp"])
+
+        if framerate is not None:
+            self.timestamps = np.arange(len(self.timestamps)) / framerate
+
+        # timestamp of the last frame read, as recorded or paced by framerate
+        self.timestamp = 0.0
+        self._index = 0
+        self._start = 0.0
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def _image_timestamps(
+        self, path: str, framerate: Optional[int]
+    ) -> NDArray[Any, Any]:
+        timestamps_path = os.path.join(path, "timestamps.csv")
+        if not os.path.exists(timestamps_path):
+            return np.arange(len(self._images)) / (framerate or 30)
+
+        with open(timestamps_path, newline="") as f:
+            by_name = {row[0]: float(row[1]) for row in csv.reader(f) if row}
+        return np.array([by_name[os.path.basename(image)] for image in self._images])
+
+    def frame(self, index: int) -> NDArray[Any, UInt8]:
+        if self._records is not None:
+            return self._records[index]["frame"]
+        return cv2.imread(self._images[index], cv2.IMREAD_UNCHANGED)
+
+    def read(self) -> tuple[bool, Optional[NDArray[Any, UInt8]]]:
+        if self._index >= len(self):
+            if not self.loop or len(self) == 0:
+                return False, None
+            self._index = 0
+
+        if self._index == 0:
+            self._start = time.perf_counter()
+
+        self.timestamp = float(self.timestamps[self._index])
+        if self.realtime:
+            due = self._start + self.timestamp - self.timestamps[0]
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+        frame = self.frame(self._index)
+        self._index += 1
+        return True, frame
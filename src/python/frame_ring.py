@@ -0,0 +1,217 @@
+import multiprocessing
+from multiprocessing import shared_memory
+from typing import Any, Optional
+
+import numpy as np
+from nptyping import NDArray, UInt8
+
+# slot states
+_FREE = 0
+_WRITING = 1
+_READY = 2
+_READING = 3
+
+
+class FrameRing:
+    """
+    Ring of preallocated frame slots in shared memory, for handing frames
+    between processes without pickling them.
+
+    The producer `acquire`s a slot, writes the frame into `frame(slot)` and
+    `publish`es it. Consumers `get` the index of a published slot, read the
+    frame in place, and `release` the slot when done. Only slot indices and
+    states are shared through locks, never pixels.
+
+    When every slot is taken, `acquire` drops the oldest published frame that
+    no consumer has picked up yet and reuses its slot, so a slow consumer
+    never stalls the producer.
+
+    Every published frame carries a sequence number (counting up from 1 in
+    publish order), the capture timestamp given by the producer and how long
+    the producer took to capture it.
+    """
+
+    def __init__(self, shape: tuple[int, ...], num_slots: int):
+        if num_slots < 2:
+            raise ValueError("A frame ring needs at least 2 slots")
+
+        self.shape = shape
+        self.num_slots = num_slots
+        self.frame_size = int(np.prod(shape))
+
+        self._shm = shared_memory.SharedMemory(
+            create=True, size=self.frame_size * num_slots
+        )
+        self._frames: Optional[NDArray[Any, UInt8]] = None
+
+        self._condition = multiprocessing.Condition()
+        self._state = multiprocessing.Array("b", num_slots, lock=False)
+        # sequence number of the frame in each slot, also used to find the
+        # oldest and newest ones
+        self._published = multiprocessing.Array("Q", num_slots, lock=False)
+        self._num_published = multiprocessing.Value("Q", 0, lock=False)
+        self._timestamp = multiprocessing.Array("d", num_slots, lock=False)
+        self._capture_time = multiprocessing.Array("d", num_slots, lock=False)
+
+        # number of frames overwritten before any consumer got to them
+        self._dropped = multiprocessing.Value("Q", 0, lock=False)
+
+    def __getstate__(self) -> dict:
+        # the cached view can't be pickled, it is recreated on first use
+        state = self.__dict__.copy()
+        state["_frames"] = None
+        return state
+
+    @property
+    def dropped(self) -> int:
+        return self._dropped.value
+
+    def frame(self, slot: int) -> NDArray[Any, UInt8]:
+        """
+        Array view of the frame in the given slot.
+        """
+        if self._frames is None:
+            self._frames = np.ndarray(
+                (self.num_slots, *self.shape), dtype=np.uint8, buffer=self._shm.buf
+            )
+        return self._frames[slot]
+
+    def sequence(self, slot: int) -> int:
+        """
+        Sequence number of the frame in the given slot.
+        """
+        return self._published[slot]
+
+    def timestamp(self, slot: int) -> float:
+        """
+        Capture timestamp of the frame in the given slot.
+        """
+        return self._timestamp[slot]
+
+    def capture_time(self, slot: int) -> float:
+        """
+        Seconds the producer took to capture the frame in the given slot.
+        """
+        return self._capture_time[slot]
+
+    def _find(self, state: int, newest: bool = False) -> Optional[int]:
+        """
+        Oldest (or newest) published slot in the given state.
+        Must hold the condition.
+        """
+        found = None
+        for slot in range(self.num_slots):
+            if self._state[slot] == state and (
+                found is None
+                or (self._published[slot] > self._published[found]) == newest
+            ):
+                found = slot
+        return found
+
+    def acquire(self, timeout: Optional[float] = None) -> Optional[int]:
+        """
+        Returns a slot to write a frame into, dropping the oldest unprocessed
+        frame if no slot is free. Returns None if every slot is being
+        processed and none frees up within `timeout` seconds.
+        """
+        with self._condition:
+            slot = None
+
+            def available() -> bool:
+                nonlocal slot
+                slot = self._find(_FREE)
+                if slot is None:
+                    slot = self._find(_READY)
+                    if slot is not None:
+                        self._dropped.value += 1
+                return slot is not None
+
+            if not self._condition.wait_for(available, timeout):
+                return None
+
+            assert slot is not None
+            self._state[slot] = _WRITING
+            return slot
+
+    def publish(
+        self, slot: int, timestamp: float = 0.0, capture_time: float = 0.0
+    ) -> None:
+        """
+        Hands a written slot to the consumers.
+        """
+        with self._condition:
+            self._num_published.value += 1
+            self._published[slot] = self._num_published.value
+            self._timestamp[slot] = timestamp
+            self._capture_time[slot] = capture_time
+            self._state[slot] = _READY
+            self._condition.notify_all()
+
+    def write(
+        self,
+        frame: NDArray[Any, UInt8],
+        timestamp: float = 0.0,
+        capture_time: float = 0.0,
+    ) -> bool:
+        """
+        Copies a frame into a slot and publishes it. Returns False if no
+        slot was available.
+        """
+        slot = self.acquire(timeout=0)
+        if slot is None:
+            return False
+
+        self.frame(slot)[...] = frame
+        self.publish(slot, timestamp, capture_time)
+        return True
+
+    def get(
+        self, timeout: Optional[float] = None, newest: bool = False
+    ) -> Optional[int]:
+        """
+        Returns the oldest published slot, or None if nothing was published
+        within `timeout` seconds. The slot must be `release`d afterwards.
+
+        With `newest`, returns the most recently published slot instead and
+        drops every older frame still waiting, so consumers never work on
+        a frame when a fresher one is available.
+        """
+        with self._condition:
+            slot = None
+
+            def available() -> bool:
+                nonlocal slot
+                slot = self._find(_READY, newest)
+                return slot is not None
+
+            if not self._condition.wait_for(available, timeout):
+                return None
+
+            assert slot is not None
+            self._state[slot] = _READING
+
+            if newest:
+                while (stale := self._find(_READY)) is not None:
+                    self._state[stale] = _FREE
+                    self._dropped.value += 1
+                self._condition.notify_all()
+
+            return slot
+
+    def release(self, slot: int) -> None:
+        """
+        Returns a slot to the producer once its frame has been processed.
+        """
+        with self._condition:
+            self._state[slot] = _FREE
+            self._condition.notify_all()
+
+    def close(self, unlink: bool = False) -> None:
+        """
+        Detaches from the shared memory. The process that created the ring
+        should also `unlink` it once every process is done with it.
+        """
+        self._frames = None
+        self._shm.close()
+        if unlink:
+            self._shm.unlink()
@@ -0,0 +1,63 @@
+import asyncio
+import threading
+from typing import Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class LatestValue(Generic[T]):
+    """
+    Single-slot mailbox between threads and an asyncio event loop.
+
+    `put` can be called from any thread and replaces any value that was not
+    taken yet, so the consumer always gets the newest one and never works
+    through a backlog. `get` is awaited from the event loop the mailbox was
+    `attach`ed to.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._value: Optional[T] = None
+        self._full = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._event: Optional[asyncio.Event] = None
+
+        # values replaced before they were taken
+        self.dropped = 0
+
+    def attach(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        self._event = asyncio.Event()
+
+    def put(self, value: T) -> None:
+        with self._lock:
+            if self._full:
+                self.dropped += 1
+            self._value = value
+            self._full = True
+
+        if self._loop is not None and self._event is not None:
+            self._loop.call_soon_threadsafe(self._event.set)
+
+    def take(self) -> Optional[T]:
+        """
+        Takes the value without waiting, or returns None if there is none.
+        """
+        with self._lock:
+            value = self._value
+            self._value = None
+            self._full = False
+            return value
+
+    async def get(self) -> T:
+        assert self._event is not None, "attach to an event loop first"
+
+        while True:
+            with self._lock:
+                if self._full:
+                    value = self._value
+                    self._value = None
+                    self._full = False
+                    return value  # type: ignore
+                self._event.clear()
+            await self._event.wait()
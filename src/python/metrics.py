@@ -0,0 +1,220 @@
+import bisect
+import contextlib
+import http.server
+import threading
+import time
+from typing import Iterator, Optional, Sequence
+
+DEFAULT_BUCKETS = (
+    0.0001,
+    0.0002,
+    0.0005,
+    0.001,
+    0.002,
+    0.005,
+    0.01,
+    0.02,
+    0.05,
+    0.1,
+    0.2,
+    0.5,
+    1.0,
+    2.0,
+)
+"""
+Upper bounds in seconds of the timing histogram buckets, from 100 us to 2 s.
+"""
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram of durations in seconds.
+
+    Counts are kept both since startup (for Prometheus, which expects
+    cumulative counters) and since the last `window_summary`, for periodic
+    reports of recent behavior.
+    """
+
+    def __init__(self, bounds: Sequence[float] = DEFAULT_BUCKETS):
+        self.bounds = list(bounds)
+        # one more bucket for everything above the last bound
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+
+        self.window_counts = [0] * (len(self.bounds) + 1)
+        self.window_sum = 0.0
+        self.window_max = 0.0
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def observe(self, value: float) -> None:
+        bucket = bisect.bisect_left(self.bounds, value)
+        self.counts[bucket] += 1
+        self.sum += value
+        self.window_counts[bucket] += 1
+        self.window_sum += value
+        if value > self.window_max:
+            self.window_max = value
+
+    def quantile(self, q: float, counts: Optional[list[int]] = None) -> float:
+        """
+        Estimates a quantile by interpolating linearly within its bucket.
+        """
+        counts = self.counts if counts is None else counts
+        total = sum(counts)
+        if total == 0:
+            return 0.0
+
+        rank = q * total
+        seen = 0
+        for bucket, count in enumerate(counts):
+            if count and seen + count >= rank:
+                low = self.bounds[bucket - 1] if bucket > 0 else 0.0
+                # nothing better to report above the last bound
+                high = self.bounds[bucket] if bucket < len(self.bounds) else low
+                return low + (high - low) * (rank - seen) / count
+            seen += count
+        return self.bounds[-1]
+
+    def window_summary(self) -> dict[str, float]:
+        """
+        Count, mean, percentiles and max (in milliseconds) of the values
+        observed since the last call, and starts a new window.
+        """
+        counts = self.window_counts
+        count = sum(counts)
+        summary = {
+            "count": count,
+            "mean_ms": self.window_sum / count * 1000 if count else 0.0,
+            "p50_ms": self.quantile(0.5, counts) * 1000,
+            "p90_ms": self.quantile(0.9, counts) * 1000,
+            "p99_ms": self.quantile(0.99, counts) * 1000,
+            "max_ms": self.window_max * 1000,
+        }
+
+        self.window_counts = [0] * len(counts)
+        self.window_sum = 0.0
+        self.window_max = 0.0
+        return summary
+
+
+class StageMetrics:
+    """
+    Timing histograms for the stages of a processing pipeline, by name,
+    along with event counters and gauges for anything that isn't a duration.
+
+    Reports are meant to be taken every `interval` seconds, see `due`.
+    """
+
+    def __init__(self, interval: float = 5.0):
+        self.interval = interval
+        self.stages: dict[str, Histogram] = {}
+        # counts since startup and latest values, by name
+        self.counters: dict[str, int] = {}
+        self.gauges: dict[str, float] = {}
+        self._last_report = time.monotonic()
+
+    def observe(self, stage: str, seconds: float) -> None:
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = Histogram()
+        histogram.observe(seconds)
+
+    def count(self, counter: str, amount: int = 1) -> None:
+        self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def set(self, gauge: str, value: float) -> None:
+        self.gauges[gauge] = value
+
+    @contextlib.contextmanager
+    def time(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def due(self) -> bool:
+        """
+        Whether `interval` seconds have passed since the last `summary`.
+        """
+        return self.interval > 0 and (
+            time.monotonic() - self._last_report >= self.interval
+        )
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """
+        Summary of every stage since the last call, see
+        `Histogram.window_summary`. Counters (since startup) and gauges are
+        included under "counters" and "gauges" if there are any.
+        """
+        self._last_report = time.monotonic()
+        summary = {
+            stage: histogram.window_summary()
+            for stage, histogram in self.stages.items()
+        }
+        if self.counters:
+            summary["counters"] = dict(self.counters)
+        if self.gauges:
+            summary["gauges"] = dict(self.gauges)
+        return summary
+
+    def prometheus(self, prefix: str) -> str:
+        """
+        Every stage histogram since startup in the Prometheus text format,
+        as one `<prefix>_stage_seconds` histogram labelled by stage, followed
+        by a `<prefix>_<name>_total` counter or `<prefix>_<name>` gauge for
+        every counter and gauge.
+        """
+        name = f"{prefix}_stage_seconds"
+        lines = [
+            f"# HELP {name} Time spent in each processing stage.",
+            f"# TYPE {name} histogram",
+        ]
+        for stage, histogram in list(self.stages.items()):
+            cumulative = 0
+            for bound, count in zip(histogram.bounds, histogram.counts):
+                cumulative += count
+                lines.append(
+                    f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}'
+                )
+            lines.append(
+                f'{name}_bucket{{stage="{stage}",le="+Inf"}} {sum(histogram.counts)}'
+            )
+            lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {sum(histogram.counts)}')
+        for counter, value in list(self.counters.items()):
+            lines.append(f"# TYPE {prefix}_{counter}_total counter")
+            lines.append(f"{prefix}_{counter}_total {value}")
+        for gauge, value in list(self.gauges.items()):
+            lines.append(f"# TYPE {prefix}_{gauge} gauge")
+            lines.append(f"{prefix}_{gauge} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def serve_prometheus(
+    metrics: StageMetrics, port: int, prefix: str
+) -> http.server.ThreadingHTTPServer:
+    """
+    Serves `metrics` in the Prometheus text format on every path of the
+    given port, from a background thread.
+    """
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            body = metrics.prometheus(prefix).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: object) -> None:
+            # don't log every scrape
+            pass
+
+    server = http.server.ThreadingHTTPServer(("", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
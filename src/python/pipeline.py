@@ -0,0 +1,78 @@
+import queue
+import time
+from typing import Any, Callable, Generic, NamedTuple, Optional, TypeVar
+
+from nptyping import NDArray, UInt8
+
+T = TypeVar("T")
+
+Frame = NDArray[Any, UInt8]
+FrameStage = Callable[[Frame], Optional[Frame]]
+"""
+Takes a frame and returns the frame to pass on, or None to drop it.
+"""
+
+
+class FrameResult(NamedTuple):
+    """
+    What the perception processes hand back for every frame.
+    """
+
+    sequence: int
+    # capture timestamp of the frame
+    timestamp: float
+    # seconds spent in each stage
+    timings: dict[str, float]
+    # when the result was put on the queue
+    done: float
+    tags: list[Any]
+    # frame stage that dropped the frame before detection, if any
+    skipped: Optional[str] = None
+
+
+class Stages(Generic[T]):
+    """
+    Ordered, named steps that each get the output of the previous one and
+    are timed into a `timings` dict. A step returning None stops the chain,
+    so the last step in `timings` is the one that did.
+
+    The CPU pipeline uses them to preprocess frames before detection and to
+    publish results.
+    """
+
+    def __init__(self):
+        self.stages: list[tuple[str, Callable[[T], Optional[T]]]] = []
+
+    def __len__(self) -> int:
+        return len(self.stages)
+
+    def add(self, name: str, stage: Callable[[T], Optional[T]]) -> None:
+        self.stages.append((name, stage))
+
+    def run(self, value: T, timings: dict[str, float]) -> Optional[T]:
+        for name, stage in self.stages:
+            start = time.perf_counter()
+            result = stage(value)
+            timings[name] = time.perf_counter() - start
+            if result is None:
+                return None
+            value = result
+        return value
+
+
+def get_all(source: "queue.Queue[T]", timeout: Optional[float] = None) -> list[T]:
+    """
+    Blocks until at least one item is available (or `timeout` seconds pass)
+    and returns it along with every other item already waiting, so a
+    consumer wakes up once per burst instead of polling.
+    """
+    try:
+        items = [source.get(timeout=timeout)]
+    except queue.Empty:
+        return []
+
+    while True:
+        try:
+            items.append(source.get_nowait())
+        except queue.Empty:
+            return items
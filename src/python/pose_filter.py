@@ -0,0 +1,92 @@
+from typing import Any, Iterable, Optional
+
+import numpy as np
+from nptyping import Float, Int, NDArray
+
+
+class AlphaBetaFilter:
+    """
+    Constant-velocity alpha-beta filters for `num_states` independent states
+    of `dims` values each, updated and predicted a batch of rows at a time.
+
+    `angular` dimensions are headings in degrees: residuals are taken the
+    short way around the circle and values are kept in [0, 360).
+
+    A row starts over from the measurement (with zero velocity) the first
+    time it is updated, when it was last updated more than `reset_after`
+    seconds ago, and when it is updated with a different key than last time
+    (so a row can be reused for another tag).
+    """
+
+    def __init__(
+        self,
+        num_states: int,
+        dims: int,
+        alpha: float = 0.5,
+        beta: float = 0.1,
+        angular: Iterable[int] = (),
+        reset_after: float = 1.0,
+    ):
+        self.alpha = alpha
+        self.beta = beta
+        self.reset_after = reset_after
+
+        self.x = np.zeros((num_states, dims))
+        self.v = np.zeros((num_states, dims))
+        # time of the last update of each row, NaN if never updated
+        self.t = np.full(num_states, np.nan)
+        self.key = np.full(num_states, -1, dtype=np.int64)
+
+        self.angular = np.zeros(dims, dtype=bool)
+        self.angular[list(angular)] = True
+
+    def _wrap(self, values: NDArray[Any, Float], center: float) -> NDArray[Any, Float]:
+        """
+        Wraps the angular columns into [center - 180, center + 180).
+        """
+        wrapped = (values + 180.0 - center) % 360.0 - 180.0 + center
+        return np.where(self.angular, wrapped, values)
+
+    def update(
+        self,
+        rows: NDArray[Any, Int],
+        z: NDArray[Any, Float],
+        t: float,
+        keys: Optional[NDArray[Any, Int]] = None,
+    ) -> NDArray[Any, Float]:
+        """
+        Updates the given rows with measurements `z` taken at time `t`, in
+        seconds, and returns their filtered values.
+        """
+        dt = t - self.t[rows]
+        reset = ~(dt <= self.reset_after)  # also true for NaN
+        if keys is not None:
+            reset |= self.key[rows] != keys
+            self.key[rows] = keys
+
+        predicted = self.x[rows] + self.v[rows] * np.where(reset, 0.0, dt)[:, None]
+        residual = self._wrap(z - predicted, 0.0)
+
+        x = predicted + self.alpha * residual
+        v = self.v[rows] + self.beta * residual / np.where(dt > 0, dt, np.inf)[:, None]
+
+        x = np.where(reset[:, None], z, x)
+        v = np.where(reset[:, None], 0.0, v)
+
+        self.x[rows] = self._wrap(x, 180.0)
+        self.v[rows] = v
+        self.t[rows] = t
+        return self.x[rows]
+
+    def predict(self, rows: NDArray[Any, Int], t: float) -> NDArray[Any, Float]:
+        """
+        Extrapolates the given rows to time `t`.
+        """
+        dt = np.nan_to_num(t - self.t[rows])
+        return self._wrap(self.x[rows] + self.v[rows] * dt[:, None], 180.0)
+
+    def age(self, rows: NDArray[Any, Int], t: float) -> NDArray[Any, Float]:
+        """
+        Seconds since each of the given rows was last updated, inf if never.
+        """
+        return np.nan_to_num(t - self.t[rows], nan=np.inf)
@@ -0,0 +1,92 @@
+from typing import Any
+
+import numpy as np
+from nptyping import Float, NDArray
+
+MIN_VIEW_COS = 0.05
+"""
+Lower bound on the viewing angle term of a tag's weight, so tags seen almost
+edge-on still count a little rather than not at all.
+"""
+
+
+def tag_weights(
+    xyz: NDArray[Any, Float], rotation: NDArray[Any, Float]
+) -> NDArray[Any, Float]:
+    """
+    Weight of each detection for fusion, from the raw detector output.
+
+    Pose error grows roughly with the square of the distance to the tag, and
+    with how obliquely the tag is seen, so the weight is the cosine between
+    the tag normal and the line of sight over the squared distance.
+    """
+    distance_sq = np.einsum("ni,ni->n", xyz, xyz)
+    distance = np.sqrt(distance_sq)
+
+    # tag z axis expressed in the camera frame is the third column
+    normal = rotation[:, :, 2]
+    norm = np.linalg.norm(normal, axis=1) * distance
+    view_cos = np.abs(np.einsum("ni,ni->n", normal, xyz)) / np.where(norm > 0, norm, 1)
+
+    return np.clip(view_cos, MIN_VIEW_COS, 1.0) / np.maximum(distance_sq, 1e-6)
+
+
+def circular_mean_deg(
+    angles: NDArray[Any, Float], weights: NDArray[Any, Float]
+) -> float:
+    """
+    Weighted mean of angles in degrees, in [0, 360).
+    """
+    radians = np.deg2rad(angles)
+    mean = np.arctan2(
+        np.dot(weights, np.sin(radians)), np.dot(weights, np.cos(radians))
+    )
+    return float(np.rad2deg(mean) % 360.0)
+
+
+def weighted_median(
+    values: NDArray[Any, Float], weights: NDArray[Any, Float]
+) -> NDArray[Any, Float]:
+    """
+    Weighted median along the first axis, for every column at once.
+    """
+    values = values.reshape(len(values), -1)
+    order = np.argsort(values, axis=0)
+    sorted_values = np.take_along_axis(values, order, axis=0)
+    cumulative = np.cumsum(weights[order], axis=0)
+
+    # first row where the cumulative weight reaches half the total
+    index = np.argmax(cumulative >= cumulative[-1] / 2, axis=0)
+    return sorted_values[index, np.arange(values.shape[1])]
+
+
+def fuse_weighted(
+    pos_world: NDArray[Any, Float],
+    heading: NDArray[Any, Float],
+    weights: NDArray[Any, Float],
+) -> tuple[NDArray[Any, Float], float]:
+    """
+    Weighted least-squares position (the weighted mean of the per-tag
+    estimates) and weighted circular mean heading.
+    """
+    pos = np.average(pos_world, axis=0, weights=weights)
+    return pos, circular_mean_deg(heading, weights)
+
+
+def fuse_median(
+    pos_world: NDArray[Any, Float],
+    heading: NDArray[Any, Float],
+    weights: NDArray[Any, Float],
+) -> tuple[NDArray[Any, Float], float]:
+    """
+    Per-axis weighted median position and weighted median heading, which a
+    single bad detection cannot drag away.
+    """
+    pos = weighted_median(pos_world, weights)
+
+    # take the median of the heading offsets around the circular mean so
+    # headings either side of north don't average out to south
+    center = circular_mean_deg(heading, weights)
+    offsets = (heading - center + 180.0) % 360.0 - 180.0
+    offset = weighted_median(offsets, weights)[0]
+    return pos, float((center + offset) % 360.0)
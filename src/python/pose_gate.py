@@ -0,0 +1,84 @@
+from typing import Any, Optional
+
+import numpy as np
+from nptyping import Bool, Float, NDArray
+
+
+class PoseGate:
+    """
+    Rejects tags with truth data whose implied vehicle position can't be
+    right given the last accepted one, such as a false decode of another
+    tag's id.
+
+    A tag passes when its map position is within `max_range` of the last
+    position, so it could be in view, and the vehicle position it implies is
+    within `tolerance` of the last one, plus however far the vehicle could
+    have moved at `max_speed` since. Without an accepted position in the last
+    `timeout` seconds, every tag passes, so the gate can't lock itself out.
+
+    After `max_rejections` checks in a row where none of the tags pass, the
+    gate also lets every tag through once and is seeded again by the next
+    accepted position, without waiting for the timeout. As long as any tag
+    agrees with the last position, the others stay rejected.
+
+    Positions are in the units of the tag map, speeds per second.
+    """
+
+    def __init__(
+        self,
+        tolerance: float,
+        max_speed: float,
+        max_range: float,
+        timeout: float,
+        max_rejections: int = 5,
+    ):
+        self.tolerance = tolerance
+        self.max_speed = max_speed
+        self.max_range = max_range
+        self.timeout = timeout
+        self.max_rejections = max_rejections
+
+        self.position: Optional[NDArray[Any, Float]] = None
+        self.time = float("-inf")
+        # checks in a row where every tag disagreed with the position
+        self.rejections = 0
+
+    def check(
+        self,
+        tag_xyz: NDArray[Any, Float],
+        pos_world: NDArray[Any, Float],
+        now: float,
+    ) -> NDArray[Any, Bool]:
+        """
+        Returns which tags, given by their (N, 3) map positions and implied
+        vehicle positions, are consistent with the last accepted position.
+        """
+        elapsed = now - self.time
+        if self.position is None or elapsed > self.timeout:
+            return np.ones(len(pos_world), dtype=bool)
+
+        travel = self.max_speed * max(elapsed, 0.0)
+        in_view = (
+            np.hypot(tag_xyz[:, 0] - self.position[0], tag_xyz[:, 1] - self.position[1])
+            <= self.max_range + travel
+        )
+        residual = np.linalg.norm(pos_world - self.position, axis=1)
+        passed = in_view & (residual <= self.tolerance + travel)
+
+        if passed.any():
+            self.rejections = 0
+            return passed
+
+        self.rejections += 1
+        if self.rejections >= self.max_rejections:
+            self.position = None
+            self.rejections = 0
+            return np.ones(len(pos_world), dtype=bool)
+        return passed
+
+    def accept(self, position: NDArray[Any, Float], now: float) -> None:
+        """
+        Records the vehicle position computed from the tags that passed.
+        """
+        self.position = np.asarray(position, dtype=np.float64)
+        self.time = now
@@ -0,0 +1,145 @@
+import json
+from typing import Any, Union
+
+import numpy as np
+from nptyping import NDArray
+
+RAW_TAG_DTYPE = np.dtype(
+    [
+        ("tag_id", "<i8"),
+        ("xyz", "<f8", (3,)),
+        ("rotation", "<f8", (3, 3)),
+    ]
+)
+"""
+One raw detection: tag id, translation in meters and 3x3 rotation matrix.
+"""
+
+_RAW_TAG_FIELDS = ("tag_id", "x", "y", "z", "rotation")
+
+
+class RawTagDecoder:
+    """
+    Decodes avr/apriltags/raw JSON payloads straight into a NumPy structured
+    array of `RAW_TAG_DTYPE`, skipping the per-tag pydantic models.
+
+    The array is preallocated and reused for every message (growing if a
+    message has more tags than it can hold), so the result of `decode` is
+    only valid until the next call.
+    """
+
+    def __init__(self, capacity: int = 32):
+        self._buffer = np.zeros(capacity, dtype=RAW_TAG_DTYPE)
+
+    def decode(self, payload: Union[bytes, str]) -> NDArray[Any, Any]:
+        """
+        Decodes a payload. Raises a `ValueError` if it is not valid JSON or
+        does not have the shape of an `AVRAprilTagsRaw` message.
+        """
+        try:
+            tags = json.loads(payload)["apriltags"]
+            n = len(tags)
+            if n > len(self._buffer):
+                self._buffer = np.zeros(n, dtype=RAW_TAG_DTYPE)
+
+            tags_array = self._buffer[:n]
+            if n == 0:
+                return tags_array
+
+            tag_ids = [tag["tag_id"] for tag in tags]
+            tags_array["tag_id"] = tag_ids
+            tags_array["xyz"] = [(tag["x"], tag["y"], tag["z"]) for tag in tags]
+            tags_array["rotation"] = [tag["rotation"] for tag in tags]
+            # the assignment truncates fractional ids
+            fractional = np.asarray(tag_ids, dtype=np.float64) != tags_array["tag_id"]
+        except (KeyError, TypeError, OverflowError) as e:
+            raise ValueError(f"Malformed avr/apriltags/raw payload: {e}") from e
+
+        # same constraints the pydantic model enforces
+        if any(len(tag) != len(_RAW_TAG_FIELDS) for tag in tags):
+            raise ValueError("AprilTags must only have the fields of the payload")
+        if fractional.any():
+            raise ValueError("AprilTag ids must be integers")
+        if (tags_array["tag_id"] < 0).any():
+            raise ValueError("AprilTag ids must be non-negative")
+        if (np.abs(tags_array["rotation"]) > 1).any():
+            raise ValueError("AprilTag rotation values must be between -1 and 1")
+
+        return tags_array
+
+
+PACKED_HEADER_DTYPE = np.dtype(
+    [
+        ("sequence", "<u4"),
+        ("count", "<u4"),
+        ("timestamp", "<f8"),
+    ]
+)
+"""
+Header of an avr/apriltags/raw/packed payload. `timestamp` is the frame
+capture time in seconds since the epoch, `sequence` increments every frame.
+"""
+
+PACKED_TAG_DTYPE = np.dtype(
+    [
+        ("tag_id", "<u4"),
+        ("xyz", "<f4", (3,)),
+        # column-major, as returned by nvAprilTagsDetect
+        ("rotation", "<f4", (3, 3)),
+    ]
+)
+"""
+One tag record of an avr/apriltags/raw/packed payload. Must match
+`PackedTag` in avrapriltags.cpp.
+"""
+
+
+def decode_packed(payload: bytes) -> tuple[Any, NDArray[Any, Any]]:
+    """
+    Decodes an avr/apriltags/raw/packed payload into its header and an array
+    of `PACKED_TAG_DTYPE` records, without copying. Use `packed_rotation` to
+    get the rotations as row-major matrices.
+
+    Raises a `ValueError` if the payload size doesn't match its header.
+    """
+    if len(payload) < PACKED_HEADER_DTYPE.itemsize:
+        raise ValueError("Packed AprilTag payload is shorter than its header")
+
+    header = np.frombuffer(payload, dtype=PACKED_HEADER_DTYPE, count=1)[0]
+    expected = PACKED_HEADER_DTYPE.itemsize + int(header["count"]) * (
+        PACKED_TAG_DTYPE.itemsize
+    )
+    if len(payload) != expected:
+        raise ValueError(
+            f"Packed AprilTag payload is {len(payload)} bytes, expected {expected}"
+        )
+
+    tags = np.frombuffer(
+        payload,
+        dtype=PACKED_TAG_DTYPE,
+        count=int(header["count"]),
+        offset=PACKED_HEADER_DTYPE.itemsize,
+    )
+    return header, tags
+
+
+def packed_rotation(tags: NDArray[Any, Any]) -> NDArray[Any, Any]:
+    """
+    Row-major view of the rotation matrices of packed tag records.
+    """
+    return np.swapaxes(tags["rotation"], 1, 2)
+
+
+def encode_packed(
+    tags: NDArray[Any, Any], sequence: int = 0, timestamp: float = 0.0
+) -> bytes:
+    """
+    Encodes an array of `RAW_TAG_DTYPE` detections in the packed format.
+    This is what avrapriltags does, and is mostly useful for testing.
+    """
+    header = np.array([(sequence, len(tags), timestamp)], dtype=PACKED_HEADER_DTYPE)
+    packed = np.zeros(len(tags), dtype=PACKED_TAG_DTYPE)
+    packed["tag_id"] = tags["tag_id"]
+    packed["xyz"] = tags["xyz"]
+    packed["rotation"] = np.swapaxes(tags["rotation"], 1, 2)
+    return header.tobytes() + packed.tobytes()
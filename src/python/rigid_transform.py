@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+from typing import Any, Optional
+
+import numpy as np
+import transforms3d as t3d
+from nptyping import Float, NDArray
+
+
+class RigidTransform:
+    """
+    A homogeneous transformation that is only a rotation followed by a
+    translation (no scale or shear), stored as the rotation matrix and
+    translation vector rather than a 4x4 matrix.
+
+    Because there is no scale or shear, the inverse and composition have
+    closed forms and never need `t3d.affines.decompose44`.
+
+    `R` and `t` may also be stacks of shape (N, 3, 3) and (N, 3), in which
+    case every operation is applied to all N transforms at once, with the
+    usual NumPy broadcasting against single transforms.
+    """
+
+    __slots__ = ("R", "t")
+
+    def __init__(self, R: NDArray[Any, Float], t: NDArray[Any, Float]):
+        self.R = R
+        self.t = t
+
+    @classmethod
+    def identity(cls, n: Optional[int] = None) -> RigidTransform:
+        if n is None:
+            return cls(np.eye(3), np.zeros(3))
+        return cls(np.tile(np.eye(3), (n, 1, 1)), np.zeros((n, 3)))
+
+    @classmethod
+    def from_euler(
+        cls, xyz: tuple[float, float, float], rpy: tuple[float, float, float]
+    ) -> RigidTransform:
+        """
+        Builds a transform from a position and roll, pitch, yaw in radians,
+        using the same axes convention as the config file.
+        """
+        R = t3d.euler.euler2mat(rpy[0], rpy[1], rpy[2], axes="rxyz")
+        return cls(R, np.asarray(xyz, dtype=np.float64))
+
+    @classmethod
+    def from_matrix(cls, H: NDArray[Any, Float]) -> RigidTransform:
+        """
+        Splits a (stack of) 4x4 homogeneous matrices. The upper-left 3x3 is
+        assumed to already be a pure rotation.
+        """
+        return cls(H[..., :3, :3].copy(), H[..., :3, 3].copy())
+
+    def as_matrix(self) -> NDArray[Any, Float]:
+        H = np.zeros(self.R.shape[:-2] + (4, 4))
+        H[..., :3, :3] = self.R
+        H[..., :3, 3] = self.t
+        H[..., 3, 3] = 1
+        return H
+
+    def inv(self) -> RigidTransform:
+        """
+        Closed-form inverse: (R, t)^-1 = (R^T, -R^T t).
+        """
+        R_t = np.swapaxes(self.R, -1, -2)
+        return RigidTransform(R_t, -np.einsum("...ij,...j->...i", R_t, self.t))
+
+    def apply(self, points: NDArray[Any, Float]) -> NDArray[Any, Float]:
+        """
+        Transforms (a stack of) 3D points.
+        """
+        return np.einsum("...ij,...j->...i", self.R, points) + self.t
+
+    def __matmul__(self, other: RigidTransform) -> RigidTransform:
+        """
+        Composition, equivalent to multiplying the 4x4 matrices
+        `self.as_matrix() @ other.as_matrix()`.
+        """
+        return RigidTransform(self.R @ other.R, self.apply(other.t))
+
+    def __len__(self) -> int:
+        if self.R.ndim == 2:
+            raise TypeError("A single RigidTransform has no length")
+        return self.R.shape[0]
+
+    def __getitem__(self, index: Any) -> RigidTransform:
+        return RigidTransform(self.R[index], self.t[index])
+
+
+def yaw_rotations(
+    cos_yaw: NDArray[Any, Float], sin_yaw: NDArray[Any, Float]
+) -> NDArray[Any, Float]:
+    """
+    Builds a stack of rotations about the z axis from the cosine and sine of
+    the yaw angles, without going through trigonometric functions.
+    """
+    R = np.zeros(cos_yaw.shape + (3, 3))
+    R[..., 0, 0] = cos_yaw
+    R[..., 0, 1] = -sin_yaw
+    R[..., 1, 0] = sin_yaw
+    R[..., 1, 1] = cos_yaw
+    R[..., 2, 2] = 1
+    return R
@@ -0,0 +1,149 @@
+from typing import Any, Sequence
+
+import numpy as np
+from nptyping import Float, NDArray
+
+Region = tuple[int, int, int, int]
+"""
+Image region as (x0, y0, x1, y1) pixel bounds, end exclusive.
+"""
+
+
+def padded_regions(
+    corners: Sequence[NDArray[Any, Float]],
+    frame_shape: tuple[int, int],
+    padding: float = 0.5,
+    min_padding: int = 24,
+) -> list[Region]:
+    """
+    Crops around each set of tag corners, padded by `padding` times the tag
+    size (at least `min_padding` pixels) and clipped to the frame. Overlapping
+    crops are merged so no tag is detected twice.
+    """
+    height, width = frame_shape
+    boxes = []
+    for tag_corners in corners:
+        low = tag_corners.min(axis=0)
+        high = tag_corners.max(axis=0)
+        pad = max(min_padding, padding * float((high - low).max()))
+        boxes.append(
+            [
+                max(0, int(low[0] - pad)),
+                max(0, int(low[1] - pad)),
+                min(width, int(np.ceil(high[0] + pad))),
+                min(height, int(np.ceil(high[1] + pad))),
+            ]
+        )
+
+    # merge until no two boxes overlap
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                a, b = boxes[i], boxes[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    boxes[i] = [
+                        min(a[0], b[0]),
+                        min(a[1], b[1]),
+                        max(a[2], b[2]),
+                        max(a[3], b[3]),
+                    ]
+                    del boxes[j]
+                    merged = True
+                    break
+            if merged:
+                break
+
+    return [(x0, y0, x1, y1) for x0, y0, x1, y1 in boxes if x1 > x0 and y1 > y0]
+
+
+class RoiTracker:
+    """
+    Predicts where tags will be in the next frame from where they were last
+    seen, so detection can run on small crops around them instead of on the
+    whole frame.
+
+    Each tag's image position is extrapolated with a constant velocity. A full
+    frame detection (keyframe) is asked for every `keyframe_interval` frames,
+    whenever a tracked tag is lost, and while nothing is being tracked.
+    """
+
+    def __init__(
+        self,
+        frame_shape: tuple[int, int],
+        keyframe_interval: int = 10,
+        padding: float = 0.5,
+        min_padding: int = 24,
+    ):
+        self.height, self.width = frame_shape
+        self.keyframe_interval = keyframe_interval
+        # crop margin around a predicted tag, as a fraction of its size
+        self.padding = padding
+        self.min_padding = min_padding
+
+        self._frame = 0
+        self._last_keyframe = 0
+        self._lost = True
+        # tag id -> (corners, pixel velocity per frame, frame last seen)
+        self._tracks: dict[int, tuple[NDArray[Any, Float], NDArray[Any, Float], int]]
+        self._tracks = {}
+
+    def needs_keyframe(self) -> bool:
+        return (
+            self._lost
+            or not self._tracks
+            or self._frame + 1 - self._last_keyframe >= self.keyframe_interval
+        )
+
+    def predict(self, tag_id: int) -> NDArray[Any, Float]:
+        """
+        Predicted corners of a tracked tag in the next frame.
+        """
+        corners, velocity, seen = self._tracks[tag_id]
+        return corners + velocity * (self._frame + 1 - seen)
+
+    def regions(self) -> list[Region]:
+        """
+        Padded crops around every tracked tag for the next frame, with
+        overlapping crops merged so no tag is detected twice.
+        """
+        return padded_regions(
+            [self.predict(tag_id) for tag_id in self._tracks],
+            (self.height, self.width),
+            self.padding,
+            self.min_padding,
+        )
+
+    def update(
+        self,
+        detections: Sequence[tuple[int, NDArray[Any, Float]]],
+        keyframe: bool,
+    ) -> None:
+        """
+        Records the (tag id, full-frame corners) detected in the current frame.
+        """
+        self._frame += 1
+        seen = {tag_id for tag_id, _ in detections}
+
+        if keyframe:
+            self._last_keyframe = self._frame
+            # forget tags that the full frame detection didn't find
+            self._tracks = {
+                tag_id: track
+                for tag_id, track in self._tracks.items()
+                if tag_id in seen
+            }
+            self._lost = False
+        else:
+            self._lost = any(tag_id not in seen for tag_id in self._tracks)
+
+        for tag_id, corners in detections:
+            corners = np.asarray(corners, dtype=np.float64)
+            velocity = np.zeros(2)
+            # a tag found again after it was lost could have moved anywhere in
+            # between, so its motion is only measured between frames in a row
+            if tag_id in self._tracks and self._tracks[tag_id][2] == self._frame - 1:
+                last_corners = self._tracks[tag_id][0]
+                velocity = corners.mean(axis=0) - last_corners.mean(axis=0)
+            self._tracks[tag_id] = (corners, velocity, self._frame)
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import contextlib
+import csv
+import hashlib
+import json
+import os
+from typing import Any, Mapping, Optional
+
+import numpy as np
+from loguru import logger
+from nptyping import Float, Int, NDArray
+
+try:
+    from rigid_transform import RigidTransform
+except ImportError:
+    from .rigid_transform import RigidTransform
+
+# bump when TAG_MAP_DTYPE or how rows are computed changes, so old cache
+# files are not used
+_CACHE_VERSION = 1
+
+TAG_MAP_DTYPE = np.dtype(
+    [
+        ("tag_id", "<i8"),
+        ("xyz", "<f8", (3,)),
+        ("rpy", "<f8", (3,)),
+        # rotation of H_tag_aeroRef, precomputed from rpy
+        ("R", "<f8", (3, 3)),
+    ]
+)
+
+CSV_COLUMNS = ("tag_id", "x", "y", "z", "roll", "pitch", "yaw")
+
+
+class TagMap:
+    """
+    Truth data about where tags are positioned in the world, with one row
+    per tag: its id, position, roll, pitch and yaw (in the units and axes of
+    config.TAG_TRUTH) and the rotation matrix they make.
+
+    Rows are kept in the order the tags were given. `rows` looks up the row
+    of tag ids through a dense index.
+    """
+
+    def __init__(self, records: NDArray[Any, Any]):
+        self.records = records
+        self.tag_ids: NDArray[Any, Int] = records["tag_id"]
+        self.xyz: NDArray[Any, Float] = records["xyz"]
+        self.rpy: NDArray[Any, Float] = records["rpy"]
+
+        if len(np.unique(self.tag_ids)) != len(self.tag_ids):
+            raise ValueError("Tag map has duplicate tag ids")
+        if (self.tag_ids < 0).any():
+            raise ValueError("Tag map has negative tag ids")
+
+        # dense tag id -> row lookup, -1 when the id is not in the map
+        self.row_of_id = np.full(
+            int(self.tag_ids.max(initial=-1)) + 1, -1, dtype=np.int64
+        )
+        self.row_of_id[self.tag_ids] = np.arange(len(self.tag_ids))
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    @classmethod
+    def from_truth(cls, truth: Mapping[Any, Mapping[str, Any]]) -> TagMap:
+        """
+        Builds a map from a dict of tag id -> {"xyz": ..., "rpy": ...},
+        the format of config.TAG_TRUTH.
+        """
+        records = np.zeros(len(truth), dtype=TAG_MAP_DTYPE)
+        for row, (tag_id, tag_data) in enumerate(truth.items()):
+            records["tag_id"][row] = int(tag_id)
+            records["xyz"][row] = tag_data["xyz"]
+            records["rpy"][row] = tag_data["rpy"]
+            records["R"][row] = RigidTransform.from_euler(
+                tag_data["xyz"], tag_data["rpy"]
+            ).R
+        return cls(records)
+
+    @classmethod
+    def load(cls, path: str, cache_dir: Optional[str] = None) -> TagMap:
+        """
+        Loads a map from a JSON file in the format of config.TAG_TRUTH, or a
+        CSV file with the columns in `CSV_COLUMNS`.
+
+        With a `cache_dir`, the parsed rows are saved there as a .npy file
+        keyed by the contents of the map file, and memory mapped instead of
+        parsed again the next time the same map is loaded.
+        """
+        with open(path, "rb") as f:
+            content = f.read()
+
+        cache_path = None
+        if cache_dir is not None:
+            key = hashlib.sha1(content + repr(_CACHE_VERSION).encode()).hexdigest()[:16]
+            cache_path = os.path.join(cache_dir, f"tag_map_{key}.npy")
+            if os.path.exists(cache_path):
+                return cls(np.load(cache_path, mmap_mode="r"))
+
+        if path.lower().endswith(".csv"):
+            tag_map = cls.from_truth(_parse_csv(content.decode()))
+        else:
+            tag_map = cls.from_truth(json.loads(content))
+
+        if cache_path is not None:
+            # the cache only saves parsing next time, so a read-only or full
+            # disk is no reason not to use the map. It is written under
+            # another name first, so a failed write never leaves a truncated
+            # cache file to load
+            partial_path = f"{cache_path}.tmp"
+            try:
+                os.makedirs(cache_dir, exist_ok=True)  # type: ignore
+                with open(partial_path, "wb") as f:
+                    np.save(f, tag_map.records)
+                os.replace(partial_path, cache_path)
+                logger.info(f"Cached tag map in {cache_path}")
+            except OSError as e:
+                logger.warning(f"Could not cache tag map in {cache_dir}: {e}")
+                with contextlib.suppress(OSError):
+                    os.remove(partial_path)
+
+        return tag_map
+
+    def rows(self, tag_ids: NDArray[Any, Int]) -> NDArray[Any, Int]:
+        """
+        Returns the row of each tag id, or -1 if it is not in the map.
+        """
+        in_range = (tag_ids >= 0) & (tag_ids < len(self.row_of_id))
+        return np.where(in_range, self.row_of_id[np.where(in_range, tag_ids, 0)], -1)
+
+    def transforms(self) -> RigidTransform:
+        """
+        H_tag_aeroRef of every tag, stacked in row order.
+        """
+        return RigidTransform(
+            np.array(self.records["R"]).reshape(-1, 3, 3),
+            np.array(self.xyz).reshape(-1, 3),
+        )
+
+
+def _parse_csv(text: str) -> dict[int, dict[str, tuple[float, float, float]]]:
+    reader = csv.DictReader(text.splitlines())
+    missing = set(CSV_COLUMNS) - set(reader.fieldnames or ())
+    if missing:
+        raise ValueError(f"Tag map is missing columns: {', '.join(sorted(missing))}")
+
+    truth = {}
+    for row in reader:
+        tag_id = int(row["tag_id"])
+        if tag_id in truth:
+            raise ValueError(f"Tag map has tag id {tag_id} more than once")
+        truth[tag_id] = {
+            "xyz": (float(row["x"]), float(row["y"]), float(row["z"])),
+            "rpy": (float(row["roll"]), float(row["pitch"]), float(row["yaw"])),
+        }
+    return truth
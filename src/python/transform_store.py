@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+from typing import Any, Iterable, Optional
+
+import numpy as np
+from nptyping import Bool, Int, NDArray
+
+try:
+    from rigid_transform import RigidTransform
+except ImportError:
+    from .rigid_transform import RigidTransform
+
+
+class TransformStore:
+    """
+    Preallocated storage for one rigid transform per tag id, indexed by slot
+    rather than by string keys.
+
+    Ids in `known_ids` own the first `len(known_ids)` slots, in order, for the
+    lifetime of the store. Any other id shares a pool of `unknown_slots`
+    slots that are recycled least-recently-updated first, so the store never
+    grows no matter how many different ids are reported. Ids above
+    `max_tag_id` are never stored.
+    """
+
+    def __init__(self, known_ids: Iterable[int], unknown_slots: int, max_tag_id: int):
+        known_ids = list(known_ids)
+        self.num_known = len(known_ids)
+        capacity = self.num_known + unknown_slots
+
+        self.R = np.tile(np.eye(3), (capacity, 1, 1))
+        self.t = np.zeros((capacity, 3))
+
+        # dense tag id -> slot lookup, -1 when the id has no slot
+        self.slot_of_id = np.full(
+            max(max_tag_id, *known_ids, 0) + 1, -1, dtype=np.int64
+        )
+        # slot -> tag id, -1 when the slot is free
+        self.id_of_slot = np.full(capacity, -1, dtype=np.int64)
+        # update counter per slot, used to pick which unknown slot to recycle
+        self.last_update = np.zeros(capacity, dtype=np.int64)
+        self._updates = 0
+
+        self.slot_of_id[known_ids] = np.arange(self.num_known)
+        self.id_of_slot[: self.num_known] = known_ids
+
+    def slots(self, tag_ids: NDArray[Any, Int]) -> NDArray[Any, Int]:
+        """
+        Returns the slot of each tag id, or -1 if it has none.
+        """
+        in_range = (tag_ids >= 0) & (tag_ids < len(self.slot_of_id))
+        return np.where(in_range, self.slot_of_id[np.where(in_range, tag_ids, 0)], -1)
+
+    def is_known(self, slots: NDArray[Any, Int]) -> NDArray[Any, Bool]:
+        """
+        Returns which slots belong to ids given in `known_ids`.
+        """
+        return (slots >= 0) & (slots < self.num_known)
+
+    def get(self, tag_id: int) -> Optional[RigidTransform]:
+        slot = int(self.slots(np.asarray([tag_id]))[0])
+        if slot < 0:
+            return None
+        return RigidTransform(self.R[slot].copy(), self.t[slot].copy())
+
+    def update(self, tag_ids: NDArray[Any, Int], tf: RigidTransform) -> None:
+        """
+        Stores the stacked transforms `tf` for `tag_ids`, assigning unknown
+        ids a recycled slot if they don't have one yet.
+        """
+        self._updates += 1
+        slots = self.slots(tag_ids)
+        # so ids in this update are not recycled to make room for each other
+        self.last_update[slots[slots >= 0]] = self._updates
+
+        # ids that are storable but don't have a slot yet
+        missing = (slots < 0) & (tag_ids >= 0) & (tag_ids < len(self.slot_of_id))
+        if missing.any():
+            self._assign(tag_ids[missing])
+            slots = self.slots(tag_ids)
+
+        stored = slots >= 0
+        self.R[slots[stored]] = tf.R[stored]
+        self.t[slots[stored]] = tf.t[stored]
+        self.last_update[slots[stored]] = self._updates
+
+    def _assign(self, tag_ids: NDArray[Any, Int]) -> None:
+        tag_ids = np.unique(tag_ids)
+        pool = len(self.id_of_slot) - self.num_known
+        if pool == 0:
+            return
+
+        # if a single frame has more new ids than the pool, keep the first ones
+        tag_ids = tag_ids[:pool]
+
+        # least recently updated unknown slots
+        ages = self.last_update[self.num_known :]
+        if len(tag_ids) < pool:
+            oldest = np.argpartition(ages, len(tag_ids))[: len(tag_ids)]
+        else:
+            oldest = np.arange(pool)
+        slots = oldest + self.num_known
+
+        evicted = self.id_of_slot[slots]
+        self.slot_of_id[evicted[evicted >= 0]] = -1
+
+        self.slot_of_id[tag_ids] = slots
+        self.id_of_slot[slots] = tag_ids
+        self.R[slots] = np.eye(3)
+        self.t[slots] = 0
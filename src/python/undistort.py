@@ -0,0 +1,137 @@
+import hashlib
+import os
+from typing import Any, Optional, Sequence
+
+import cv2
+import numpy as np
+from loguru import logger
+from nptyping import Float, NDArray, UInt8
+
+# bump when the way maps are built changes, so old cache files are not used
+_MAP_VERSION = 1
+
+
+def camera_matrix(camera_params: Sequence[float]) -> NDArray[Any, Any]:
+    """
+    3x3 intrinsic matrix from (fx, fy, cx, cy).
+    """
+    fx, fy, cx, cy = camera_params
+    return np.array([[fx, 0.0, cx], [0.0, fy, cy], [0.0, 0.0, 1.0]])
+
+
+def undistort_points(
+    points: NDArray[Any, Float],
+    camera_params: Sequence[float],
+    distortion: Sequence[float],
+) -> NDArray[Any, Float]:
+    """
+    Fisheye (equidistant) undistortion of pixel coordinates of any shape
+    (..., 2), keeping the same camera matrix like `UndistortMap` does.
+    """
+    K = camera_matrix(camera_params)
+    flat = np.ascontiguousarray(points, dtype=np.float64).reshape(-1, 1, 2)
+    if not len(flat):
+        return flat.reshape(points.shape)
+    undistorted = cv2.fisheye.undistortPoints(
+        flat, K, np.array(distortion, dtype=np.float64), P=K
+    )
+    return undistorted.reshape(points.shape)
+
+
+def solve_square_poses(
+    corners: NDArray[Any, Float], camera_params: Sequence[float], tag_size: float
+) -> tuple[NDArray[Any, Float], NDArray[Any, Float]]:
+    """
+    Poses of square tags from their (N, 4, 2) undistorted corners, in the
+    order and convention of the apriltag detector's pose_R and pose_t.
+    Returns (N, 3, 3) rotations and (N, 3, 1) translations.
+    """
+    half = tag_size / 2
+    # corner order of the apriltag detections, in the tag frame
+    object_points = np.array(
+        [[-half, half, 0.0], [half, half, 0.0], [half, -half, 0.0], [-half, -half, 0.0]]
+    )
+    K = camera_matrix(camera_params)
+
+    rotations = np.empty((len(corners), 3, 3))
+    translations = np.empty((len(corners), 3, 1))
+    for index, image_points in enumerate(corners):
+        _, rvec, tvec = cv2.solvePnP(
+            object_points,
+            np.asarray(image_points, dtype=np.float64),
+            K,
+            None,
+            flags=cv2.SOLVEPNP_IPPE_SQUARE,
+        )
+        rotations[index] = cv2.Rodrigues(rvec)[0]
+        translations[index] = tvec
+    return rotations, translations
+
+
+class UndistortMap:
+    """
+    Fisheye (equidistant) undistortion of whole frames with precomputed
+    fixed-point remap tables, the CPU equivalent of the VPI remap in
+    undistort.cpp.
+
+    Undistorted frames keep the same camera matrix, so detections on them
+    use the same camera parameters. The tables only depend on the intrinsics,
+    distortion coefficients and resolution, and are cached in `cache_dir`
+    under a key made from them, so they are built once per camera.
+    """
+
+    def __init__(
+        self,
+        camera_params: Sequence[float],
+        distortion: Sequence[float],
+        res: tuple[int, int],
+        cache_dir: Optional[str] = None,
+    ):
+        self.camera_params = tuple(camera_params)
+        self.distortion = tuple(distortion)
+        self.res = res
+
+        path = None
+        if cache_dir is not None:
+            path = os.path.join(cache_dir, f"undistort_{self.key()}.npz")
+
+        if path is not None and os.path.exists(path):
+            with np.load(path) as maps:
+                self.map1, self.map2 = maps["map1"], maps["map2"]
+        else:
+            self.map1, self.map2 = self.build()
+            if path is not None:
+                os.makedirs(cache_dir, exist_ok=True)  # type: ignore
+                np.savez(path, map1=self.map1, map2=self.map2)
+                logger.info(f"Cached undistortion maps in {path}")
+
+        self._out: Optional[NDArray[Any, UInt8]] = None
+
+    def key(self) -> str:
+        """
+        Identifies the maps of this camera and resolution.
+        """
+        data = repr((_MAP_VERSION, self.camera_params, self.distortion, self.res))
+        return hashlib.sha1(data.encode()).hexdigest()[:16]
+
+    def build(self) -> tuple[NDArray[Any, Any], NDArray[Any, Any]]:
+        K = camera_matrix(self.camera_params)
+        # CV_16SC2 gives integer pixel coordinates plus a table of
+        # interpolation weights, which remap handles much faster than floats
+        return cv2.fisheye.initUndistortRectifyMap(
+            K,
+            np.array(self.distortion, dtype=np.float64),
+            np.eye(3),
+            K,
+            self.res,
+            cv2.CV_16SC2,
+        )
+
+    def apply(self, frame: NDArray[Any, UInt8]) -> NDArray[Any, UInt8]:
+        """
+        Undistorts a frame into a buffer reused between calls, so the result
+        is only valid until the next one.
+        """
+        if self._out is None or self._out.shape != frame.shape:
+            self._out = np.empty_like(frame)
+        return cv2.remap(frame, self.map1, self.map2, cv2.INTER_LINEAR, dst=self._out)  # type: ignore
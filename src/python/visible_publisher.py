@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from apriltag_processor import TagBatch
+
+
+class VisibleThrottle:
+    """
+    Decides which frames' visible tags get published.
+
+    With a `max_rate`, frames arriving less than `1 / max_rate` seconds after
+    the last published one are skipped. With `deltas_only`, so are frames
+    identical to the last published one, which includes every empty frame
+    after the first.
+    """
+
+    def __init__(self):
+        self._last_time = float("-inf")
+        self._last_key: Optional[bytes] = None
+
+    def allow(
+        self, batch: TagBatch, now: float, max_rate: float, deltas_only: bool
+    ) -> bool:
+        if max_rate > 0 and now - self._last_time < 1 / max_rate:
+            return False
+
+        if deltas_only:
+            key = b"".join(array.tobytes() for array in batch)
+            if key == self._last_key:
+                return False
+            self._last_key = key
+
+        self._last_time = now
+        return True
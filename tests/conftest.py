@@ -22,6 +22,7 @@ def config(mocker: MockerFixture) -> None:
     mocker.patch(
         "src.python.config.TAG_TRUTH", {0: {"rpy": (0, 0, 0), "xyz": (0, 0, 0)}}
     )
+    mocker.patch("src.python.config.TAG_MAP_PATH", None)
 
 
 @pytest.fixture
@@ -1,6 +1,10 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Optional
+import asyncio
+import json
+import math
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Optional
 
 import numpy as np
 import pytest
@@ -13,15 +17,32 @@ from bell.avr.mqtt.payloads import (
     AVRAprilTagsVisibleApriltagsAbsolutePosition,
     AVRAprilTagsVisibleApriltagsRelativePosition,
 )
-from nptyping import Float, NDArray, Shape
+from pytest_mock.plugin import MockerFixture
 
 if TYPE_CHECKING:
     from src.python.apriltag_processor import AprilTagModule
 
 
+def approx_payload(value: Any) -> Any:
+    """
+    A dumped payload with every float wrapped in `pytest.approx`, which
+    doesn't support nested dicts and lists itself.
+    """
+    if isinstance(value, dict):
+        return {key: approx_payload(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [approx_payload(item) for item in value]
+    if isinstance(value, float):
+        return pytest.approx(value)
+    return value
+
+
 def test_setup_transforms(apriltag_module: AprilTagModule) -> None:
-    expected = {
-        "H_aeroBody_cam": np.array(
+    apriltag_module.setup_transforms()
+
+    assert np.allclose(
+        apriltag_module.H_aeroBody_cam.as_matrix(),
+        np.array(
             [
                 [6.123234e-17, 1.000000e00, 0.000000e00, -1.000000e01],
                 [-1.000000e00, 6.123234e-17, -0.000000e00, 1.500000e01],
@@ -29,27 +50,15 @@ def test_setup_transforms(apriltag_module: AprilTagModule) -> None:
                 [0.000000e00, 0.000000e00, 0.000000e00, 1.000000e00],
             ]
         ),
-        "H_tag_0_aeroRef": np.array(
-            [
-                [1.0, 0.0, 0.0, 0.0],
-                [0.0, 1.0, 0.0, 0.0],
-                [0.0, 0.0, 1.0, 0.0],
-                [0.0, 0.0, 0.0, 1.0],
-            ]
-        ),
-        "H_tag_0_cam": np.array(
-            [
-                [1.0, 0.0, 0.0, 0.0],
-                [0.0, 1.0, 0.0, 0.0],
-                [0.0, 0.0, 1.0, 0.0],
-                [0.0, 0.0, 0.0, 1.0],
-            ]
-        ),
-    }
+    )
 
-    apriltag_module.setup_transforms()
-    for k, v in expected.items():
-        assert np.allclose(apriltag_module.tm[k], v)
+    slot = apriltag_module.H_tag_cam.slots(np.array([0]))[0]
+    assert apriltag_module.H_tag_cam.is_known(slot)
+    assert np.allclose(apriltag_module.H_tag_aeroRef[slot].as_matrix(), np.eye(4))
+
+    H_tag_0_cam = apriltag_module.H_tag_cam.get(0)
+    assert H_tag_0_cam is not None
+    assert np.allclose(H_tag_0_cam.as_matrix(), np.eye(4))
 
 
 @pytest.mark.parametrize(
@@ -126,14 +135,19 @@ def test_on_apriltag_message(
     expected_selected: Optional[AVRAprilTagsVehiclePosition],
 ) -> None:
     apriltag_module.on_apriltag_message(payload)
+    sent = {
+        call.args[0]: call.args[1]
+        for call in apriltag_module.send_message.call_args_list
+    }
 
-    apriltag_module.send_message.assert_any_call(
-        "avr/apriltags/visible", expected_visible
+    # only float rounding may differ
+    assert sent["avr/apriltags/visible"].model_dump() == approx_payload(
+        expected_visible.model_dump()
     )
 
     if expected_selected is not None:
-        apriltag_module.send_message.assert_any_call(
-            "avr/apriltags/vehicle_position", expected_selected
+        assert sent["avr/apriltags/vehicle_position"].model_dump() == approx_payload(
+            expected_selected.model_dump()
         )
 
 
@@ -164,58 +178,6 @@ def test_world_angle_to_tag(
     assert pytest.approx(apriltag_module.world_angle_to_tag(pos, tag_id)) == expected
 
 
-@pytest.mark.parametrize(
-    "H, expected",
-    [
-        (
-            np.array(
-                [
-                    [1.0, 0.0, 0.0, 0.0],
-                    [0.0, 1.0, 0.0, 0.0],
-                    [0.0, 0.0, 1.0, 0.0],
-                    [0.0, 0.0, 0.0, 1.0],
-                ]
-            ),
-            np.array(
-                [
-                    [1.0, 0.0, 0.0, 0.0],
-                    [0.0, 1.0, 0.0, 0.0],
-                    [0.0, 0.0, 1.0, 0.0],
-                    [0.0, 0.0, 0.0, 1.0],
-                ]
-            ),
-        ),
-        (
-            np.array(
-                [
-                    [1.0, 0.0, 1.0, 0.0],
-                    [0.0, 1.0, 0.0, 1.0],
-                    [1.0, 0.0, 1.0, 0.0],
-                    [0.0, 1.0, 0.0, 1.0],
-                ]
-            ),
-            np.array(
-                [
-                    [0.70710678, 0.0, 0.70710678, 0.0],
-                    [0.0, 1.0, 0.0, -1.0],
-                    [0.70710678, 0.0, 0.70710678, 0.0],
-                    [0.0, 0.0, 0.0, 1.0],
-                ]
-            ),
-        ),
-    ],
-)
-def test_H_inv(
-    apriltag_module: AprilTagModule,
-    H: NDArray[Shape["4, 4"], Float],
-    expected: NDArray[Shape["4, 4"], Float],
-) -> None:
-    import pprint
-
-    pprint.pprint(apriltag_module.H_inv(H))
-    assert np.allclose(apriltag_module.H_inv(H), expected)
-
-
 @pytest.mark.parametrize(
     "tag, expected",
     [
@@ -232,7 +194,7 @@ def test_H_inv(
                 pytest.approx(215.23243250030885),
                 310.0,
                 pytest.approx(59.264512298079914),
-                np.array([-215.20026451, 3.72104204, -310.0]),
+                pytest.approx((110.0, 185.0, -310.0)),
                 pytest.approx((110.0, 185.0, -310.0)),
                 pytest.approx(90.0),
             ),
@@ -260,9 +222,582 @@ def test_H_inv(
 def test_handle_tag(
     apriltag_module: AprilTagModule, tag: AVRAprilTagsRawApriltags, expected: tuple
 ) -> None:
-    result = apriltag_module.handle_tag(tag)
+    batch = apriltag_module.handle_tags(*apriltag_module.stack_tags([tag]))
+    pos_world = batch.pos_world[0].tolist() if batch.has_world[0] else None
+    result = (
+        batch.tag_id[0],
+        batch.horizontal_distance[0],
+        batch.vertical_distance[0],
+        batch.angle[0],
+        pos_world,
+        batch.pos_rel[0].tolist(),
+        batch.heading[0],
+    )
     for r_i, ex_i in zip(result, expected):
-        if isinstance(ex_i, np.ndarray):
-            np.allclose(r_i, ex_i)  # type: ignore
-        else:
-            assert r_i == ex_i
+        assert r_i == ex_i
+
+
+@pytest.mark.parametrize(
+    "tags",
+    [
+        [],
+        [
+            AVRAprilTagsRawApriltags(
+                tag_id=0,
+                x=1,
+                y=2,
+                z=3,
+                rotation=((-1, 0, 1), (0, 1, -1), (1, -1, 0)),
+            ),
+            AVRAprilTagsRawApriltags(
+                tag_id=2,
+                x=-0.5,
+                y=0.25,
+                z=1.5,
+                rotation=((0, -1, 0), (1, 0, 0), (0, 0, 1)),
+            ),
+            AVRAprilTagsRawApriltags(
+                tag_id=0,
+                x=0.1,
+                y=-0.2,
+                z=0.8,
+                rotation=((1, 0, 0), (0, 1, 0), (0, 0, 1)),
+            ),
+        ],
+    ],
+)
+def test_handle_tags(
+    apriltag_module: AprilTagModule, tags: list[AVRAprilTagsRawApriltags]
+) -> None:
+    batch = apriltag_module.handle_tags(*apriltag_module.stack_tags(tags))
+
+    assert len(batch.tag_id) == len(tags)
+
+    # a whole frame at once must agree with one tag at a time
+    for index, tag in enumerate(tags):
+        single = apriltag_module.handle_tags(*apriltag_module.stack_tags([tag]))
+
+        assert batch.tag_id[index] == single.tag_id[0]
+        assert batch.horizontal_distance[index] == pytest.approx(
+            single.horizontal_distance[0]
+        )
+        assert batch.vertical_distance[index] == pytest.approx(
+            single.vertical_distance[0]
+        )
+        assert batch.angle[index] == pytest.approx(single.angle[0])
+        assert batch.heading[index] == pytest.approx(single.heading[0])
+        assert np.allclose(batch.pos_rel[index], single.pos_rel[0])
+        assert batch.has_world[index] == single.has_world[0]
+        assert np.allclose(batch.pos_world[index], single.pos_world[0])
+
+
+def test_on_apriltag_message_closest_tag(apriltag_module: AprilTagModule) -> None:
+    rotation = ((1, 0, 0), (0, 1, 0), (0, 0, 1))
+    payload = AVRAprilTagsRaw(
+        apriltags=[
+            AVRAprilTagsRawApriltags(tag_id=0, x=2, y=2, z=3, rotation=rotation),
+            AVRAprilTagsRawApriltags(tag_id=0, x=0.1, y=0.2, z=3, rotation=rotation),
+            # closest, but no truth data
+            AVRAprilTagsRawApriltags(tag_id=2, x=0.1, y=0.15, z=3, rotation=rotation),
+        ]
+    )
+
+    apriltag_module.on_apriltag_message(payload)
+
+    visible = apriltag_module.send_message.call_args_list[0].args[1]
+    assert len(visible.apriltags) == 3
+
+    vehicle_position = apriltag_module.send_message.call_args_list[1].args[1]
+    assert vehicle_position == AVRAprilTagsVehiclePosition(
+        tag_id=0,
+        x=visible.apriltags[1].absolute_position.x,
+        y=visible.apriltags[1].absolute_position.y,
+        z=visible.apriltags[1].absolute_position.z,
+        hdg=visible.apriltags[1].hdg,
+    )
+
+
+@pytest.mark.parametrize("mode", ["weighted", "median"])
+def test_on_apriltag_message_fused(
+    apriltag_module: AprilTagModule, mocker: MockerFixture, mode: str
+) -> None:
+    mocker.patch("src.python.config.VEHICLE_POSITION_MODE", mode)
+
+    rotation = ((1, 0, 0), (0, 1, 0), (0, 0, 1))
+    payload = AVRAprilTagsRaw(
+        apriltags=[
+            AVRAprilTagsRawApriltags(tag_id=0, x=0.1, y=0.2, z=3, rotation=rotation),
+            AVRAprilTagsRawApriltags(tag_id=0, x=0.1, y=0.2, z=3, rotation=rotation),
+            # no truth data, not part of the fused position
+            AVRAprilTagsRawApriltags(tag_id=2, x=5, y=5, z=1, rotation=rotation),
+        ]
+    )
+
+    apriltag_module.on_apriltag_message(payload)
+
+    visible = apriltag_module.send_message.call_args_list[0].args[1]
+    vehicle_position = apriltag_module.send_message.call_args_list[1].args[1]
+
+    expected = visible.apriltags[0]
+    assert vehicle_position.tag_id == 0
+    assert vehicle_position.x == pytest.approx(expected.absolute_position.x)
+    assert vehicle_position.y == pytest.approx(expected.absolute_position.y)
+    assert vehicle_position.z == pytest.approx(expected.absolute_position.z)
+    assert vehicle_position.hdg == pytest.approx(expected.hdg)
+
+
+@pytest.mark.parametrize("fast", [True, False])
+def test_on_message_raw(
+    apriltag_module: AprilTagModule, mocker: MockerFixture, fast: bool
+) -> None:
+    mocker.patch("src.python.config.FAST_RAW_DECODER", fast)
+
+    raw = {
+        "apriltags": [
+            {
+                "tag_id": 0,
+                "x": 1,
+                "y": 2,
+                "z": 3,
+                "rotation": [[-1, 0, 1], [0, 1, -1], [1, -1, 0]],
+            },
+            {
+                "tag_id": 2,
+                "x": 0.5,
+                "y": 0.25,
+                "z": 1,
+                "rotation": [[1, 0, 0], [0, 1, 0], [0, 0, 1]],
+            },
+        ]
+    }
+    payload = AVRAprilTagsRaw(**raw)
+    msg = mocker.Mock(topic="avr/apriltags/raw", payload=json.dumps(raw).encode())
+
+    apriltag_module.on_message(None, None, msg)  # type: ignore
+    on_message_calls = apriltag_module.send_message.call_args_list.copy()
+    apriltag_module.send_message.reset_mock()
+
+    apriltag_module.on_apriltag_message(payload)
+    assert apriltag_module.send_message.call_args_list == on_message_calls
+
+
+@pytest.mark.parametrize("fast", [True, False])
+@pytest.mark.parametrize(
+    "tag",
+    [
+        {"tag_id": 1, "x": 0, "y": 0, "z": 0},
+        {"tag_id": -1, "x": 0, "y": 0, "z": 0, "rotation": [[1, 0, 0]] * 3},
+        {"tag_id": 1.5, "x": 0, "y": 0, "z": 0, "rotation": [[1, 0, 0]] * 3},
+        {"tag_id": 1, "x": "a", "y": 0, "z": 0, "rotation": [[1, 0, 0]] * 3},
+        {"tag_id": 1, "x": 0, "y": 0, "z": 0, "rotation": [[2, 0, 0]] * 3},
+        {"tag_id": 1, "x": 0, "y": 0, "z": 0, "rotation": [[1, 0, 0]] * 2},
+        {"tag_id": 1, "x": 0, "y": 0, "z": 0, "w": 0, "rotation": [[1, 0, 0]] * 3},
+    ],
+)
+def test_on_message_raw_malformed(
+    apriltag_module: AprilTagModule,
+    mocker: MockerFixture,
+    fast: bool,
+    tag: dict[str, Any],
+) -> None:
+    mocker.patch("src.python.config.FAST_RAW_DECODER", fast)
+    msg = mocker.Mock(
+        topic="avr/apriltags/raw", payload=json.dumps({"apriltags": [tag]}).encode()
+    )
+
+    with pytest.raises(ValueError):
+        apriltag_module.on_message(None, None, msg)  # type: ignore
+    apriltag_module.send_message.assert_not_called()
+
+
+def test_on_message_packed(
+    apriltag_module: AprilTagModule, mocker: MockerFixture
+) -> None:
+    from src.python.raw_decoder import RawTagDecoder, encode_packed
+
+    raw = json.dumps(
+        {
+            "apriltags": [
+                {
+                    "tag_id": 0,
+                    "x": 1,
+                    "y": 2,
+                    "z": 3,
+                    "rotation": [[0, -1, 0], [1, 0, 0], [0, 0, 1]],
+                },
+            ]
+        }
+    )
+    packed = encode_packed(RawTagDecoder().decode(raw), sequence=1, timestamp=2.0)
+
+    msg = mocker.Mock(topic="avr/apriltags/raw/packed", payload=packed)
+    apriltag_module.on_message(None, None, msg)  # type: ignore
+    packed_position = apriltag_module.send_message.call_args_list[1].args[1]
+    apriltag_module.send_message.reset_mock()
+
+    apriltag_module.on_apriltag_message(AVRAprilTagsRaw(**json.loads(raw)))
+    json_position = apriltag_module.send_message.call_args_list[1].args[1]
+
+    assert packed_position.tag_id == json_position.tag_id
+    assert packed_position.x == pytest.approx(json_position.x)
+    assert packed_position.y == pytest.approx(json_position.y)
+    assert packed_position.z == pytest.approx(json_position.z)
+    assert packed_position.hdg == pytest.approx(json_position.hdg)
+
+
+def test_metrics(apriltag_module: AprilTagModule, mocker: MockerFixture) -> None:
+    raw = {
+        "apriltags": [
+            {
+                "tag_id": 0,
+                "x": 1,
+                "y": 2,
+                "z": 3,
+                "rotation": [[0, -1, 0], [1, 0, 0], [0, 0, 1]],
+            },
+        ]
+    }
+    msg = mocker.Mock(topic="avr/apriltags/raw", payload=json.dumps(raw).encode())
+
+    apriltag_module.on_message(None, None, msg)  # type: ignore
+    assert set(apriltag_module.metrics.stages) == {
+        "decode",
+        "transform",
+        "serialize",
+        "publish",
+    }
+    assert all(
+        call.args[0] != "avr/apriltags/metrics"
+        for call in apriltag_module.send_message.call_args_list
+    )
+
+    mocker.patch.object(apriltag_module.metrics, "due", return_value=True)
+    apriltag_module.on_message(None, None, msg)  # type: ignore
+    topic, summary = apriltag_module.send_message.call_args_list[-1].args
+    assert topic == "avr/apriltags/metrics"
+    assert summary["decode"]["count"] == 2
+
+
+def test_pose_filter(apriltag_module: AprilTagModule, mocker: MockerFixture) -> None:
+    mocker.patch("src.python.config.POSE_FILTER", True)
+    monotonic = mocker.patch("time.monotonic", return_value=100.0)
+
+    def position(x: float) -> AVRAprilTagsVehiclePosition:
+        apriltag_module.send_message.reset_mock()
+        tag = {"tag_id": 0, "x": x, "y": 0, "z": 1}
+        tag["rotation"] = [[1, 0, 0], [0, 1, 0], [0, 0, 1]]
+        apriltag_module.on_apriltag_message(AVRAprilTagsRaw(apriltags=[tag]))
+        return apriltag_module.send_message.call_args_list[1].args[1]
+
+    first = position(0.0)
+    monotonic.return_value = 100.1
+    second = position(0.1)
+
+    # a 10 cm jump is only half applied with the default alpha
+    assert abs(second.x - first.x) == pytest.approx(5.0)
+
+
+def test_predicted_position(
+    apriltag_module: AprilTagModule, mocker: MockerFixture
+) -> None:
+    mocker.patch("src.python.config.POSE_FILTER", True)
+    mocker.patch("src.python.config.POSE_PREDICTION_RATE", 20.0)
+    mocker.patch("src.python.config.POSE_PREDICTION_TIMEOUT", 0.5)
+    monotonic = mocker.patch("time.monotonic", return_value=100.0)
+
+    row = np.zeros(1, dtype=np.int64)
+    apriltag_module.vehicle_filter.update(row, np.array([[0.0, 0, 0, 90]]), 99.9)
+    apriltag_module.vehicle_filter.update(row, np.array([[10.0, 0, 0, 90]]), 100.0)
+    velocity = apriltag_module.vehicle_filter.v[0, 0]
+
+    # measurement still fresh
+    monotonic.return_value = 100.01
+    assert apriltag_module.predicted_position() is None
+
+    monotonic.return_value = 100.2
+    predicted = apriltag_module.predicted_position()
+    assert predicted is not None
+    assert predicted.x == pytest.approx(
+        apriltag_module.vehicle_filter.x[0, 0] + velocity * 0.2
+    )
+    assert predicted.hdg == pytest.approx(90)
+
+    # too old to extrapolate
+    monotonic.return_value = 101.0
+    assert apriltag_module.predicted_position() is None
+
+
+def test_async_processing(
+    apriltag_module: AprilTagModule, mocker: MockerFixture
+) -> None:
+    mocker.patch("src.python.config.PROCESSING_MODE", "async")
+
+    def message(x: int) -> Any:
+        tag = {"tag_id": 0, "x": x, "y": 0, "z": 1}
+        tag["rotation"] = [[1, 0, 0], [0, 1, 0], [0, 0, 1]]
+        raw = json.dumps({"apriltags": [tag]}).encode()
+        return mocker.Mock(topic="avr/apriltags/raw", payload=raw)
+
+    async def main() -> None:
+        apriltag_module.camera_pending[0].attach(asyncio.get_running_loop())
+        for x in range(3):
+            apriltag_module.on_message(None, None, message(x))  # type: ignore
+
+        # nothing is processed in the MQTT callback
+        apriltag_module.send_message.assert_not_called()
+        await asyncio.wait_for(apriltag_module.process_next(), timeout=5)
+
+    asyncio.run(main())
+
+    # only the newest frame was processed
+    assert apriltag_module.camera_pending[0].dropped == 2
+    apriltag_module.send_message.assert_called()
+    visible = apriltag_module.send_message.call_args_list[0].args[1]
+    expected = mocker.Mock()
+    apriltag_module.send_message = expected
+    apriltag_module.on_raw_message("avr/apriltags/raw", message(2).payload)
+    assert expected.call_args_list[0].args[1] == visible
+
+
+def test_fast_encoder(apriltag_module: AprilTagModule, mocker: MockerFixture) -> None:
+    tag = {"tag_id": 0, "x": 1, "y": 2, "z": 3}
+    tag["rotation"] = [[0, -1, 0], [1, 0, 0], [0, 0, 1]]
+    payload = AVRAprilTagsRaw(apriltags=[tag, {**tag, "tag_id": 5}])
+
+    apriltag_module.on_apriltag_message(payload)
+    expected = [
+        (call.args[0], json.loads(call.args[1].model_dump_json()))
+        for call in apriltag_module.send_message.call_args_list
+    ]
+
+    mocker.patch("src.python.config.FAST_ENCODER", True)
+    publish = mocker.patch.object(apriltag_module, "_publish")
+    apriltag_module.send_message.reset_mock()
+    apriltag_module.on_apriltag_message(payload)
+    assert not apriltag_module.send_message.called
+
+    published = [
+        (call.args[0], json.loads(call.args[1])) for call in publish.mock_calls
+    ]
+    assert published == expected
+    # same as send_message would have left it
+    assert {
+        topic: json.loads(apriltag_module.message_cache[topic].model_dump_json())  # type: ignore
+        for topic, _ in expected
+    } == dict(expected)
+
+
+def test_visible_max_rate(
+    apriltag_module: AprilTagModule, mocker: MockerFixture
+) -> None:
+    mocker.patch("src.python.config.VISIBLE_MAX_RATE", 10.0)
+    monotonic = mocker.patch("time.monotonic", return_value=100.0)
+
+    tag = {"tag_id": 0, "x": 1, "y": 2, "z": 3}
+    tag["rotation"] = [[0, -1, 0], [1, 0, 0], [0, 0, 1]]
+    payload = AVRAprilTagsRaw(apriltags=[tag])
+
+    topics = []
+    for now in (100.0, 100.05, 100.15):
+        monotonic.return_value = now
+        apriltag_module.send_message.reset_mock()
+        apriltag_module.on_apriltag_message(payload)
+        topics.append(
+            [call.args[0] for call in apriltag_module.send_message.call_args_list]
+        )
+
+    # the vehicle position is not rate limited
+    assert topics == [
+        ["avr/apriltags/visible", "avr/apriltags/vehicle_position"],
+        ["avr/apriltags/vehicle_position"],
+        ["avr/apriltags/visible", "avr/apriltags/vehicle_position"],
+    ]
+
+
+def test_tag_map_path(
+    apriltag_module: AprilTagModule, mocker: MockerFixture, tmp_path: Path
+) -> None:
+    path = tmp_path / "map.csv"
+    path.write_text("tag_id,x,y,z,roll,pitch,yaw\n7,100,200,0,0,0,0\n")
+    mocker.patch("src.python.config.TAG_MAP_PATH", str(path))
+    mocker.patch("src.python.config.TAG_MAP_CACHE", None)
+
+    apriltag_module.setup_transforms()
+
+    assert apriltag_module.tag_map.tag_ids.tolist() == [7]
+    assert apriltag_module.H_tag_cam.is_known(
+        apriltag_module.H_tag_cam.slots(np.array([7, 0]))
+    ).tolist() == [True, False]
+    np.testing.assert_array_equal(apriltag_module.H_tag_aeroRef.t, [[100, 200, 0]])
+    assert apriltag_module.world_angle_to_tag((100, 100, 0), 7) == 90.0
+    assert apriltag_module.world_angle_to_tag((0, 0, 0), 0) is None
+
+
+@pytest.mark.parametrize("pose_filter", [False, True])
+def test_pose_gate(
+    apriltag_module: AprilTagModule, mocker: MockerFixture, pose_filter: bool
+) -> None:
+    mocker.patch("src.python.config.POSE_GATE", True)
+    mocker.patch("src.python.config.POSE_FILTER", pose_filter)
+    mocker.patch(
+        "src.python.config.TAG_TRUTH",
+        {
+            0: {"rpy": (0, 0, 0), "xyz": (0, 0, 0)},
+            1: {"rpy": (0, 0, 0), "xyz": (2000, 0, 0)},
+        },
+    )
+    apriltag_module.setup_transforms()
+    mocker.patch("time.monotonic", return_value=100.0)
+
+    def process(tag_ids: list[int]) -> list[Any]:
+        apriltag_module.send_message.reset_mock()
+        tags = [
+            {
+                "tag_id": tag_id,
+                "x": 0,
+                "y": 0,
+                "z": 1,
+                "rotation": [[1, 0, 0], [0, 1, 0], [0, 0, 1]],
+            }
+            for tag_id in tag_ids
+        ]
+        apriltag_module.on_apriltag_message(AVRAprilTagsRaw(apriltags=tags))
+        return [call.args[1] for call in apriltag_module.send_message.call_args_list]
+
+    _, first = process([0])
+    assert first.tag_id == 0
+
+    # tag 1 is as close but would put the vehicle 20 m away
+    visible, second = process([1, 0])
+    assert second.tag_id == 0
+    assert (second.x, second.y, second.z) == (first.x, first.y, first.z)
+    assert visible.apriltags[0].tag_id == 1
+    assert visible.apriltags[0].absolute_position is None
+    assert visible.apriltags[1].absolute_position is not None
+
+
+def test_pose_gate_false_decode(
+    apriltag_module: AprilTagModule, mocker: MockerFixture
+) -> None:
+    mocker.patch("src.python.config.POSE_GATE", True)
+    mocker.patch(
+        "src.python.config.TAG_TRUTH",
+        {
+            0: {"rpy": (0, 0, 0), "xyz": (0, 0, 0)},
+            1: {"rpy": (0, 0, 0), "xyz": (2000, 0, 0)},
+        },
+    )
+    apriltag_module.setup_transforms()
+    monotonic = mocker.patch("time.monotonic", return_value=100.0)
+
+    def process(tags: list[tuple[int, float]]) -> Any:
+        # tag id and x of every detection
+        apriltag_module.send_message.reset_mock()
+        raw = AVRAprilTagsRaw(
+            apriltags=[
+                {
+                    "tag_id": tag_id,
+                    "x": x,
+                    "y": 0,
+                    "z": 1,
+                    "rotation": [[1, 0, 0], [0, 1, 0], [0, 0, 1]],
+                }
+                for tag_id, x in tags
+            ]  # type: ignore
+        )
+        apriltag_module.on_apriltag_message(raw)
+        return apriltag_module.send_message.call_args_list[-1].args[1]
+
+    first = process([(0, 0.5)])
+
+    # a false decode of tag 1, closer than the true tag 0, in every frame
+    for frame in range(1, 15):
+        monotonic.return_value = 100.0 + frame * 0.03
+        position = process([(0, 0.5), (1, 0)])
+        assert position.tag_id == 0
+        assert (position.x, position.y) == pytest.approx((first.x, first.y))
+
+
+def test_cameras(apriltag_module: AprilTagModule, mocker: MockerFixture) -> None:
+    mocker.patch(
+        "src.python.config.CAMERAS",
+        {
+            0: {"pos": (15, 10, 10), "attitude": (0, 0, math.pi / 2)},
+            # same camera, rotated 180 degrees about the body z axis
+            3: {"pos": (15, 10, 10), "attitude": (0, 0, -math.pi / 2)},
+        },
+    )
+    mocker.patch("time.monotonic", return_value=100.0)
+    module = type(apriltag_module)()
+    module.send_message = mocker.Mock()
+
+    def message(topic: str, tag_id: int, x: float) -> Any:
+        tag = {"tag_id": tag_id, "x": x, "y": 0, "z": 1}
+        tag["rotation"] = [[1, 0, 0], [0, 1, 0], [0, 0, 1]]
+        return mocker.Mock(
+            topic=topic, payload=json.dumps({"apriltags": [tag]}).encode()
+        )
+
+    module.on_message(None, None, message("avr/apriltags/raw/3", 0, 1))  # type: ignore
+    assert module.send_message.call_args_list[-1].args[1].tag_id == 0
+    module.send_message.reset_mock()
+    module.on_message(None, None, message("avr/apriltags/raw", 5, -1))  # type: ignore
+
+    # only camera 3 saw the tag with truth data, so this frame of camera 0
+    # has no vehicle position of its own
+    visible, cameras = (call.args[1] for call in module.send_message.call_args_list)
+    assert [tag.tag_id for tag in visible.apriltags] == [5, 0]
+    assert [tag["tag_id"] for tag in cameras["apriltags"]] == [5, 0]
+    assert [tag["camera_id"] for tag in cameras["apriltags"]] == [0, 3]
+    # the cameras face opposite ways, so the same detection puts the
+    # vehicle on opposite sides of the tag
+    first, second = (tag.relative_position for tag in visible.apriltags)
+    assert (first.x, first.y, first.z) == pytest.approx(
+        (-second.x, -second.y, second.z)
+    )
+
+
+def test_cameras_pose_filter(
+    apriltag_module: AprilTagModule, mocker: MockerFixture
+) -> None:
+    mocker.patch(
+        "src.python.config.CAMERAS",
+        {
+            0: {"pos": (15, 10, 10), "attitude": (0, 0, math.pi / 2)},
+            1: {"pos": (15, 10, 10), "attitude": (0, 0, -math.pi / 2)},
+        },
+    )
+    mocker.patch("src.python.config.POSE_FILTER", True)
+    monotonic = mocker.patch("time.monotonic", return_value=100.0)
+    module = type(apriltag_module)()
+    module.send_message = mocker.Mock()
+
+    def process(camera_id: int, tag_id: int) -> None:
+        tags = [
+            {
+                "tag_id": tag_id,
+                "x": 0,
+                "y": 0,
+                "z": 1,
+                "rotation": [[1, 0, 0], [0, 1, 0], [0, 0, 1]],
+            }
+        ]
+        raw = AVRAprilTagsRaw(apriltags=tags)  # type: ignore
+        module.process_tags(*module.stack_tags(raw.apriltags), camera_id=camera_id)
+
+    process(1, 0)
+    slot = module.H_tag_cam.slots(np.array([0]))
+    tag_updated = module.tag_filter.t[slot].copy()
+    vehicle_updated = module.vehicle_filter.t.copy()
+
+    # frames of camera 0 still merge in tag 0 from camera 1, but it is not
+    # a new measurement for the filters
+    module.send_message.reset_mock()
+    for now in (100.02, 100.04):
+        monotonic.return_value = now
+        process(0, 5)
+    assert module.tag_filter.t[slot] == tag_updated
+    assert module.vehicle_filter.t == vehicle_updated
+
+    topics = [call.args[0] for call in module.send_message.call_args_list]
+    assert "avr/apriltags/vehicle_position" not in topics
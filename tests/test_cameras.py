@@ -0,0 +1,37 @@
+import numpy as np
+
+from src.python.cameras import CameraMerger, raw_topic
+
+
+def test_raw_topic() -> None:
+    assert raw_topic(0) == "avr/apriltags/raw"
+    assert raw_topic(0, packed=True) == "avr/apriltags/raw/packed"
+    assert raw_topic(2) == "avr/apriltags/raw/2"
+    assert raw_topic(2, packed=True) == "avr/apriltags/raw/packed/2"
+
+
+def test_merge() -> None:
+    merger = CameraMerger(window=0.1)
+
+    buffer = np.array([1, 2])
+    camera_ids, (merged,) = merger.update(1, [buffer], 10.0)
+    assert camera_ids.tolist() == [1, 1]
+    assert merged.tolist() == [1, 2]
+
+    # stored frames don't change with the buffer they came from
+    buffer[:] = 0
+    camera_ids, (merged,) = merger.update(0, [np.array([3])], 10.05)
+    assert camera_ids.tolist() == [0, 1, 1]
+    assert merged.tolist() == [3, 1, 2]
+
+    # camera 1 is too old to merge with
+    camera_ids, (merged,) = merger.update(0, [np.array([4, 5])], 10.2)
+    assert camera_ids.tolist() == [0, 0]
+    assert merged.tolist() == [4, 5]
+
+
+def test_merge_empty() -> None:
+    merger = CameraMerger(window=0.1)
+    camera_ids, (merged, rows) = merger.update(0, [np.zeros(0), np.zeros((0, 3))], 10.0)
+    assert camera_ids.shape == (0,)
+    assert rows.shape == (0, 3)
@@ -1,9 +1,12 @@
+from pathlib import Path
 from typing import Literal, Optional
 
+import numpy as np
 import pytest
 from pytest_mock.plugin import MockerFixture
 
 from src.python.capture_device import CaptureDevice
+from src.python.frame_recording import FrameRecorder
 
 
 @pytest.mark.parametrize(
@@ -48,3 +51,83 @@ def test_init(
     import cv2
 
     cv2.VideoCapture.assert_called_once_with(connection_string)  # pyright: ignore
+
+
+@pytest.mark.parametrize(
+    "protocol, framerate, connection_string",
+    [
+        (
+            "v4l2",
+            "60",
+            "v4l2src device=/dev/test io-mode=2 ! image/jpeg,width=1280,height=720,framerate=60/1 ! jpegparse ! nvv4l2decoder mjpeg=1 ! nvvidconv ! video/x-raw,format=GRAY8,width=25,height=35 ! videorate ! video/x-raw,framerate=60/1 ! appsink",
+        ),
+        (
+            "argus",
+            None,
+            "nvarguscamerasrc ! video/x-raw(memory:NVMM), width=1280, height=720,format=NV12, framerate=60/1 ! nvvidconv ! video/x-raw,format=GRAY8,width=25,height=35 ! appsink",
+        ),
+    ],
+)
+def test_init_gray(
+    mocker: MockerFixture,
+    protocol: Literal["v4l2", "argus"],
+    framerate: Optional[int],
+    connection_string: str,
+) -> None:
+    mocker.patch("cv2.VideoCapture")
+
+    CaptureDevice(
+        protocol=protocol,
+        framerate=framerate,
+        video_device="/dev/test",
+        res=(25, 35),
+        gray=True,
+    )
+
+    import cv2
+
+    cv2.VideoCapture.assert_called_once_with(connection_string)  # pyright: ignore
+
+
+def test_read_gray_buffer(mocker: MockerFixture) -> None:
+    buffer = np.zeros((35, 25), dtype=np.uint8)
+    video_capture = mocker.patch("cv2.VideoCapture").return_value
+    video_capture.read.return_value = (True, buffer)
+
+    capture = CaptureDevice(
+        protocol="argus", video_device="/dev/test", res=(25, 35), gray=True
+    )
+    for _ in range(2):
+        ret, img = capture.read_gray()
+        assert ret
+        assert img is buffer
+
+    # the frame read last is handed back to be filled again
+    assert video_capture.read.call_args_list == [
+        mocker.call(None),
+        mocker.call(buffer),
+    ]
+
+
+def test_file(tmp_path: Path) -> None:
+    path = str(tmp_path / "frames.raw")
+    recorder = FrameRecorder(path, (35, 25))
+    recorder.write(np.full((35, 25), 7, dtype=np.uint8), 1.0)
+    recorder.write(np.full((35, 25), 8, dtype=np.uint8), 2.0)
+    recorder.close()
+
+    capture = CaptureDevice(
+        protocol="file", video_device=path, res=(25, 35), realtime=False
+    )
+
+    ret, img = capture.read_gray()
+    assert ret
+    assert img.shape == (35, 25)  # type: ignore
+    assert (img == 7).all()  # type: ignore
+
+    ret, img = capture.read()
+    assert ret
+    assert img.shape == (35, 25, 3)  # type: ignore
+    assert (img == 8).all()  # type: ignore
+
+    assert capture.read() == (False, None)
@@ -0,0 +1,433 @@
+import importlib
+import queue
+import sys
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+import cv2
+import numpy as np
+import pytest
+from pytest_mock.plugin import MockerFixture
+
+from src.python import config
+from src.python.frame_recording import FrameRecorder
+from src.python.pipeline import FrameResult
+from src.python.undistort import undistort_points
+
+# cpu_apriltag_library is written to be run as a script from its directory,
+# importing the modules next to it as top level ones. Point those at the
+# package modules, so patching src.python.config applies to it as well
+for name in (
+    "config",
+    "cameras",
+    "capture_device",
+    "decimation",
+    "frame_quality",
+    "frame_recording",
+    "frame_ring",
+    "metrics",
+    "pipeline",
+    "roi_tracker",
+    "undistort",
+):
+    sys.modules.setdefault(name, importlib.import_module(f"src.python.{name}"))
+
+from src.python import cpu_apriltag_library  # noqa: E402
+from src.python.cpu_apriltag_library import AprilTagVPS, AprilTagWrapper  # noqa: E402
+
+CAMERA_PARAMS = (584.3866, 583.3444, 661.2944, 320.7182)
+TAG_SIZE = 0.174
+RES = (640, 360)
+# pupil-apriltags can crash freeing detectors that ran with worker threads,
+# once a few of them were made in one process
+DETECTOR_OPTIONS = {"nthreads": 1}
+
+
+def synthetic_frame(tags: dict[int, tuple[int, int, int]]) -> np.ndarray:
+    """
+    Grayscale frame of tag36h11 tags, by tag id as (x, y, size in pixels).
+    """
+    dictionary = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_APRILTAG_36h11)
+    frame = np.full((RES[1], RES[0]), 128, dtype=np.uint8)
+    for tag_id, (x, y, size) in tags.items():
+        marker = cv2.aruco.generateImageMarker(dictionary, tag_id, size)
+        frame[y : y + size, x : x + size] = marker
+    return frame
+
+
+def quad_decimate(wrapper: AprilTagWrapper) -> float:
+    return wrapper.detector.tag_detector_ptr.contents.quad_decimate
+
+
+@pytest.fixture
+def make_vps() -> Iterator[Callable[..., AprilTagVPS]]:
+    made: list[AprilTagVPS] = []
+
+    def make(
+        res: tuple[int, int] = RES,
+        camera_params: tuple[float, float, float, float] = CAMERA_PARAMS,
+        **options: Any,
+    ) -> AprilTagVPS:
+        vps = AprilTagVPS(
+            "v4l2",
+            "/dev/test",
+            res,
+            camera_params,
+            TAG_SIZE,
+            detector_options=DETECTOR_OPTIONS,
+            **options,
+        )
+        # results are read back in the same process
+        vps.tags_queue = queue.Queue()  # type: ignore
+        made.append(vps)
+        return vps
+
+    yield make
+    for vps in made:
+        vps.frames.close(unlink=True)
+
+
+@pytest.fixture
+def vps(make_vps: Callable[..., AprilTagVPS]) -> AprilTagVPS:
+    return make_vps()
+
+
+def test_capture_replay_end(vps: AprilTagVPS, tmp_path: Path) -> None:
+    path = str(tmp_path / "frames.raw")
+    recorder = FrameRecorder(path, (RES[1], RES[0]))
+    for value in range(2):
+        recorder.write(np.full((RES[1], RES[0]), value, dtype=np.uint8), value)
+    recorder.close()
+
+    vps.protocol = "file"
+    vps.video_device = path
+    vps.replay_realtime = False
+
+    # returns, rather than reading the end of the replay forever
+    vps.capture_loop_start()
+    assert vps.frames.sequence(vps.frames.get(timeout=0)) == 1  # type: ignore
+    assert vps.frames.sequence(vps.frames.get(timeout=0)) == 2  # type: ignore
+
+
+def test_capture_backoff(vps: AprilTagVPS, mocker: MockerFixture) -> None:
+    capture = mocker.patch.object(cpu_apriltag_library, "CaptureDevice").return_value
+    frame = np.zeros((RES[1], RES[0]), dtype=np.uint8)
+    reads: list[Any] = [(False, None)] * 3 + [(True, frame)] + [(False, None)] * 9
+    capture.read_gray.side_effect = reads
+    sleep = mocker.patch("time.sleep")
+    sleep.side_effect = [None] * 11 + [KeyboardInterrupt]
+
+    with pytest.raises(KeyboardInterrupt):
+        vps.capture_loop_start()
+
+    # doubling from the first failure in a row, up to the max
+    delays = [call.args[0] for call in sleep.call_args_list]
+    assert delays == pytest.approx(
+        [0.01, 0.02, 0.04, 0.01, 0.02, 0.04, 0.08, 0.16, 0.32, 0.64, 1.0, 1.0]
+    )
+
+
+def test_adaptive_decimate_keyframe() -> None:
+    wrapper = AprilTagWrapper(
+        CAMERA_PARAMS, TAG_SIZE, adaptive_decimate=True, **DETECTOR_OPTIONS
+    )
+    large = (50, 50, 250)
+    assert [d.tag_id for d in wrapper.process_image(synthetic_frame({0: large}))] == [0]
+
+    # a tag too small to find at the decimation the large one allows shows up
+    frame = synthetic_frame({0: large, 1: (450, 150, 30)})
+    decimates = []
+    for _ in range(wrapper.keyframe_interval):
+        tag_ids = {d.tag_id for d in wrapper.process_image(frame)}
+        decimates.append(quad_decimate(wrapper))
+        if tag_ids == {0, 1}:
+            break
+
+    # found by the next frame at quad_decimate rather than never
+    assert tag_ids == {0, 1}
+    assert decimates == [4.0] * (len(decimates) - 1) + [wrapper.quad_decimate]
+
+
+def test_adaptive_decimate_lost() -> None:
+    wrapper = AprilTagWrapper(
+        CAMERA_PARAMS, TAG_SIZE, adaptive_decimate=True, **DETECTOR_OPTIONS
+    )
+    both = synthetic_frame({0: (50, 50, 250), 1: (350, 50, 250)})
+    for _ in range(2):
+        assert len(wrapper.process_image(both)) == 2
+    assert quad_decimate(wrapper) == 4.0
+
+    wrapper.process_image(synthetic_frame({0: (50, 50, 250)}))
+    wrapper.process_image(synthetic_frame({0: (50, 50, 250)}))
+    assert quad_decimate(wrapper) == wrapper.quad_decimate
+
+
+def test_perception_latest(vps: AprilTagVPS) -> None:
+    for value in range(3):
+        frame = synthetic_frame({value: (100, 50, 200)})
+        vps.frames.write(frame, timestamp=float(value))
+
+    vps.perception_loop()
+    result = vps.tags_queue.get_nowait()
+
+    # the newest frame, with the older ones dropped
+    assert (result.sequence, result.timestamp) == (3, 2.0)
+    assert [tag.tag_id for tag in result.tags] == [2]
+    assert vps.frames.get(timeout=0) is None
+
+
+def test_handle_result_stale(vps: AprilTagVPS) -> None:
+    def result(sequence: int, tags: list[Any]) -> FrameResult:
+        return FrameResult(sequence, float(sequence), {"detect": 0.01}, 0.0, tags)
+
+    vps.handle_result(result(2, ["new"]))
+    # finished after a newer frame, so it would go back in time
+    vps.handle_result(result(1, ["old"]))
+
+    assert vps.tags == ["new"]
+    assert (vps.tags_sequence, vps.tags_timestamp) == (2, 2.0)
+    assert vps.num_stale == 1
+    assert vps.num_images == 2
+
+    vps.handle_result(result(3, []))
+    assert vps.tags == []
+    assert vps.tags_timestamp == 2.0
+
+
+@pytest.mark.parametrize("alive", [False, True])
+def test_stop_perception_worker(
+    vps: AprilTagVPS, mocker: MockerFixture, alive: bool
+) -> None:
+    procs = [mocker.Mock(), mocker.Mock()]
+    stops = [mocker.Mock(), mocker.Mock()]
+    procs[1].is_alive.return_value = alive
+    vps.worker_procs, vps.worker_stops = list(procs), list(stops)
+
+    vps.stop_perception_worker()
+
+    assert vps.worker_procs == procs[:1]
+    assert vps.worker_stops == stops[:1]
+    stops[1].set.assert_called_once_with()
+    # reaped either way, terminated only if it didn't stop in time
+    assert procs[1].join.call_args_list[0] == mocker.call(
+        cpu_apriltag_library.WORKER_STOP_TIMEOUT
+    )
+    assert procs[1].terminate.called == alive
+    assert procs[1].join.call_count == 1 + alive
+    assert not procs[0].mock_calls
+
+
+@pytest.mark.parametrize(
+    "workers, detect_time, expected",
+    [
+        # 1.8 frames in flight at 60 fps
+        (1, 0.03, 2),
+        (2, 0.03, 2),
+        # one worker could keep up, but would be busy 75% of the time
+        (2, 0.0125, 2),
+        (2, 0.01, 1),
+        (3, 0.01, 2),
+        (1, 0.001, 1),
+        # no more than the cores allow
+        (4, 0.2, 4),
+    ],
+)
+def test_scale_workers(
+    vps: AprilTagVPS,
+    mocker: MockerFixture,
+    workers: int,
+    detect_time: float,
+    expected: int,
+) -> None:
+    vps.workers = "auto"
+    vps.cores = 4
+    vps.detect_time = detect_time
+    vps.worker_procs = [mocker.Mock() for _ in range(workers)]
+    mocker.patch.object(
+        vps, "start_perception_worker", lambda: vps.worker_procs.append(mocker.Mock())
+    )
+    mocker.patch.object(vps, "stop_perception_worker", vps.worker_procs.pop)
+
+    vps.scale_workers()
+    assert len(vps.worker_procs) == expected
+
+
+def test_scale_workers_auto(vps: AprilTagVPS, mocker: MockerFixture) -> None:
+    vps.workers = "auto"
+    vps.cores = 4
+    scale_workers = mocker.patch.object(vps, "scale_workers")
+
+    # checked every 30 frames, from the detection times of the results
+    for sequence in range(1, 61):
+        timings = {"detect": 0.03}
+        vps.handle_result(FrameResult(sequence, 0.0, timings, 0.0, []))
+
+    assert scale_workers.call_count == 2
+    assert vps.detect_time == pytest.approx(0.03)
+
+
+def test_detect_region_remap() -> None:
+    wrapper = AprilTagWrapper(CAMERA_PARAMS, TAG_SIZE, **DETECTOR_OPTIONS)
+    frame = synthetic_frame({3: (300, 100, 120)})
+    full = wrapper.detect_region(frame, (0, 0, RES[0], RES[1]))
+    crop = wrapper.detect_region(frame, (250, 60, 450, 260))
+
+    assert len(full) == len(crop) == 1
+    assert crop[0].center == pytest.approx(full[0].center, abs=0.5)
+    assert crop[0].corners == pytest.approx(full[0].corners, abs=0.5)
+    # the homography maps the tag's center into the full frame
+    center = crop[0].homography @ [0, 0, 1]
+    assert center[:2] / center[2] == pytest.approx(crop[0].center)
+    # the principal point moves with the crop, so the pose is the same
+    assert crop[0].pose_t == pytest.approx(full[0].pose_t, abs=0.01)
+
+
+def test_roi_keyframe_fallback(mocker: MockerFixture) -> None:
+    wrapper = AprilTagWrapper(
+        CAMERA_PARAMS, TAG_SIZE, roi_tracking=True, **DETECTOR_OPTIONS
+    )
+    detect_regions = mocker.spy(wrapper, "detect_regions")
+    full_frame = (0, 0, RES[0], RES[1])
+
+    def regions(frame: np.ndarray) -> list[Any]:
+        tag_ids = [d.tag_id for d in wrapper.process_image(frame)]
+        assert tag_ids == [0]
+        return detect_regions.call_args.args[1]
+
+    # nothing tracked yet, then only around the tag
+    assert regions(synthetic_frame({0: (100, 100, 100)})) == [full_frame]
+    crops = regions(synthetic_frame({0: (104, 100, 100)}))
+    assert crops != [full_frame]
+    assert all(x0 <= 108 and x1 >= 208 for x0, _, x1, _ in crops)
+
+    # the tag jumps out of its crop, so the next frame is searched in full
+    jumped = synthetic_frame({0: (450, 200, 100)})
+    assert wrapper.process_image(jumped) == []
+    assert regions(jumped) == [full_frame]
+
+    # and every keyframe_interval-th frame regardless
+    calls = [regions(jumped) for _ in range(wrapper.keyframe_interval)]
+    assert calls.count([full_frame]) == 1
+
+
+def test_adaptive_decimate_refine(mocker: MockerFixture) -> None:
+    wrapper = AprilTagWrapper(
+        CAMERA_PARAMS, TAG_SIZE, adaptive_decimate=True, refine=True, **DETECTOR_OPTIONS
+    )
+    detect_regions = wrapper.detect_regions
+    calls = []
+
+    def spy(frame: np.ndarray, regions: list[Any]) -> dict[int, Any]:
+        calls.append((regions, quad_decimate(wrapper)))
+        return detect_regions(frame, regions)
+
+    mocker.patch.object(wrapper, "detect_regions", spy)
+    frame = synthetic_frame({0: (250, 100, 120)})
+    wrapper.process_image(frame)
+    calls.clear()
+    tags = wrapper.process_image(frame)
+
+    # coarse over the whole frame, then at full resolution around the tag
+    assert [tag.tag_id for tag in tags] == [0]
+    assert calls[0] == ([(0, 0, RES[0], RES[1])], 4.0)
+    [(x0, y0, x1, y1)], decimate = calls[1]
+    assert decimate == 1.0
+    assert x0 < 250 and y0 < 100 and x1 > 370 and y1 > 220
+    assert (x1 - x0) * (y1 - y0) < RES[0] * RES[1] / 2
+    assert quad_decimate(wrapper) == 4.0
+
+    # a tag the refine pass misses keeps its coarse detection
+    coarse = detect_regions(frame, [(0, 0, RES[0], RES[1])])
+    mocker.patch.object(wrapper, "detect_regions", side_effect=[coarse, {}])
+    assert [tag.tag_id for tag in wrapper.process_image(frame)] == [0]
+
+
+def test_perception_quality_skip(make_vps: Callable[..., AprilTagVPS]) -> None:
+    vps = make_vps(quality_thresholds=(2.0, 20.0))
+    sharp = synthetic_frame({0: (100, 50, 200)})
+    frames = {
+        "blurred": cv2.GaussianBlur(sharp, (0, 0), 30),
+        "dark": sharp // 16,
+        "sharp": sharp,
+    }
+
+    results = {}
+    for name, frame in frames.items():
+        vps.frames.write(frame)
+        vps.perception_loop()
+        results[name] = vps.tags_queue.get_nowait()
+
+    for name in ("blurred", "dark"):
+        assert results[name].skipped == "quality"
+        assert results[name].tags == []
+        assert "detect" not in results[name].timings
+    assert results["sharp"].skipped is None
+    assert [tag.tag_id for tag in results["sharp"].tags] == [0]
+
+    # skipped frames are counted, but don't replace the tags
+    for result in results.values():
+        vps.handle_result(result)
+    assert vps.metrics.counters["skipped_quality"] == 2
+    assert vps.tags_sequence == results["sharp"].sequence
+
+
+@pytest.mark.parametrize("undistort", ["none", "frame", "corners"])
+def test_run_camera_params(mocker: MockerFixture, undistort: str) -> None:
+    mocker.patch("src.python.config.CPU_UNDISTORT", undistort)
+    vps = mocker.patch.object(cpu_apriltag_library, "AprilTagVPS")
+
+    cpu_apriltag_library.run_camera(0, "/dev/test")
+
+    kwargs = vps.call_args.kwargs
+    if undistort == "none":
+        assert kwargs["distortion"] is None
+        assert kwargs["camera_params"] == config.CPU_CAMERA_PARAMS
+    else:
+        # the coefficients with the camera matrix they were calibrated with
+        assert kwargs["distortion"] == config.CPU_DISTORTION
+        assert kwargs["camera_params"] == (config.CPU_DISTORTION_CAMERA_PARAMS)
+        assert kwargs["undistort"] == undistort
+    vps.return_value.run.assert_called_once_with()
+
+
+@pytest.mark.parametrize("undistort", ["frame", "corners"])
+def test_perception_undistort(
+    make_vps: Callable[..., AprilTagVPS], undistort: str
+) -> None:
+    camera_params = config.CPU_DISTORTION_CAMERA_PARAMS
+    vps = make_vps(
+        res=(1280, 720),
+        camera_params=camera_params,
+        distortion=config.CPU_DISTORTION,
+        undistort=undistort,
+    )
+    # undistorted frames, or only the corners of the tags found on raw ones
+    assert (vps.undistort is not None) == (undistort == "frame")
+    assert (vps.atag.distortion is not None) == (undistort == "corners")
+
+    dictionary = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_APRILTAG_36h11)
+    expected = np.full((720, 1280), 128, dtype=np.uint8)
+    expected[250:450, 850:1050] = cv2.aruco.generateImageMarker(dictionary, 0, 200)
+    # what the fisheye lens makes of it
+    grid = np.stack(np.meshgrid(np.arange(1280), np.arange(720)), axis=-1)
+    source = undistort_points(
+        grid.astype(np.float64), camera_params, config.CPU_DISTORTION
+    )
+    raw = cv2.remap(expected, source.astype(np.float32), None, cv2.INTER_LINEAR)
+
+    vps.frames.write(raw)
+    vps.perception_loop()
+    result = vps.tags_queue.get_nowait()
+    assert ("undistort" in result.timings) == (undistort == "frame")
+
+    (tag,) = result.tags
+    assert tag.corners.min(axis=0) == pytest.approx([850, 250], abs=2)
+    assert tag.corners.max(axis=0) == pytest.approx([1050, 450], abs=2)
+    # the same pose as the tag seen through a lens without distortion
+    (truth,) = vps.atag.detector.detect(
+        expected,
+        estimate_tag_pose=True,
+        camera_params=camera_params,
+        tag_size=TAG_SIZE,
+    )
+    assert tag.pose_t == pytest.approx(truth.pose_t, abs=0.01)
@@ -0,0 +1,24 @@
+import pytest
+
+from src.python.decimation import choose_decimate
+
+
+@pytest.mark.parametrize(
+    "distances, expected",
+    [
+        # nothing seen
+        ([], 1.5),
+        # 784 * 0.174 / 1 = 136 px, 4x decimated still 34 px
+        ([1.0], 4.0),
+        # 45 px, 1.5x decimated is 30 px but 2x only 23 px
+        ([1.0, 3.0], 1.5),
+        # too far for any decimation
+        ([10.0], 1.0),
+    ],
+)
+def test_choose_decimate(distances: list, expected: float) -> None:
+    assert choose_decimate(distances, 784.0, 0.174, default=1.5) == expected
+
+
+def test_choose_decimate_max() -> None:
+    assert choose_decimate([1.0], 784.0, 0.174, default=1.5, max_decimate=2) == 2.0
@@ -0,0 +1,43 @@
+import cv2
+import numpy as np
+
+from src.python.frame_quality import QualityFilter, frame_quality
+
+
+def frame() -> np.ndarray:
+    rng = np.random.default_rng(0)
+    image = rng.normal(110, 20, (720, 1280)).clip(0, 255).astype(np.uint8)
+    image = cv2.GaussianBlur(image, (0, 0), 3)
+    dictionary = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_APRILTAG_36h11)
+    image[200:400, 500:700] = cv2.aruco.generateImageMarker(dictionary, 0, 200)
+    return image
+
+
+def test_frame_quality() -> None:
+    image = frame()
+    sharpness, exposure = frame_quality(image)
+    assert exposure > 150
+
+    # horizontal motion blur
+    kernel = np.full((1, 41), 1 / 41)
+    blurred_sharpness, _ = frame_quality(cv2.filter2D(image, -1, kernel))
+    assert blurred_sharpness < sharpness / 2
+
+    dark_sharpness, dark_exposure = frame_quality((image * 0.1).astype(np.uint8))
+    assert dark_exposure <= 26
+    assert dark_sharpness < sharpness
+
+
+def test_quality_filter() -> None:
+    image = frame()
+    quality = QualityFilter(min_sharpness=10, min_exposure=20)
+    assert quality(image) is image
+    assert quality.exposure > 150
+
+    assert quality(np.zeros_like(image)) is None
+    assert quality.sharpness == 0
+    assert quality.exposure == 0
+
+    # uniform gray is well exposed but has no edges
+    assert quality(np.full_like(image, 128)) is None
+    assert quality.exposure == 128
@@ -0,0 +1,102 @@
+import os
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+from src.python.frame_recording import FrameRecorder, FrameReplay, open_recording
+
+
+def frame(value: int, shape: tuple = (4, 6)) -> np.ndarray:
+    return np.full(shape, value, dtype=np.uint8)
+
+
+@pytest.mark.parametrize("shape", [(4, 6), (4, 6, 3)])
+def test_record_replay(tmp_path: Path, shape: tuple) -> None:
+    path = str(tmp_path / "frames.raw")
+    recorder = FrameRecorder(path, shape)
+    for i in range(3):
+        recorder.write(frame(i, shape), 100.0 + i)
+    recorder.close()
+
+    replay = FrameReplay(path, realtime=False)
+    assert len(replay) == 3
+    for i in range(3):
+        ret, img = replay.read()
+        assert ret
+        assert replay.timestamp == 100.0 + i
+        np.testing.assert_array_equal(img, frame(i, shape))  # type: ignore
+
+    assert replay.read() == (False, None)
+
+
+def test_truncated_recording(tmp_path: Path) -> None:
+    path = str(tmp_path / "frames.raw")
+    recorder = FrameRecorder(path, (4, 6))
+    recorder.write(frame(1), 1.0)
+    recorder.write(frame(2), 2.0)
+    recorder.close()
+
+    # as if the recorder was killed halfway through the second frame
+    os.truncate(path, os.path.getsize(path) - 5)
+    assert len(open_recording(path)) == 1
+
+
+def test_not_a_recording(tmp_path: Path) -> None:
+    path = tmp_path / "frames.raw"
+    path.write_bytes(b"garbage" * 10)
+
+    with pytest.raises(ValueError):
+        open_recording(str(path))
+
+
+def test_replay_loop(tmp_path: Path) -> None:
+    path = str(tmp_path / "frames.raw")
+    recorder = FrameRecorder(path, (4, 6))
+    recorder.write(frame(1), 1.0)
+    recorder.close()
+
+    replay = FrameReplay(path, realtime=False, loop=True)
+    for _ in range(3):
+        ret, img = replay.read()
+        assert ret
+        np.testing.assert_array_equal(img, frame(1))  # type: ignore
+
+
+def test_replay_realtime(tmp_path: Path) -> None:
+    path = str(tmp_path / "frames.raw")
+    recorder = FrameRecorder(path, (4, 6))
+    for i in range(3):
+        recorder.write(frame(i), 0.05 * i)
+    recorder.close()
+
+    replay = FrameReplay(path)
+    start = time.perf_counter()
+    while replay.read()[0]:
+        pass
+    assert time.perf_counter() - start >= 0.1
+
+
+def test_replay_images(tmp_path: Path) -> None:
+    for i in range(3):
+        cv2.imwrite(str(tmp_path / f"{i:04}.png"), frame(i))
+    (tmp_path / "timestamps.csv").write_text(
+        "0000.png,10.0\n0001.png,10.5\n0002.png,11.0\n"
+    )
+
+    replay = FrameReplay(str(tmp_path), realtime=False)
+    for i in range(3):
+        ret, img = replay.read()
+        assert ret
+        assert replay.timestamp == 10.0 + 0.5 * i
+        np.testing.assert_array_equal(img, frame(i))  # type: ignore
+
+
+def test_replay_images_framerate(tmp_path: Path) -> None:
+    for i in range(2):
+        cv2.imwrite(str(tmp_path / f"{i:04}.png"), frame(i))
+
+    replay = FrameReplay(str(tmp_path), realtime=False, framerate=20)
+    np.testing.assert_allclose(replay.timestamps, [0.0, 0.05])
@@ -0,0 +1,102 @@
+import multiprocessing
+from typing import Iterator
+
+import numpy as np
+import pytest
+
+from src.python.frame_ring import FrameRing
+
+
+@pytest.fixture
+def ring() -> Iterator[FrameRing]:
+    ring = FrameRing((4, 6), num_slots=3)
+    yield ring
+    ring.close(unlink=True)
+
+
+def frame(value: int) -> np.ndarray:
+    return np.full((4, 6), value, dtype=np.uint8)
+
+
+def test_write_and_get(ring: FrameRing) -> None:
+    assert ring.get(timeout=0) is None
+
+    assert ring.write(frame(1))
+    assert ring.write(frame(2))
+
+    first = ring.get(timeout=0)
+    second = ring.get(timeout=0)
+    assert first is not None and second is not None
+    assert (ring.frame(first) == 1).all()
+    assert (ring.frame(second) == 2).all()
+
+    ring.release(first)
+    ring.release(second)
+    assert ring.dropped == 0
+
+
+def test_drops_oldest(ring: FrameRing) -> None:
+    for value in range(5):
+        assert ring.write(frame(value))
+
+    assert ring.dropped == 2
+
+    values = []
+    while (slot := ring.get(timeout=0)) is not None:
+        values.append(int(ring.frame(slot)[0, 0]))
+        ring.release(slot)
+
+    assert values == [2, 3, 4]
+
+
+def test_slots_in_use_are_not_overwritten(ring: FrameRing) -> None:
+    for value in range(3):
+        ring.write(frame(value))
+
+    slots = [ring.get(timeout=0) for _ in range(3)]
+
+    # every slot is being read
+    assert ring.write(frame(9)) is False
+    assert [int(ring.frame(slot)[0, 0]) for slot in slots] == [0, 1, 2]  # type: ignore
+
+
+def test_get_newest(ring: FrameRing) -> None:
+    for value in range(3):
+        ring.write(frame(value), timestamp=10.0 + value)
+
+    slot = ring.get(timeout=0, newest=True)
+    assert slot is not None
+    assert int(ring.frame(slot)[0, 0]) == 2
+    assert ring.sequence(slot) == 3
+    assert ring.timestamp(slot) == 12.0
+
+    # the older frames were dropped in favour of the newest one
+    assert ring.dropped == 2
+    assert ring.get(timeout=0) is None
+
+    ring.release(slot)
+    ring.write(frame(7), timestamp=20.0, capture_time=0.004)
+    slot = ring.get(timeout=0, newest=True)
+    assert slot is not None
+    assert ring.sequence(slot) == 4
+    assert ring.capture_time(slot) == 0.004
+
+
+def _consume(ring: FrameRing, results: "multiprocessing.Queue[int]") -> None:
+    slot = ring.get(timeout=5)
+    assert slot is not None
+    results.put(int(ring.frame(slot).sum()))
+    ring.release(slot)
+    ring.close()
+
+
+def test_across_processes(ring: FrameRing) -> None:
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_consume, args=(ring, results))
+    process.start()
+
+    ring.write(frame(3))
+    assert results.get(timeout=5) == 3 * 4 * 6
+
+    process.join(timeout=5)
+    assert process.exitcode == 0
@@ -0,0 +1,41 @@
+import asyncio
+import threading
+
+from src.python.latest_value import LatestValue
+
+
+def test_put_take() -> None:
+    latest: LatestValue[int] = LatestValue()
+    assert latest.take() is None
+
+    latest.put(1)
+    latest.put(2)
+    assert latest.take() == 2
+    assert latest.take() is None
+    assert latest.dropped == 1
+
+
+def test_get_newest() -> None:
+    async def main() -> list[int]:
+        latest: LatestValue[int] = LatestValue()
+        latest.attach(asyncio.get_running_loop())
+        for value in range(3):
+            latest.put(value)
+
+        first = await latest.get()
+        latest.put(3)
+        return [first, await latest.get(), latest.dropped]
+
+    assert asyncio.run(main()) == [2, 3, 2]
+
+
+def test_get_from_thread() -> None:
+    async def main() -> int:
+        latest: LatestValue[int] = LatestValue()
+        latest.attach(asyncio.get_running_loop())
+
+        # put from another thread while get is waiting
+        threading.Timer(0.05, latest.put, args=(7,)).start()
+        return await asyncio.wait_for(latest.get(), timeout=5)
+
+    assert asyncio.run(main()) == 7
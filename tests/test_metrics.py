@@ -0,0 +1,86 @@
+import urllib.request
+
+import pytest
+
+from src.python.metrics import Histogram, StageMetrics, serve_prometheus
+
+
+def test_histogram() -> None:
+    histogram = Histogram(bounds=[0.001, 0.002, 0.005])
+    for value in (0.0005, 0.0015, 0.0015, 0.003, 0.01):
+        histogram.observe(value)
+
+    assert histogram.counts == [1, 2, 1, 1]
+    assert histogram.count == 5
+    assert histogram.sum == pytest.approx(0.0165)
+    # the median falls halfway through the second bucket
+    assert histogram.quantile(0.5) == pytest.approx(0.00175)
+
+
+def test_window_summary() -> None:
+    histogram = Histogram(bounds=[0.001, 0.002])
+    histogram.observe(0.0015)
+    histogram.observe(0.0015)
+
+    summary = histogram.window_summary()
+    assert summary["count"] == 2
+    assert summary["mean_ms"] == pytest.approx(1.5)
+    assert summary["max_ms"] == pytest.approx(1.5)
+    assert 1.0 <= summary["p50_ms"] <= 2.0
+
+    # a new window starts, the cumulative counts don't
+    assert histogram.window_summary()["count"] == 0
+    assert histogram.count == 2
+
+
+def test_stage_metrics() -> None:
+    metrics = StageMetrics(interval=0)
+    with metrics.time("detect"):
+        pass
+    metrics.observe("publish", 0.002)
+
+    assert not metrics.due()
+    assert set(metrics.summary()) == {"detect", "publish"}
+
+
+def test_prometheus() -> None:
+    metrics = StageMetrics()
+    metrics.observe("detect", 0.003)
+    metrics.observe("detect", 0.3)
+
+    text = metrics.prometheus("avr_apriltags")
+    assert "# TYPE avr_apriltags_stage_seconds histogram" in text
+    assert 'avr_apriltags_stage_seconds_bucket{stage="detect",le="0.005"} 1' in text
+    assert 'avr_apriltags_stage_seconds_bucket{stage="detect",le="+Inf"} 2' in text
+    assert 'avr_apriltags_stage_seconds_count{stage="detect"} 2' in text
+
+
+def test_counters_and_gauges() -> None:
+    metrics = StageMetrics()
+    metrics.count("frames")
+    metrics.count("frames", 2)
+    metrics.set("threshold", 1.5)
+
+    assert metrics.summary() == {
+        "counters": {"frames": 3},
+        "gauges": {"threshold": 1.5},
+    }
+    text = metrics.prometheus("avr_apriltags")
+    assert (
+        "# TYPE avr_apriltags_frames_total counter\navr_apriltags_frames_total 3"
+        in text
+    )
+    assert "# TYPE avr_apriltags_threshold gauge\navr_apriltags_threshold 1.5" in text
+
+
+def test_serve_prometheus() -> None:
+    metrics = StageMetrics()
+    metrics.observe("decode", 0.001)
+
+    server = serve_prometheus(metrics, 0, "avr_apriltags")
+    try:
+        port = server.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            assert response.read().decode() == metrics.prometheus("avr_apriltags")
+    finally:
+        server.shutdown()
@@ -0,0 +1,52 @@
+import queue
+import threading
+import time
+from typing import Optional
+
+from src.python.pipeline import Stages, get_all
+
+
+def test_stages() -> None:
+    stages: Stages[int] = Stages()
+    stages.add("double", lambda value: value * 2)
+    stages.add("increment", lambda value: value + 1)
+
+    timings: dict[str, float] = {}
+    assert stages.run(3, timings) == 7
+    assert list(timings) == ["double", "increment"]
+    assert len(stages) == 2
+
+
+def test_stages_drop() -> None:
+    calls = []
+
+    def odd_only(value: int) -> Optional[int]:
+        calls.append(value)
+        return value if value % 2 else None
+
+    stages: Stages[int] = Stages()
+    stages.add("odd", odd_only)
+    stages.add("never", lambda value: calls.append(-1))  # type: ignore
+
+    timings: dict[str, float] = {}
+    assert stages.run(2, timings) is None
+    assert calls == [2]
+    assert list(timings) == ["odd"]
+
+
+def test_get_all() -> None:
+    source: queue.Queue[int] = queue.Queue()
+    assert get_all(source, timeout=0.01) == []
+
+    for item in range(3):
+        source.put(item)
+    assert get_all(source) == [0, 1, 2]
+
+
+def test_get_all_wakes_up() -> None:
+    source: queue.Queue[int] = queue.Queue()
+    threading.Timer(0.05, source.put, args=(1,)).start()
+
+    start = time.monotonic()
+    assert get_all(source, timeout=5) == [1]
+    assert time.monotonic() - start < 1
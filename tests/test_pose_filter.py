@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from src.python.pose_filter import AlphaBetaFilter
+
+ROW = np.array([0])
+
+
+def test_first_update_passes_through() -> None:
+    f = AlphaBetaFilter(2, 2)
+    filtered = f.update(np.array([0, 1]), np.array([[1.0, 2.0], [3.0, 4.0]]), 10.0)
+    np.testing.assert_array_equal(filtered, [[1.0, 2.0], [3.0, 4.0]])
+    np.testing.assert_array_equal(f.v, 0)
+
+
+def test_smoothing() -> None:
+    f = AlphaBetaFilter(1, 1, alpha=0.5, beta=0.1)
+    f.update(ROW, np.array([[0.0]]), 0.0)
+
+    filtered = f.update(ROW, np.array([[1.0]]), 0.1)
+    assert filtered[0, 0] == pytest.approx(0.5)
+    # beta * residual / dt
+    assert f.v[0, 0] == pytest.approx(1.0)
+
+
+def test_tracks_constant_velocity() -> None:
+    f = AlphaBetaFilter(1, 1, alpha=0.5, beta=0.2)
+    for i in range(200):
+        f.update(ROW, np.array([[2.0 * i * 0.05]]), i * 0.05)
+
+    assert f.v[0, 0] == pytest.approx(2.0, rel=1e-3)
+    assert f.predict(ROW, 200 * 0.05)[0, 0] == pytest.approx(20.0, rel=1e-3)
+
+
+def test_angular_wraps() -> None:
+    f = AlphaBetaFilter(1, 1, alpha=0.5, beta=0.0, angular=[0])
+    f.update(ROW, np.array([[350.0]]), 0.0)
+
+    # halfway between 350 and 10 the short way round is 0, not 180
+    filtered = f.update(ROW, np.array([[10.0]]), 0.1)
+    assert filtered[0, 0] == pytest.approx(0.0, abs=1e-9)
+
+
+def test_reset() -> None:
+    f = AlphaBetaFilter(1, 1, alpha=0.5, reset_after=1.0)
+    f.update(ROW, np.array([[0.0]]), 0.0, keys=np.array([3]))
+
+    # too long ago
+    assert f.update(ROW, np.array([[4.0]]), 5.0, keys=np.array([3]))[0, 0] == 4.0
+    # the row now belongs to another key
+    assert f.update(ROW, np.array([[8.0]]), 5.1, keys=np.array([7]))[0, 0] == 8.0
+
+
+def test_age() -> None:
+    f = AlphaBetaFilter(2, 1)
+    f.update(ROW, np.array([[0.0]]), 1.0)
+    np.testing.assert_array_equal(f.age(np.array([0, 1]), 1.5), [0.5, np.inf])
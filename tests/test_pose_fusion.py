@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from src.python.pose_fusion import (
+    circular_mean_deg,
+    fuse_median,
+    fuse_weighted,
+    tag_weights,
+    weighted_median,
+)
+
+
+def angle_difference(a: float, b: float) -> float:
+    return abs((a - b + 180.0) % 360.0 - 180.0)
+
+
+def test_tag_weights() -> None:
+    head_on = np.eye(3)
+    # rotated 90 degrees about x, so the tag is seen edge-on
+    edge_on = np.array([[1.0, 0, 0], [0, 0, -1], [0, 1, 0]])
+
+    weights = tag_weights(
+        np.array([[0, 0, 1.0], [0, 0, 2.0], [0, 0, 1.0]]),
+        np.array([head_on, head_on, edge_on]),
+    )
+
+    assert weights[0] == pytest.approx(1.0)
+    assert weights[1] == pytest.approx(0.25)
+    assert 0 < weights[2] < weights[1]
+
+
+@pytest.mark.parametrize(
+    "angles, weights, expected",
+    [
+        ([350.0, 10.0], [1.0, 1.0], 0.0),
+        ([90.0, 180.0], [1.0, 0.0], 90.0),
+        ([80.0, 100.0, 90.0], [1.0, 1.0, 1.0], 90.0),
+    ],
+)
+def test_circular_mean_deg(
+    angles: list[float], weights: list[float], expected: float
+) -> None:
+    result = circular_mean_deg(np.array(angles), np.array(weights))
+    assert angle_difference(result, expected) == pytest.approx(0.0, abs=1e-9)
+
+
+def test_weighted_median() -> None:
+    values = np.array([[1.0, 10.0], [2.0, 30.0], [100.0, 20.0]])
+    weights = np.array([1.0, 1.0, 1.0])
+
+    assert weighted_median(values, weights).tolist() == [2.0, 20.0]
+    assert weighted_median(values, np.array([0.1, 0.1, 5.0])).tolist() == [
+        100.0,
+        20.0,
+    ]
+
+
+def test_fuse_weighted() -> None:
+    pos, heading = fuse_weighted(
+        np.array([[0.0, 0, 0], [10.0, 20, 30]]),
+        np.array([359.0, 1.0]),
+        np.array([3.0, 1.0]),
+    )
+
+    assert np.allclose(pos, [2.5, 5, 7.5])
+    assert angle_difference(heading, 359.5) < 0.01
+
+
+def test_fuse_median_rejects_outlier() -> None:
+    pos, heading = fuse_median(
+        np.array([[0.0, 0, 0], [1.0, 1, 1], [2.0, 2, 2], [500.0, -500, 500]]),
+        np.array([358.0, 0.0, 2.0, 180.0]),
+        np.array([1.0, 1.0, 1.0, 0.5]),
+    )
+
+    assert np.allclose(pos, [1, 1, 1])
+    assert angle_difference(heading, 0.0) < 1e-6
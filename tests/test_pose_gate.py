@@ -0,0 +1,92 @@
+import numpy as np
+
+from src.python.pose_gate import PoseGate
+
+
+def gate() -> PoseGate:
+    return PoseGate(tolerance=50, max_speed=500, max_range=1000, timeout=1.0)
+
+
+def test_no_position() -> None:
+    # nothing to compare against yet
+    assert gate().check(np.zeros((2, 3)), np.full((2, 3), 1e6), 0.0).tolist() == [
+        True,
+        True,
+    ]
+
+
+def test_residual() -> None:
+    pose_gate = gate()
+    pose_gate.accept(np.array([100.0, 0.0, 0.0]), 10.0)
+
+    tag_xyz = np.zeros((3, 3))
+    pos_world = np.array([[140.0, 0.0, 0.0], [160.0, 0.0, 0.0], [100.0, 0.0, 95.0]])
+    assert pose_gate.check(tag_xyz, pos_world, 10.0).tolist() == [True, False, False]
+
+    # 0.1 s later the vehicle could have moved another 50 cm
+    assert pose_gate.check(tag_xyz, pos_world, 10.1).tolist() == [True, True, True]
+
+
+def test_in_view() -> None:
+    pose_gate = gate()
+    pose_gate.accept(np.zeros(3), 10.0)
+
+    # implied positions agree, but only the first tag is close enough to see
+    tag_xyz = np.array([[900.0, 0.0, 0.0], [0.0, 1100.0, 0.0]])
+    assert pose_gate.check(tag_xyz, np.zeros((2, 3)), 10.0).tolist() == [True, False]
+
+
+def test_timeout() -> None:
+    pose_gate = gate()
+    pose_gate.accept(np.zeros(3), 10.0)
+
+    far = np.full((1, 3), 1e6)
+    assert not pose_gate.check(far, far, 10.5).any()
+    assert pose_gate.check(far, far, 11.5).all()
+
+
+def test_max_rejections() -> None:
+    pose_gate = PoseGate(
+        tolerance=50, max_speed=500, max_range=1000, timeout=1.0, max_rejections=3
+    )
+    pose_gate.accept(np.zeros(3), 10.0)
+
+    # every tag puts the vehicle 5 m away
+    tag_xyz = np.zeros((2, 3))
+    pos_world = np.full((2, 3), 500.0)
+    for now in (10.0, 10.01):
+        assert not pose_gate.check(tag_xyz, pos_world, now).any()
+
+    assert pose_gate.check(tag_xyz, pos_world, 10.02).all()
+    assert pose_gate.position is None
+
+
+def test_max_rejections_tie() -> None:
+    pose_gate = PoseGate(
+        tolerance=50, max_speed=500, max_range=1000, timeout=1.0, max_rejections=3
+    )
+    pose_gate.accept(np.zeros(3), 10.0)
+
+    # a true tag and a false decode: the true one keeps the gate closed
+    tag_xyz = np.zeros((2, 3))
+    pos_world = np.array([[0.0, 0.0, 0.0], [500.0, 0.0, 0.0]])
+    for frame in range(12):
+        now = 10.0 + frame * 0.01
+        assert pose_gate.check(tag_xyz, pos_world, now).tolist() == [True, False]
+        pose_gate.accept(np.zeros(3), now)
+
+
+def test_max_rejections_reset() -> None:
+    pose_gate = PoseGate(
+        tolerance=50, max_speed=500, max_range=1000, timeout=1.0, max_rejections=2
+    )
+    pose_gate.accept(np.zeros(3), 10.0)
+
+    tag_xyz = np.zeros((1, 3))
+    outlier = np.full((1, 3), 500.0)
+    agree = np.zeros((1, 3))
+    assert not pose_gate.check(tag_xyz, outlier, 10.0).any()
+    # a tag agreeing starts the count over
+    assert pose_gate.check(tag_xyz, agree, 10.0).all()
+    assert not pose_gate.check(tag_xyz, outlier, 10.0).any()
+    assert pose_gate.position is not None
@@ -0,0 +1,102 @@
+import json
+
+import numpy as np
+import pytest
+from bell.avr.mqtt.payloads import AVRAprilTagsRaw
+
+from src.python.raw_decoder import (
+    PACKED_HEADER_DTYPE,
+    PACKED_TAG_DTYPE,
+    RawTagDecoder,
+    decode_packed,
+    encode_packed,
+    packed_rotation,
+)
+
+
+def raw_payload(n: int) -> bytes:
+    return json.dumps(
+        {
+            "apriltags": [
+                {
+                    "tag_id": i,
+                    "x": 0.1 * i,
+                    "y": -0.2 * i,
+                    "z": 1.5,
+                    "rotation": [[1, 0, 0], [0, 0.5, -0.5], [0, 0.5, 0.5]],
+                }
+                for i in range(n)
+            ]
+        }
+    ).encode()
+
+
+@pytest.mark.parametrize("n", [0, 1, 6, 40])
+def test_decode_matches_payload_model(n: int) -> None:
+    payload = raw_payload(n)
+    tags = RawTagDecoder(capacity=32).decode(payload)
+    model = AVRAprilTagsRaw(**json.loads(payload))
+
+    assert len(tags) == n
+    for row, tag in zip(tags, model.apriltags):
+        assert row["tag_id"] == tag.tag_id
+        assert row["xyz"].tolist() == [tag.x, tag.y, tag.z]
+        assert np.array_equal(row["rotation"], np.asarray(tag.rotation))
+
+
+def test_decode_reuses_buffer() -> None:
+    decoder = RawTagDecoder(capacity=8)
+
+    first = decoder.decode(raw_payload(3))
+    second = decoder.decode(raw_payload(2))
+
+    assert np.shares_memory(first, second)
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        b"not json",
+        b"{}",
+        b'{"apriltags": [{"tag_id": 1, "x": 0, "y": 0, "z": 0}]}',
+        b'{"apriltags": [{"tag_id": -1, "x": 0, "y": 0, "z": 0, '
+        b'"rotation": [[1, 0, 0], [0, 1, 0], [0, 0, 1]]}]}',
+        b'{"apriltags": [{"tag_id": 1, "x": 0, "y": 0, "z": 0, '
+        b'"rotation": [[1, 0], [0, 1]]}]}',
+        b'{"apriltags": [{"tag_id": 1, "x": 0, "y": 0, "z": 0, '
+        b'"rotation": [[2, 0, 0], [0, 1, 0], [0, 0, 1]]}]}',
+        b'{"apriltags": [{"tag_id": 1.5, "x": 0, "y": 0, "z": 0, '
+        b'"rotation": [[1, 0, 0], [0, 1, 0], [0, 0, 1]]}]}',
+        b'{"apriltags": [{"tag_id": 100000000000000000000, "x": 0, "y": 0, '
+        b'"z": 0, "rotation": [[1, 0, 0], [0, 1, 0], [0, 0, 1]]}]}',
+        b'{"apriltags": [{"tag_id": 1, "x": 0, "y": 0, "z": 0, "w": 0, '
+        b'"rotation": [[1, 0, 0], [0, 1, 0], [0, 0, 1]]}]}',
+    ],
+)
+def test_decode_malformed(payload: bytes) -> None:
+    with pytest.raises(ValueError):
+        RawTagDecoder().decode(payload)
+
+
+@pytest.mark.parametrize("n", [0, 1, 6])
+def test_packed_round_trip(n: int) -> None:
+    tags = RawTagDecoder().decode(raw_payload(n))
+    payload = encode_packed(tags, sequence=42, timestamp=1234.5)
+
+    assert len(payload) == PACKED_HEADER_DTYPE.itemsize + n * PACKED_TAG_DTYPE.itemsize
+
+    header, packed = decode_packed(payload)
+    assert header["sequence"] == 42
+    assert header["count"] == n
+    assert header["timestamp"] == 1234.5
+    assert packed["tag_id"].tolist() == tags["tag_id"].tolist()
+    assert np.allclose(packed["xyz"], tags["xyz"])
+    assert np.allclose(packed_rotation(packed), tags["rotation"])
+
+
+@pytest.mark.parametrize("trim", [1, PACKED_TAG_DTYPE.itemsize, 1000])
+def test_decode_packed_malformed(trim: int) -> None:
+    payload = encode_packed(RawTagDecoder().decode(raw_payload(2)))
+
+    with pytest.raises(ValueError):
+        decode_packed(payload[:-trim])
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+import transforms3d as t3d
+
+from src.python.rigid_transform import RigidTransform, yaw_rotations
+
+
+@pytest.mark.parametrize(
+    "xyz, rpy",
+    [
+        ((0, 0, 0), (0, 0, 0)),
+        ((15, 10, 10), (0, 0, np.pi / 2)),
+        ((-3.5, 200, 8.5), (0.1, -0.4, 2.9)),
+    ],
+)
+def test_inv(xyz: tuple[float, float, float], rpy: tuple[float, float, float]) -> None:
+    tf = RigidTransform.from_euler(xyz, rpy)
+
+    assert np.allclose(tf.inv().as_matrix(), np.linalg.inv(tf.as_matrix()))
+    assert np.allclose((tf @ tf.inv()).as_matrix(), np.eye(4))
+
+
+def test_matmul_matches_matrices() -> None:
+    a = RigidTransform.from_euler((1, 2, 3), (0.3, 0.2, 0.1))
+    b = RigidTransform.from_euler((-4, 5, 0.5), (0, 1.2, -0.7))
+
+    assert np.allclose((a @ b).as_matrix(), a.as_matrix() @ b.as_matrix())
+
+
+def test_stacked() -> None:
+    yaw = np.array([0, np.pi / 2, -2.0])
+    stack = RigidTransform(
+        yaw_rotations(np.cos(yaw), np.sin(yaw)),
+        np.array([[1.0, 2, 3], [4, 5, 6], [7, 8, 9]]),
+    )
+    single = RigidTransform.from_euler((15, 10, 10), (0, 0, np.pi / 2))
+
+    composed = stack.inv() @ single
+    assert len(composed) == 3
+
+    for index in range(3):
+        expected = np.linalg.inv(stack[index].as_matrix()) @ single.as_matrix()
+        assert np.allclose(composed[index].as_matrix(), expected)
+        assert np.allclose(
+            stack.R[index], t3d.euler.euler2mat(0, 0, yaw[index], axes="rxyz")
+        )
@@ -0,0 +1,62 @@
+import numpy as np
+
+from src.python.roi_tracker import RoiTracker
+
+
+def square(x: float, y: float, size: float = 20) -> np.ndarray:
+    return np.array([[x, y], [x + size, y], [x + size, y + size], [x, y + size]])
+
+
+def test_keyframe_schedule() -> None:
+    tracker = RoiTracker((720, 1280), keyframe_interval=3)
+
+    # nothing tracked yet
+    assert tracker.needs_keyframe()
+    tracker.update([(1, square(100, 100))], keyframe=True)
+    assert not tracker.needs_keyframe()
+
+    tracker.update([(1, square(100, 100))], keyframe=False)
+    tracker.update([(1, square(100, 100))], keyframe=False)
+    assert tracker.needs_keyframe()
+
+
+def test_keyframe_on_loss() -> None:
+    tracker = RoiTracker((720, 1280), keyframe_interval=10)
+    tracker.update([(1, square(100, 100)), (2, square(500, 500))], keyframe=True)
+
+    tracker.update([(1, square(100, 100))], keyframe=False)
+    assert tracker.needs_keyframe()
+
+    # the keyframe forgets the lost tag
+    tracker.update([(1, square(100, 100))], keyframe=True)
+    assert not tracker.needs_keyframe()
+    assert len(tracker.regions()) == 1
+
+
+def test_regions_predict_motion() -> None:
+    tracker = RoiTracker((720, 1280), padding=0.5, min_padding=0)
+    tracker.update([(1, square(100, 100))], keyframe=True)
+    tracker.update([(1, square(110, 104))], keyframe=False)
+
+    np.testing.assert_allclose(tracker.predict(1), square(120, 108))
+    assert tracker.regions() == [(110, 98, 150, 138)]
+
+
+def test_regions_reacquired() -> None:
+    tracker = RoiTracker((720, 1280), padding=0.5, min_padding=0)
+    tracker.update([(1, square(100, 100))], keyframe=True)
+    tracker.update([], keyframe=False)
+    tracker.update([(1, square(400, 300))], keyframe=True)
+
+    # no velocity from where it was lost to where it was found
+    np.testing.assert_allclose(tracker.predict(1), square(400, 300))
+
+
+def test_regions_clipped_and_merged() -> None:
+    tracker = RoiTracker((720, 1280), padding=0.5, min_padding=24)
+    tracker.update(
+        [(1, square(0, 0)), (2, square(30, 10)), (3, square(1000, 700))],
+        keyframe=True,
+    )
+
+    assert sorted(tracker.regions()) == [(0, 0, 74, 54), (976, 676, 1044, 720)]
@@ -0,0 +1,92 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pytest
+from pytest_mock.plugin import MockerFixture
+
+from src.python.rigid_transform import RigidTransform
+from src.python.tag_map import TagMap
+
+TRUTH = {
+    4: {"xyz": (100.0, 50.0, 0.0), "rpy": (0.0, 0.0, 1.5)},
+    0: {"xyz": (0.0, 0.0, 0.0), "rpy": (0.1, 0.2, 0.3)},
+}
+
+CSV = """tag_id,x,y,z,roll,pitch,yaw
+4,100,50,0,0,0,1.5
+0,0,0,0,0.1,0.2,0.3
+"""
+
+
+def test_from_truth() -> None:
+    tag_map = TagMap.from_truth(TRUTH)
+    assert len(tag_map) == 2
+    assert tag_map.tag_ids.tolist() == [4, 0]
+    np.testing.assert_array_equal(
+        tag_map.rows(np.array([0, 4, 2, 99, -1])), [1, 0, -1, -1, -1]
+    )
+
+    transforms = tag_map.transforms()
+    for row, (xyz, rpy) in enumerate((TRUTH[4].values(), TRUTH[0].values())):
+        expected = RigidTransform.from_euler(xyz, rpy)
+        np.testing.assert_array_equal(transforms.R[row], expected.R)
+        np.testing.assert_array_equal(transforms.t[row], expected.t)
+
+
+def test_load(tmp_path: Path) -> None:
+    json_path = tmp_path / "map.json"
+    json_path.write_text(json.dumps({str(k): v for k, v in TRUTH.items()}))
+    csv_path = tmp_path / "map.csv"
+    csv_path.write_text(CSV)
+
+    expected = TagMap.from_truth(TRUTH)
+    for path in (json_path, csv_path):
+        tag_map = TagMap.load(str(path))
+        np.testing.assert_array_equal(tag_map.records, expected.records)
+
+
+def test_load_invalid(tmp_path: Path) -> None:
+    path = tmp_path / "map.csv"
+    path.write_text(CSV + "4,1,2,3,0,0,0\n")
+    with pytest.raises(ValueError, match="more than once"):
+        TagMap.load(str(path))
+
+    path.write_text("tag_id,x,y,z\n0,1,2,3\n")
+    with pytest.raises(ValueError, match="missing columns: pitch, roll, yaw"):
+        TagMap.load(str(path))
+
+
+def test_cache(tmp_path: Path, mocker: MockerFixture) -> None:
+    path = tmp_path / "map.csv"
+    path.write_text(CSV)
+    cache_dir = tmp_path / "cache"
+    from_truth = mocker.spy(TagMap, "from_truth")
+
+    first = TagMap.load(str(path), str(cache_dir))
+    second = TagMap.load(str(path), str(cache_dir))
+    assert from_truth.call_count == 1
+    assert isinstance(second.records, np.memmap)
+    np.testing.assert_array_equal(first.records, second.records)
+    assert second.rows(np.array([0])).tolist() == [1]
+
+    # a changed map is parsed again
+    path.write_text(CSV.replace("100,50", "200,50"))
+    assert TagMap.load(str(path), str(cache_dir)).xyz[0].tolist() == [200, 50, 0]
+    assert from_truth.call_count == 2
+
+
+def test_cache_write_error(tmp_path: Path, mocker: MockerFixture) -> None:
+    path = tmp_path / "map.csv"
+    path.write_text(CSV)
+    cache_dir = tmp_path / "cache"
+    mocker.patch("numpy.save", side_effect=OSError(28, "No space left on device"))
+
+    # parsed map all the same, with no partial cache file left to load
+    assert TagMap.load(str(path), str(cache_dir)).tag_ids.tolist() == [4, 0]
+    assert not list(cache_dir.iterdir())
+
+    # not even a cache directory
+    cache_file = tmp_path / "file"
+    cache_file.write_text("")
+    assert len(TagMap.load(str(path), str(cache_file))) == 2
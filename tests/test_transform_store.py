@@ -0,0 +1,59 @@
+import numpy as np
+
+from src.python.rigid_transform import RigidTransform
+from src.python.transform_store import TransformStore
+
+
+def translations(*xs: float) -> RigidTransform:
+    tf = RigidTransform.identity(len(xs))
+    tf.t[:, 0] = xs
+    return tf
+
+
+def test_known_slots() -> None:
+    store = TransformStore([4, 0], unknown_slots=2, max_tag_id=10)
+
+    assert store.slots(np.array([4, 0, 1])).tolist() == [0, 1, -1]
+    assert store.is_known(store.slots(np.array([4, 0, 1]))).tolist() == [
+        True,
+        True,
+        False,
+    ]
+
+
+def test_update_and_get() -> None:
+    store = TransformStore([0], unknown_slots=2, max_tag_id=10)
+    store.update(np.array([0, 7]), translations(1.0, 2.0))
+
+    tf_0 = store.get(0)
+    tf_7 = store.get(7)
+    assert tf_0 is not None and tf_0.t[0] == 1.0
+    assert tf_7 is not None and tf_7.t[0] == 2.0
+    assert store.get(3) is None
+
+
+def test_unknown_slots_are_bounded() -> None:
+    store = TransformStore([0], unknown_slots=2, max_tag_id=10)
+
+    store.update(np.array([1]), translations(1.0))
+    store.update(np.array([2]), translations(2.0))
+    # evicts tag 1, the least recently updated
+    store.update(np.array([3, 0]), translations(3.0, 0.5))
+
+    assert store.get(1) is None
+    assert store.get(2) is not None
+    assert store.get(3) is not None
+    assert store.get(0) is not None
+    assert len(store.R) == 3
+
+    # more new ids in a single frame than the pool can hold
+    store.update(np.array([4, 5, 6]), translations(4.0, 5.0, 6.0))
+    assert [store.get(i) is not None for i in (4, 5, 6)] == [True, True, False]
+
+
+def test_out_of_range_ids_are_ignored() -> None:
+    store = TransformStore([0], unknown_slots=2, max_tag_id=10)
+    store.update(np.array([11, 1000]), translations(1.0, 2.0))
+
+    assert store.slots(np.array([11, 1000])).tolist() == [-1, -1]
+    assert store.get(1000) is None
@@ -0,0 +1,102 @@
+from pathlib import Path
+
+import cv2
+import numpy as np
+from pupil_apriltags import Detector
+from pytest_mock.plugin import MockerFixture
+
+from src.python.undistort import (
+    UndistortMap,
+    camera_matrix,
+    solve_square_poses,
+    undistort_points,
+)
+
+CAMERA_PARAMS = (
+    784.0756786399139,
+    784.9009527658286,
+    677.124825443364,
+    385.33983488708003,
+)
+DISTORTION = (
+    -0.013826167055651659,
+    -0.11999744016996756,
+    0.2825695466585381,
+    -0.22616481734332383,
+)
+RES = (1280, 720)
+
+
+def test_cache(tmp_path: Path, mocker: MockerFixture) -> None:
+    build = mocker.spy(UndistortMap, "build")
+
+    first = UndistortMap(CAMERA_PARAMS, DISTORTION, RES, str(tmp_path))
+    second = UndistortMap(CAMERA_PARAMS, DISTORTION, RES, str(tmp_path))
+    assert build.call_count == 1
+    np.testing.assert_array_equal(first.map1, second.map1)
+    np.testing.assert_array_equal(first.map2, second.map2)
+
+    # another camera gets its own maps
+    UndistortMap(CAMERA_PARAMS, (0, 0, 0, 0), RES, str(tmp_path))
+    assert build.call_count == 2
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+def test_apply() -> None:
+    undistort = UndistortMap(CAMERA_PARAMS, DISTORTION, RES)
+    frame = np.random.default_rng(0).integers(0, 255, (720, 1280), dtype=np.uint8)
+    frame = cv2.GaussianBlur(frame, (9, 9), 3)
+
+    K = camera_matrix(CAMERA_PARAMS)
+    expected = cv2.fisheye.undistortImage(
+        frame, K, np.array(DISTORTION), Knew=K, new_size=RES
+    )
+
+    result = undistort.apply(frame)
+    assert result.shape == frame.shape
+    # fixed-point maps are accurate to 1/32 pixel
+    assert np.abs(result.astype(int) - expected.astype(int)).mean() < 1.0
+
+
+def test_undistort_points() -> None:
+    K = camera_matrix(CAMERA_PARAMS)
+    expected = np.array([[[500.0, 300.0], [900.0, 200.0], [100.0, 650.0]]])
+
+    # distortPoints works on normalized coordinates
+    normalized = cv2.undistortPoints(expected.reshape(-1, 1, 2), K, None)
+    distorted = cv2.fisheye.distortPoints(normalized, K, np.array(DISTORTION))
+
+    result = undistort_points(distorted.reshape(1, 3, 2), CAMERA_PARAMS, DISTORTION)
+    assert result.shape == (1, 3, 2)
+    np.testing.assert_allclose(result, expected, atol=1e-3)
+    assert undistort_points(np.empty((0, 4, 2)), CAMERA_PARAMS, DISTORTION).shape == (
+        0,
+        4,
+        2,
+    )
+
+
+def test_solve_square_poses() -> None:
+    dictionary = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_APRILTAG_36h11)
+    marker = cv2.aruco.generateImageMarker(dictionary, 0, 200)
+    frame = np.full((720, 1280), 255, dtype=np.uint8)
+    source = np.float32([[0, 0], [200, 0], [200, 200], [0, 200]])
+    target = np.float32([[500, 200], [700, 230], [690, 420], [510, 400]])
+    transform = cv2.getPerspectiveTransform(source, target)
+    frame = cv2.warpPerspective(
+        marker, transform, (1280, 720), dst=frame, borderMode=cv2.BORDER_TRANSPARENT
+    )
+
+    tag_size = 0.174
+    (detection,) = Detector(families="tag36h11").detect(
+        frame, estimate_tag_pose=True, camera_params=CAMERA_PARAMS, tag_size=tag_size
+    )
+    rotations, translations = solve_square_poses(
+        detection.corners[np.newaxis], CAMERA_PARAMS, tag_size
+    )
+
+    assert rotations.shape == (1, 3, 3)
+    assert translations.shape == (1, 3, 1)
+    # both solve the same problem with different methods
+    np.testing.assert_allclose(translations[0], detection.pose_t, atol=0.01)
+    np.testing.assert_allclose(rotations[0], detection.pose_R, atol=0.1)
@@ -0,0 +1,35 @@
+import numpy as np
+
+from src.python.apriltag_processor import TagBatch
+from src.python.visible_publisher import VisibleThrottle
+
+
+def batch(n: int = 2) -> TagBatch:
+    return TagBatch(
+        tag_id=np.arange(n),
+        horizontal_distance=np.full(n, 1.5),
+        vertical_distance=np.full(n, 2.0),
+        angle=np.full(n, 45.0),
+        pos_world=np.tile([1.0, 2.0, 3.0], (n, 1)),
+        has_world=np.arange(n) == 0,
+        pos_rel=np.tile([0.5, -0.25, 1e-7], (n, 1)),
+        heading=np.full(n, 359.99999999999994),
+    )
+
+
+def test_throttle_rate() -> None:
+    throttle = VisibleThrottle()
+    allowed = [
+        throttle.allow(batch(), now, max_rate=10, deltas_only=False)
+        for now in (0.0, 0.05, 0.1, 0.15, 0.25)
+    ]
+    assert allowed == [True, False, True, False, True]
+
+
+def test_throttle_deltas() -> None:
+    throttle = VisibleThrottle()
+    frames = [batch(0), batch(0), batch(1), batch(1), batch(2), batch(0)]
+    allowed = [
+        throttle.allow(frame, 0.0, max_rate=0, deltas_only=True) for frame in frames
+    ]
+    assert allowed == [True, False, True, False, True, True]